@@ -1,18 +1,164 @@
+import asyncio
+import json
+import logging
 import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from fastapi import APIRouter, HTTPException, status, Request, Depends
-from app.models.schemas import ChatRequest, ChatResponse, Timings
+from fastapi.responses import StreamingResponse
+from app.models.schemas import BatchChatRequest, BatchChatResponse, ChatRequest, ChatResponse, Timings
 
 # ⭐️ التغيير الرئيسي: استيراد النسخ المشتركة (Singletons) من مكان تعريفها المركزي
-from app.core.services import search_service_instance, llm_service_instance
+from app.core.services import search_service_instance, llm_service_instance, answer_cache_instance
 from app.services.security_service import get_api_key
 from app.core.limiter import limiter
 from app.core.config import settings
+from app.core.executors import light_executor
+from app.core.metrics import metrics
+from app.core.single_flight import SingleFlight
+from app.core.tracing import span
+from app.services.arabic_text import fold_tokens
 
 router = APIRouter()
+logger = logging.getLogger("mrag_service")
 
 # ⭐️ استخدام الأسماء المشتركة محلياً لسهولة القراءة (كما طلب في الإصلاح)
 search_service = search_service_instance
 llm_service = llm_service_instance
+answer_cache = answer_cache_instance
+# دمج طلبات /chat المتطابقة المتزامنة: البحث والتوليد يتمان مرة واحدة لكل مجموعة
+chat_flights = SingleFlight()
+
+# رسالة الرفض عند ضعف الثقة في السياق المسترجع
+LOW_CONFIDENCE_ANSWER = "I don't have enough information in the knowledge base."
+
+
+# -----------------------------
+# 🧩 مراحل مشتركة بين نقاط الدردشة
+# -----------------------------
+def _lookup_answer_cache_sync(items: List[ChatRequest]) -> List[Tuple[int, Optional[Tuple[str, List[Dict[str, Any]]]]]]:
+    """يُنفذ على الـ thread pool: إصدار كل KB يُقرأ مرة واحدة للدفعة."""
+    versions: Dict[str, int] = {}
+    found = []
+    for item in items:
+        if item.kb_id not in versions:
+            versions[item.kb_id] = search_service.get_kb_version(item.kb_id)
+        kb_version = versions[item.kb_id]
+        found.append((kb_version, answer_cache.get(item.kb_id, kb_version, item.query)))
+    return found
+
+
+async def _lookup_answer_caches(
+    items: List[ChatRequest],
+) -> List[Tuple[int, Optional[Tuple[str, List[Dict[str, Any]]]]]]:
+    """
+    Phase 0: Answer Cache. المفتاح يتضمن إصدار الـ KB، فأي إدخال جديد يُبطل الإجابات السابقة تلقائياً.
+    على الـ thread pool مثل البحث: get_kb_version مع التخزين الدائم يأخذ قفل القراءة للـ KB
+    وقد يقرأ meta.json، فلا يُحجب الـ Event Loop أثناء commit يحمل قفل الكتابة.
+
+    :return: (إصدار الـ KB، (الإجابة، السياق) أو None) لكل طلب بنفس الترتيب
+    """
+    if answer_cache is None:
+        return [(0, None)] * len(items)
+    with span("answer_cache.lookup"):
+        return await light_executor.run(_lookup_answer_cache_sync, items)
+
+
+async def _lookup_answer_cache(chat_req: ChatRequest) -> Tuple[int, Optional[Tuple[str, List[Dict[str, Any]]]]]:
+    """نفس _lookup_answer_caches لطلب واحد."""
+    return (await _lookup_answer_caches([chat_req]))[0]
+
+
+async def _retrieve(chat_req: ChatRequest) -> Tuple[List[Dict[str, Any]], float, Optional[Dict[str, float]]]:
+    """
+    Phase 1: Retrieval (البحث) على الـ thread pool حتى لا يُحجب الـ Event Loop.
+
+    :return: (النتائج، زمن البحث بالملي ثانية، أزمنة المحركات الفرعية إن وُجدت)
+    """
+    t0 = time.perf_counter()
+    try:
+        # استخدام search_service المشترك (مع أزمنة المحركات الفرعية إن وُجدت)
+        # مراحل البحث على الـ thread pool تظهر كـ spans فرعية (السياق يُنسخ للـ thread)
+        with span("retrieval"):
+            results, backend_ms = await light_executor.run(
+                search_service.search_with_timings, chat_req.query, chat_req.kb_id, 3
+            )
+    except Exception as e:
+        metrics.inc("search_errors")
+        # رفع خطأ HTTP بدلاً من الفشل الصامت
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Search Service Failed: {str(e)}")
+    return results, (time.perf_counter() - t0) * 1000, backend_ms or None
+
+
+def _is_low_confidence(results: List[Dict[str, Any]]) -> bool:
+    """Phase 2: Guardrail (الحماية) - التحقق من أن النتيجة الأولى ذات جودة كافية."""
+    return not results or results[0].get("score", 0) <= 0
+
+
+def _is_failed_answer(answer: str) -> bool:
+    """Phase 4: Fallback Check (تحقق من فشل LLM)."""
+    return not answer or "Error" in answer
+
+
+async def _answer_query(
+    chat_req: ChatRequest, kb_version: int
+) -> Tuple[Optional[str], List[Dict[str, Any]], float, Optional[Dict[str, float]], float]:
+    """
+    Phases 1-4 كوحدة واحدة قابلة للمشاركة بين الطلبات المدموجة: البحث، الـ Guardrail،
+    التوليد، والتحقق من فشل الـ LLM (يرفع HTTPException). الإجابة الناجحة تُخزن في الـ Cache.
+
+    :return: (الإجابة أو None عند الرفض، النتائج، زمن البحث، أزمنة المحركات الفرعية، زمن الـ LLM)
+    """
+    # --- Phase 1: Retrieval (البحث) ---
+    results, retrieval_ms, backend_ms = await _retrieve(chat_req)
+
+    # --- Phase 2: Guardrail (الحماية) ---
+    with span("guardrail"):
+        rejected = _is_low_confidence(results)
+    if rejected:
+        return None, results, retrieval_ms, backend_ms, 0.0
+
+    # --- Phase 3: Generation (التوليد LLM) ---
+    t1 = time.perf_counter()
+    # استخدام llm_service المشترك
+    with span("llm"):
+        answer = await llm_service.generate_answer(chat_req.query, results)
+    llm_ms = (time.perf_counter() - t1) * 1000
+
+    # --- Phase 4: Fallback Check (تحقق من فشل LLM) ---
+    if _is_failed_answer(answer):
+        metrics.inc("llm_errors")
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="LLM Service Unavailable")
+
+    if answer_cache is not None:
+        answer_cache.put(chat_req.kb_id, kb_version, chat_req.query, answer, results)
+    return answer, results, retrieval_ms, backend_ms, llm_ms
+
+
+def _observe(timings: Timings) -> Timings:
+    """
+    تسجيل أزمنة الرد في Histograms سجل المقاييس (total_ms دائماً؛ retrieval_ms و llm_ms
+    فقط إن قيست فعلاً، أي ليس لإجابات الـ Cache ولا توليد بدون LLM).
+    """
+    metrics.observe("total_ms", timings.total_ms)
+    if not timings.cached:
+        metrics.observe("retrieval_ms", timings.retrieval_ms)
+        if timings.llm_ms > 0:
+            metrics.observe("llm_ms", timings.llm_ms)
+    return timings
+
+
+def _rejected_response(total_ms: float, retrieval_ms: float, backend_ms: Optional[Dict[str, float]]) -> ChatResponse:
+    """رد الرفض الموحد عند فشل الـ Guardrail."""
+    metrics.inc("rejected_responses")
+    return ChatResponse(
+        answer=LOW_CONFIDENCE_ANSWER,
+        context_used=[],
+        status="rejected",
+        reason="low_confidence",
+        # استخدام Timings مع تقريب ضمني
+        timings=_observe(Timings(total_ms=total_ms, retrieval_ms=retrieval_ms, llm_ms=0.0, backend_ms=backend_ms))
+    )
+
 
 @router.post("/chat", response_model=ChatResponse)
 @limiter.limit("100/minute") # الحد: 5 طلبات في الدقيقة لكل مفتاح
@@ -25,65 +171,60 @@ async def chat_with_kb(
     يعالج طلبات الدردشة RAG (استرجاع-توليد معزز)، ويقوم بالبحث، والتوليد،
     وتطبيق الـ Guardrails، وتسجيل المقاييس، وقياس الأداء.
     """
-    
+
     # 1. زيادة عداد الطلبات
-    settings.METRICS["total_requests"] += 1
-    
+    metrics.inc("total_requests")
+
     start_total = time.perf_counter()
-    retrieval_ms = 0.0
-    llm_ms = 0.0
-    
+
     try:
-        # --- Phase 1: Retrieval (البحث) ---
-        t0 = time.perf_counter()
-        try:
-            # استخدام search_service المشترك
-            results = search_service.search(chat_req.query, chat_req.kb_id, top_k=3)
-        except Exception as e:
-            settings.METRICS["search_errors"] += 1
-            # رفع خطأ HTTP بدلاً من الفشل الصامت
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Search Service Failed: {str(e)}")
-        retrieval_ms = (time.perf_counter() - t0) * 1000
-
-        # --- Phase 2: Guardrail (الحماية) ---
-        # التحقق من أن النتيجة الأولى ذات جودة كافية
-        if not results or results[0].get("score", 0) <= 0:
-            settings.METRICS["rejected_responses"] += 1
+        # --- Phase 0: Answer Cache ---
+        kb_version, cached = await _lookup_answer_cache(chat_req)
+        if cached is not None:
+            answer, context = cached
+            metrics.inc("successful_responses")
             total_ms = (time.perf_counter() - start_total) * 1000
             return ChatResponse(
-                answer="I don't have enough information in the knowledge base.",
-                context_used=[],
-                status="rejected",
-                reason="low_confidence",
-                # استخدام Timings مع تقريب ضمني
-                timings=Timings(total_ms=total_ms, retrieval_ms=retrieval_ms, llm_ms=0.0)
+                answer=answer,
+                context_used=context,
+                status="success",
+                timings=_observe(Timings(total_ms=round(total_ms, 2), retrieval_ms=0.0, llm_ms=0.0, cached=True))
             )
-        
-        # --- Phase 3: Generation (التوليد LLM) ---
-        t1 = time.perf_counter()
-        # استخدام llm_service المشترك
-        answer = await llm_service.generate_answer(chat_req.query, results)
-        llm_ms = (time.perf_counter() - t1) * 1000
-        
-        # --- Phase 4: Fallback Check (تحقق من فشل LLM) ---
-        if not answer or "Error" in answer:
-             settings.METRICS["llm_errors"] += 1
-             raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="LLM Service Unavailable")
+
+        # --- Phases 1-4: Retrieval → Guardrail → Generation → Fallback Check ---
+        # الطلبات المتطابقة المتزامنة (نفس الـ KB وإصدارها والاستعلام المُطبّع) تنتظر نفس العملية
+        if settings.CHAT_COALESCING_ENABLED:
+            key = (chat_req.kb_id, kb_version, " ".join(fold_tokens(chat_req.query)))
+            (answer, results, retrieval_ms, backend_ms, llm_ms), coalesced = await chat_flights.do(
+                key, lambda: _answer_query(chat_req, kb_version)
+            )
+            if coalesced:
+                metrics.inc("coalesced_requests")
+        else:
+            answer, results, retrieval_ms, backend_ms, llm_ms = await _answer_query(chat_req, kb_version)
+            coalesced = False
+
+        if answer is None:
+            total_ms = (time.perf_counter() - start_total) * 1000
+            return _rejected_response(total_ms, retrieval_ms, backend_ms)
 
         # --- Phase 5: Success Response ---
-        settings.METRICS["successful_responses"] += 1
+        metrics.inc("successful_responses")
         total_ms = (time.perf_counter() - start_total) * 1000
 
-        return ChatResponse(
-            answer=answer,
-            context_used=results,
-            status="success",
-            timings=Timings(
-                total_ms=round(total_ms, 2),
-                retrieval_ms=round(retrieval_ms, 2),
-                llm_ms=round(llm_ms, 2)
+        with span("response.build"):
+            return ChatResponse(
+                answer=answer,
+                context_used=results,
+                status="success",
+                timings=_observe(Timings(
+                    total_ms=round(total_ms, 2),
+                    retrieval_ms=round(retrieval_ms, 2),
+                    llm_ms=round(llm_ms, 2),
+                    backend_ms=backend_ms,
+                    coalesced=coalesced
+                ))
             )
-        )
 
     except HTTPException as he:
         # إعادة رفع استثناءات HTTP المرفوعة عمداً
@@ -91,8 +232,280 @@ async def chat_with_kb(
     except Exception as e:
         # معالجة أي خطأ عام غير متوقع
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal Error: {str(e)}"
         )
-    
-    
\ No newline at end of file
+
+
+# -----------------------------
+# 📦 الدردشة الدفعية (Batch)
+# -----------------------------
+async def _retrieve_group(kb_id: str, queries: List[str]) -> Tuple[Optional[List[List[Dict[str, Any]]]], float]:
+    """
+    بحث كل استعلامات KB واحدة بتمريرة واحدة (search_batch) على الـ thread pool.
+
+    :return: (نتائج لكل استعلام أو None عند فشل البحث، زمن البحث بالملي ثانية)
+    """
+    t0 = time.perf_counter()
+    try:
+        with span("retrieval.batch"):
+            results = await light_executor.run(search_service.search_batch, queries, kb_id, 3)
+    except Exception as e:
+        metrics.inc("search_errors")
+        logger.error(f"❌ Batch search failed for KB {kb_id}: {e}", exc_info=True)
+        results = None
+    return results, (time.perf_counter() - t0) * 1000
+
+
+@router.post("/chat/batch", response_model=BatchChatResponse)
+@limiter.limit("100/minute")
+async def chat_with_kb_batch(
+    request: Request,
+    batch_req: BatchChatRequest,
+    api_key: str = Depends(get_api_key) # فرض الأمان
+):
+    """
+    يعالج عدة طلبات دردشة في طلب HTTP واحد بنفس مراحل /chat:
+
+    - Cache الإجابات لكل عنصر
+    - تجميع العناصر حسب kb_id وبحث كل مجموعة بتمريرة واحدة (المجموعات بالتوازي)
+    - نفس الـ Guardrail لكل عنصر
+    - توليد الإجابات بالتوازي بحد أقصى BATCH_LLM_CONCURRENCY استدعاء متزامن،
+      والأسئلة المكررة (نفس KB ونفس الاستعلام) تُولّد مرة واحدة
+
+    النتائج بنفس ترتيب الطلبات، ولكل عنصر status و Timings خاصة به
+    (retrieval_ms = نصيب العنصر من زمن بحث مجموعته).
+    فشل عنصر لا يُفشل الدفعة: يعود بـ status="error" و reason يوضح السبب.
+    """
+    items = batch_req.requests
+    if len(items) > settings.BATCH_CHAT_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many requests in batch. Max is {settings.BATCH_CHAT_MAX_ITEMS}.")
+
+    metrics.inc("total_requests", len(items))
+    start_total = time.perf_counter()
+
+    def elapsed_ms() -> float:
+        return round((time.perf_counter() - start_total) * 1000, 2)
+
+    responses: List[Optional[ChatResponse]] = [None] * len(items)
+    kb_versions = [0] * len(items)
+
+    # --- Phase 0: Answer Cache ---
+    groups: Dict[str, List[int]] = {}
+    lookups = await _lookup_answer_caches(items)
+    for i, item in enumerate(items):
+        kb_versions[i], cached = lookups[i]
+        if cached is not None:
+            metrics.inc("successful_responses")
+            responses[i] = ChatResponse(
+                answer=cached[0],
+                context_used=cached[1],
+                status="success",
+                timings=Timings(total_ms=elapsed_ms(), retrieval_ms=0.0, llm_ms=0.0, cached=True)
+            )
+        else:
+            groups.setdefault(item.kb_id, []).append(i)
+
+    # --- Phase 1: Retrieval (بحث واحد لكل KB، والمجموعات بالتوازي) ---
+    retrieved = await asyncio.gather(*(
+        _retrieve_group(kb_id, [items[i].query for i in indices]) for kb_id, indices in groups.items()
+    ))
+
+    # --- Phase 2: Guardrail (الحماية) ---
+    to_generate: List[Tuple[int, List[Dict[str, Any]], float]] = []
+    for indices, (group_results, group_ms) in zip(groups.values(), retrieved):
+        retrieval_ms = round(group_ms / len(indices), 2)
+        for position, i in enumerate(indices):
+            if group_results is None:
+                responses[i] = ChatResponse(
+                    answer="",
+                    context_used=[],
+                    status="error",
+                    reason="search_failed",
+                    timings=Timings(total_ms=elapsed_ms(), retrieval_ms=retrieval_ms, llm_ms=0.0)
+                )
+            elif _is_low_confidence(group_results[position]):
+                responses[i] = _rejected_response(elapsed_ms(), retrieval_ms, None)
+            else:
+                to_generate.append((i, group_results[position], retrieval_ms))
+
+    # --- Phase 3: Generation (التوليد LLM بتوازٍ محدود) ---
+    semaphore = asyncio.Semaphore(settings.BATCH_LLM_CONCURRENCY)
+
+    async def generate(query: str, results: List[Dict[str, Any]]) -> Tuple[str, float]:
+        async with semaphore:
+            t1 = time.perf_counter()
+            try:
+                with span("llm"):
+                    answer = await llm_service.generate_answer(query, results)
+            except Exception as e:
+                logger.error(f"❌ Batch LLM call failed: {e}", exc_info=True)
+                answer = ""
+            return answer, (time.perf_counter() - t1) * 1000
+
+    generations: Dict[Tuple[str, str], asyncio.Task] = {}
+    for i, results, _ in to_generate:
+        key = (items[i].kb_id, items[i].query)
+        if key not in generations:
+            generations[key] = asyncio.ensure_future(generate(items[i].query, results))
+    if generations:
+        await asyncio.gather(*generations.values())
+
+    for i, results, retrieval_ms in to_generate:
+        answer, llm_ms = generations[(items[i].kb_id, items[i].query)].result()
+
+        # --- Phase 4: Fallback Check (تحقق من فشل LLM) ---
+        if _is_failed_answer(answer):
+            metrics.inc("llm_errors")
+            responses[i] = ChatResponse(
+                answer="",
+                context_used=results,
+                status="error",
+                reason="llm_unavailable",
+                timings=Timings(total_ms=elapsed_ms(), retrieval_ms=retrieval_ms, llm_ms=round(llm_ms, 2))
+            )
+            continue
+
+        # --- Phase 5: Success ---
+        metrics.inc("successful_responses")
+        if answer_cache is not None:
+            answer_cache.put(items[i].kb_id, kb_versions[i], items[i].query, answer, results)
+        responses[i] = ChatResponse(
+            answer=answer,
+            context_used=results,
+            status="success",
+            timings=Timings(total_ms=elapsed_ms(), retrieval_ms=retrieval_ms, llm_ms=round(llm_ms, 2))
+        )
+
+    for response in responses:
+        if response.status != "rejected":  # الرفض سُجّل في _rejected_response
+            _observe(response.timings)
+    return BatchChatResponse(results=responses)
+
+
+# -----------------------------
+# 📡 الدردشة المتدفقة (Server-Sent Events)
+# -----------------------------
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """تنسيق حدث SSE واحد (JSON بدون escape للحروف العربية)."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _chat_events(
+    chat_req: ChatRequest,
+    start_total: float,
+    kb_version: int,
+    results: List[Dict[str, Any]],
+    retrieval_ms: float,
+    backend_ms: Optional[Dict[str, float]],
+) -> AsyncIterator[str]:
+    """
+    تسلسل الأحداث: context ← token (متكرر) ← done، أو error عند فشل الـ LLM.
+    """
+    # --- Phase 2: Guardrail (الحماية) ---
+    with span("guardrail"):
+        rejected = _is_low_confidence(results)
+    if rejected:
+        metrics.inc("rejected_responses")
+        yield _sse("context", {"context_used": []})
+        total_ms = (time.perf_counter() - start_total) * 1000
+        timings = _observe(Timings(total_ms=round(total_ms, 2), retrieval_ms=round(retrieval_ms, 2), llm_ms=0.0, backend_ms=backend_ms))
+        yield _sse("done", {
+            "status": "rejected",
+            "reason": "low_confidence",
+            "answer": LOW_CONFIDENCE_ANSWER,
+            "timings": timings.model_dump(),
+        })
+        return
+
+    yield _sse("context", {"context_used": results})
+
+    # --- Phase 3: Generation (التوليد LLM) ---
+    t1 = time.perf_counter()
+    first_token_ms = None
+    parts: List[str] = []
+    try:
+        # span لكل التوليد المتدفق (يشمل زمن إرسال الأجزاء للعميل)
+        with span("llm.stream"):
+            async for token in llm_service.stream_answer(chat_req.query, results):
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start_total) * 1000
+                parts.append(token)
+                yield _sse("token", {"text": token})
+    except Exception as e:
+        logger.error(f"❌ LLM stream failed: {e}", exc_info=True)
+        parts = []
+    llm_ms = (time.perf_counter() - t1) * 1000
+
+    # --- Phase 4: Fallback Check (تحقق من فشل LLM) ---
+    # الرد بدأ بالفعل (200)، لذا يُبلّغ الفشل كحدث error بدلاً من 503
+    answer = "".join(parts)
+    if _is_failed_answer(answer):
+        metrics.inc("llm_errors")
+        yield _sse("error", {"detail": "LLM Service Unavailable"})
+        return
+
+    # --- Phase 5: Success ---
+    metrics.inc("successful_responses")
+    if answer_cache is not None:
+        answer_cache.put(chat_req.kb_id, kb_version, chat_req.query, answer, results)
+    total_ms = (time.perf_counter() - start_total) * 1000
+    timings = _observe(Timings(
+        total_ms=round(total_ms, 2),
+        retrieval_ms=round(retrieval_ms, 2),
+        llm_ms=round(llm_ms, 2),
+        backend_ms=backend_ms,
+        first_token_ms=round(first_token_ms, 2) if first_token_ms is not None else None
+    ))
+    yield _sse("done", {"status": "success", "timings": timings.model_dump()})
+
+
+async def _cached_events(answer: str, context: List[Dict[str, Any]], start_total: float) -> AsyncIterator[str]:
+    """إجابة من الـ Cache: نفس تسلسل الأحداث، والإجابة كاملة في token واحد."""
+    metrics.inc("successful_responses")
+    yield _sse("context", {"context_used": context})
+    first_token_ms = round((time.perf_counter() - start_total) * 1000, 2)
+    yield _sse("token", {"text": answer})
+    timings = _observe(Timings(
+        total_ms=round((time.perf_counter() - start_total) * 1000, 2),
+        retrieval_ms=0.0,
+        llm_ms=0.0,
+        cached=True,
+        first_token_ms=first_token_ms
+    ))
+    yield _sse("done", {"status": "success", "timings": timings.model_dump()})
+
+
+@router.post("/chat/stream")
+@limiter.limit("100/minute")
+async def chat_with_kb_stream(
+    request: Request,
+    chat_req: ChatRequest,
+    api_key: str = Depends(get_api_key) # فرض الأمان
+):
+    """
+    نفس /chat لكن الرد يُبث كـ Server-Sent Events (text/event-stream):
+
+    - event: context  → {"context_used": [...]} فور انتهاء البحث
+    - event: token    → {"text": "..."} لكل جزء من الإجابة فور توليده
+    - event: done     → {"status": ..., "timings": {...}} (مع reason/answer عند الرفض)
+    - event: error    → {"detail": "..."} إن فشل الـ LLM بعد بدء البث
+
+    البحث يتم قبل بدء الرد، فأخطاؤه تعود كـ HTTP 500 كما في /chat.
+    """
+    metrics.inc("total_requests")
+    start_total = time.perf_counter()
+
+    kb_version, cached = await _lookup_answer_cache(chat_req)
+    if cached is not None:
+        events = _cached_events(cached[0], cached[1], start_total)
+    else:
+        results, retrieval_ms, backend_ms = await _retrieve(chat_req)
+        events = _chat_events(chat_req, start_total, kb_version, results, retrieval_ms, backend_ms)
+
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # منع التخزين المؤقت والتجميع في الـ Proxies حتى تصل الأحداث فوراً
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
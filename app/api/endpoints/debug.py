@@ -0,0 +1,97 @@
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from app.core.config import settings
+from app.core.profiler import ProfileBusyError, profile_store, render_pstats
+from app.core.tracing import slowest_traces
+from app.services.security_service import get_admin_api_key, get_api_key
+
+router = APIRouter()
+
+
+@router.get("/traces")
+def get_slowest_traces(
+    limit: int = Query(10, ge=1, le=100),
+    name: Optional[str] = None,
+    api_key: str = Depends(get_api_key) # فرض الأمان
+):
+    """
+    أبطأ التتبعات الأخيرة مع زمن كل مرحلة (stages_ms) وتفاصيل الـ spans،
+    لمعرفة أين يذهب زمن الـ p95 فعلاً.
+
+    :param limit: عدد التتبعات
+    :param name: تصفية حسب بداية اسم التتبع (مثلاً "POST /api/v1/assistant/chat")
+    """
+    return {"traces": slowest_traces(limit, name)}
+
+
+# -----------------------------
+# 🔬 الـ Profiling (للمشرفين فقط)
+# -----------------------------
+def _require_profiling(api_key: str = Depends(get_admin_api_key)) -> str:
+    # عند التعطيل تبدو النقاط غير موجودة أصلاً
+    if not settings.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return api_key
+
+
+def _get_profile(profile_id: str):
+    record = profile_store.get(profile_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return record
+
+
+@router.post("/profiles", status_code=status.HTTP_202_ACCEPTED)
+def start_sampling_profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+    api_key: str = Depends(_require_profiling)
+):
+    """
+    يبدأ Sampling Profiler لمدة seconds من الحركة الفعلية (كل الـ threads).
+    النتيجة (collapsed stacks) تُنزّل عبر /profiles/{id}/download بعد اكتمالها.
+    """
+    if seconds > settings.PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be <= {settings.PROFILE_MAX_SECONDS}.")
+    try:
+        record = profile_store.start_sampling(seconds, interval_ms)
+    except ProfileBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return record.snapshot()
+
+
+@router.get("/profiles")
+def list_profiles(api_key: str = Depends(_require_profiling)):
+    """آخر نتائج الـ Profiling (الأحدث أولاً)."""
+    return {"profiles": profile_store.list()}
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(profile_id: str, api_key: str = Depends(_require_profiling)):
+    return _get_profile(profile_id).snapshot()
+
+
+@router.get("/profiles/{profile_id}/download")
+def download_profile(
+    profile_id: str,
+    format: str = Query("raw", pattern="^(raw|text)$"),
+    api_key: str = Depends(_require_profiling)
+):
+    """
+    تنزيل النتيجة: raw = الملف كما هو (pstats لـ snakeviz/pstats، أو collapsed stacks
+    لـ flamegraph.pl/speedscope)، text = ملخص pstats مقروء (لنتائج الطلبات فقط).
+    """
+    record = _get_profile(profile_id)
+    if record.status != "completed" or not os.path.exists(record.path):
+        raise HTTPException(status_code=409, detail=f"Profile is {record.status}.")
+    if format == "text" and record.kind == "request":
+        return PlainTextResponse(render_pstats(record.path))
+    return FileResponse(
+        record.path,
+        media_type="application/octet-stream" if record.kind == "request" else "text/plain",
+        filename=os.path.basename(record.path),
+    )
@@ -1,23 +1,35 @@
+import os
+from typing import List
+
 from fastapi import APIRouter, UploadFile, File, HTTPException, status
 # ⭐️ التغيير الرئيسي: استيراد النسخة المشتركة من SearchService
 # تم إزالة الاستيراد المباشر لـ MockSearchService
 from app.core.services import search_service_instance as search_service
-from app.services.ingestion_service import IngestionService
+from app.core.services import ingestion_service_instance as ingestion_service
+from app.core.services import ingestion_jobs_instance as ingestion_jobs
+from app.core.config import settings
+from app.models.schemas import IngestionJobAccepted, IngestionJobStatus
+from app.services.ingestion_service import FileTooLargeError, is_archive
 
-# تعريف المتغيرات العامة والثوابت (يفضل أن تكون في ملف config.py)
-MAX_FILE_SIZE = 10 * 1024 * 1024 # 10 MB
+# تعريف المتغيرات العامة والثوابت
+# الرفع يُعالج كتدفق (stream) بذاكرة ثابتة، لذا الحد قابل للضبط من الإعدادات
+MAX_FILE_SIZE = settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024
 
 # تعريف الـ Router
 router = APIRouter()
-ingestion_service = IngestionService()
 
 # ⚠️ تم إزالة الـ Mock Store المؤقت (knowledge_base_store) من الـ Router،
 # الآن يتم الاعتماد على search_service فقط للتخزين والفهرسة.
 
-@router.post("/{kb_id}/upload", status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/{kb_id}/upload",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=IngestionJobAccepted,
+)
 async def upload_document(kb_id: str, file: UploadFile = File(...)):
     """
-    يقوم برفع ومعالجة مستند نصي وفهرسته في قاعدة المعرفة المحددة.
+    يستقبل مستنداً نصياً ويضيف مهمة لمعالجته وفهرسته في الخلفية.
+    يعود فوراً بـ 202 ومعرف المهمة؛ التقدم متاح عبر GET /kb/jobs/{job_id}.
     """
     
     # 1. Validation (File Type)
@@ -30,26 +42,98 @@ async def upload_document(kb_id: str, file: UploadFile = File(...)):
     if file.size and file.size > MAX_FILE_SIZE:
          raise HTTPException(status_code=413, detail=f"File too large. Max size is {MAX_FILE_SIZE / (1024*1024):.0f}MB.")
     
-    # 3. Processing and Indexing
+    # 3. Spooling (حفظ الملف خارج دورة حياة الطلب)
+    # الملف المرفوع يُغلق بانتهاء الطلب، لذا يُنسخ على دفعات إلى ملف مؤقت خاص بالمهمة
     try:
-        chunks = await ingestion_service.process_file(file)
-        
-        # استخدام الخدمة المشتركة لفهرسة المستندات
-        search_service.add_documents(kb_id, chunks)
-        
-        # 4. Success Response
-        return {
-            "status": "success",
-            "chunks_processed": len(chunks),
-            "message": "Document processed and indexed."
-        }
+        path, size = await ingestion_service.spool_upload(
+            file, max_bytes=MAX_FILE_SIZE, directory=settings.INGESTION_SPOOL_DIR or None
+        )
+    except FileTooLargeError:
+        # الحجم لم يكن معروفاً مسبقاً (file.size غير متوفر) وتجاوز الحد أثناء القراءة
+        raise HTTPException(status_code=413, detail=f"File too large. Max size is {MAX_FILE_SIZE / (1024*1024):.0f}MB.")
     except Exception as e:
-        # معالجة الأخطاء
-        # يمكن تحسين هذه المعالجة لتحديد نوع الخطأ بشكل أدق (مثل أخطاء التخزين)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-            detail=f"An internal error occurred during processing: {str(e)}"
+            detail=f"An internal error occurred while receiving the file: {str(e)}"
+        )
+
+    # 4. Enqueue (التنظيف والفهرسة يتمان في عمّال الخلفية)
+    job = ingestion_jobs.submit(kb_id, path, file.filename, size)
+    return IngestionJobAccepted(
+        job_id=job.job_id,
+        status_url=f"/api/v1/kb/jobs/{job.job_id}",
+        message="Document accepted and queued for processing."
+    )
+
+
+@router.post(
+    "/{kb_id}/upload/bulk",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=IngestionJobAccepted,
+)
+async def upload_documents_bulk(kb_id: str, files: List[UploadFile] = File(...)):
+    """
+    يستقبل عدة مستندات نصية و/أو أرشيفات (.zip, .tar, .tar.gz, .tgz) في طلب واحد
+    ويضيف مهمة إدخال جماعي واحدة: التقسيم بالتوازي ثم فهرسة كل الـ chunks دفعة واحدة.
+    نتيجة كل ملف والإنتاجية (MB/s و chunks/s) متاحة عبر GET /kb/jobs/{job_id}.
+    """
+
+    # 1. Validation (عدد الملفات ونوعها)
+    if len(files) > settings.BULK_UPLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=400, detail=f"Too many files. Max is {settings.BULK_UPLOAD_MAX_FILES} per request."
+        )
+    for file in files:
+        if file.content_type != "text/plain" and not is_archive(file.filename):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported file '{file.filename}'. Only .txt files and .zip/.tar archives are supported.",
+            )
+
+    # 2. Spooling (نفس حد الحجم لكل ملف؛ عند أي خطأ تُحذف الملفات المحفوظة)
+    sources = []
+    try:
+        for file in files:
+            path, size = await ingestion_service.spool_upload(
+                file, max_bytes=MAX_FILE_SIZE, directory=settings.INGESTION_SPOOL_DIR or None
+            )
+            sources.append((path, file.filename, size))
+    except FileTooLargeError:
+        _remove_spooled(sources)
+        raise HTTPException(status_code=413, detail=f"File too large. Max size is {MAX_FILE_SIZE / (1024*1024):.0f}MB.")
+    except Exception as e:
+        _remove_spooled(sources)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An internal error occurred while receiving the files: {str(e)}"
         )
+
+    # 3. Enqueue
+    job = ingestion_jobs.submit_bulk(kb_id, sources)
+    return IngestionJobAccepted(
+        job_id=job.job_id,
+        status_url=f"/api/v1/kb/jobs/{job.job_id}",
+        message=f"{len(sources)} file(s) accepted and queued for bulk processing."
+    )
+
+
+def _remove_spooled(sources) -> None:
+    for path, _, _ in sources:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobStatus)
+def get_ingestion_job(job_id: str):
+    """
+    يعرض حالة مهمة إدخال: البايتات المقروءة، عدد الـ chunks المفهرسة، والمدة.
+    """
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.snapshot()
     
 
 @router.get("/{kb_id}/search")
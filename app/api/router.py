@@ -1,8 +1,10 @@
 from fastapi import APIRouter
-from app.api.endpoints import knowledge_base, assistant
+from app.api.endpoints import knowledge_base, assistant, debug
 
 api_router = APIRouter()
 
 api_router.include_router(knowledge_base.router, prefix="/kb", tags=["Knowledge Base"])
 
-api_router.include_router(assistant.router, prefix="/assistant", tags=["Assistant"])
\ No newline at end of file
+api_router.include_router(assistant.router, prefix="/assistant", tags=["Assistant"])
+
+api_router.include_router(debug.router, prefix="/debug", tags=["Debug"])
@@ -1,6 +1,5 @@
 import os
 import logging
-from typing import Dict
 from pydantic_settings import BaseSettings
 # مكتبات Azure للأمان
 from azure.identity import DefaultAzureCredential
@@ -19,19 +18,97 @@ class Settings(BaseSettings):
     # في الإنتاج: تأتي من Key Vault (باستثناء KEY_VAULT_NAME الذي يُحقن كمتغير بيئة)
     GEMINI_API_KEY: str = "" 
     KEY_VAULT_NAME: str = "" 
+
+    # محرك البحث المستخدم: "index" (فهرس معكوس)، "matrix" (NumPy CSR)،
+    # "vector" (بحث دلالي)، "hybrid" (كلمات مفتاحية + دلالي) أو "mock" (مسح خطي)
+    SEARCH_BACKEND: str = "index"
+
+    # مجلد التخزين الدائم للفهارس (محرك "index")؛ فارغ = الذاكرة فقط
+    INDEX_STORAGE_DIR: str = ""
+
+    # الحد الأقصى لحجم الملف المرفوع (MB)؛ الرفع يُعالج كتدفق بذاكرة ثابتة
+    MAX_UPLOAD_SIZE_MB: int = 200
+
+    # طبقة التنفيذ (app/core/executors.py): threads للبحث والفهرسة،
+    # وعمليات منفصلة لتنظيف وتقسيم النص (0 = بدون عمليات، thread واحد بدلاً منها)
+    EXECUTOR_THREAD_WORKERS: int = 8
+    EXECUTOR_PROCESS_WORKERS: int = 2
+
+    # مهام الإدخال في الخلفية: عدد العمّال ومجلد الملفات المؤقتة (فارغ = مجلد النظام)
+    INGESTION_WORKERS: int = 2
+    INGESTION_SPOOL_DIR: str = ""
+
+    # الإدخال الجماعي (/kb/{kb_id}/upload/bulk): أقصى عدد ملفات في الطلب الواحد
+    BULK_UPLOAD_MAX_FILES: int = 100
+
+    # إعدادات البحث الدلالي (SEARCH_BACKEND="vector")
+    # EMBEDDING_MODEL فارغ = HashingEmbedder الحتمي بدون نموذج
+    EMBEDDING_MODEL: str = ""
+    VECTOR_SEARCH_MODE: str = "exact"  # "exact" أو "ivf"
+    VECTOR_NPROBE: int = 4
+
+    # طريقة دمج النتائج في البحث الهجين: "rrf" أو "weighted"
+    HYBRID_FUSION: str = "rrf"
+
+    # خدمة الـ LLM: "mock" (إجابات محاكاة) أو "gemini" (HTTPLLMService عبر REST API)
+    # عميل HTTP واحد مشترك (Connection Pool)، مع مهلة لكل طلب، حد للتوليدات المتزامنة،
+    # وإعادة محاولة بـ Backoff عشوائي للأخطاء المؤقتة
+    LLM_BACKEND: str = "mock"
+    LLM_BASE_URL: str = "https://generativelanguage.googleapis.com/v1beta"
+    LLM_MODEL: str = "gemini-1.5-flash"
+    LLM_TIMEOUT_SECONDS: float = 30.0
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_MAX_RETRIES: int = 3
+    LLM_BACKOFF_SECONDS: float = 0.5
+    LLM_BACKOFF_MAX_SECONDS: float = 8.0
+
+    # Cache الإجابات أمام الـ LLM (app/services/answer_cache.py)
+    # NEAR_DUPLICATE: المطابقة على مجموعة الكلمات بدلاً من النص المُطبّع كاملاً
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 1024
+    ANSWER_CACHE_TTL_SECONDS: float = 300.0
+    ANSWER_CACHE_NEAR_DUPLICATE: bool = False
+
+    # Cache نتائج الاسترجاع حول محرك البحث (app/services/cached_search_service.py)
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_MAX_ENTRIES: int = 4096
+
+    # دمج طلبات /chat المتطابقة المتزامنة (Single-Flight): بحث وتوليد واحد لكل مجموعة
+    CHAT_COALESCING_ENABLED: bool = True
+
+    # الدردشة الدفعية (/assistant/chat/batch): أقصى عدد أسئلة، وأقصى استدعاءات LLM متزامنة
+    BATCH_CHAT_MAX_ITEMS: int = 64
+    BATCH_LLM_CONCURRENCY: int = 4
     
-    # عدادات المراقبة الحية (In-Memory Metrics)
-    # يتم تحديثها من قبل الخدمات وعرضها في /health
-    METRICS: Dict[str, int] = {
-        "total_requests": 0,
-        "search_errors": 0,
-        "llm_errors": 0,
-        "successful_responses": 0,
-        "rejected_responses": 0,
-        "total_input_tokens": 0,  
-        "total_output_tokens": 0,
-        "estimated_cost_usd": 0 # (يمكنك إضافة منطق حساب لاحقاً: Tokens * Price)
-    }
+    # المقاييس (app/core/metrics.py): مجلد مشترك لتجميع العدادات والـ Histograms بين
+    # عمّال uvicorn (ملف mmap لكل thread كاتب)؛ فارغ = داخل العملية فقط.
+    # يجب تفريغ المجلد عند بدء النشر (العدادات تراكمية وتُجمع من كل الملفات)
+    METRICS_MULTIPROC_DIR: str = ""
+
+    # التتبع (app/core/tracing.py): spans لكل مرحلة مربوطة بـ X-Request-ID،
+    # وآخر TRACE_BUFFER_SIZE تتبع في Ring Buffer (أبطؤها عبر /api/v1/debug/traces)
+    TRACING_ENABLED: bool = True
+    TRACE_BUFFER_SIZE: int = 1000
+    TRACE_MAX_SPANS: int = 512
+
+    # الـ Profiling عند الطلب (app/core/profiler.py) لمفاتيح المشرفين فقط: ترويسة X-Profile: 1
+    # (cProfile للطلب) أو POST /api/v1/debug/profiles (Sampling لعدة ثوانٍ). معطل = بدون أي كلفة
+    PROFILING_ENABLED: bool = False
+    PROFILE_DIR: str = ""  # فارغ = مجلد مؤقت للنظام
+    PROFILE_MAX_STORED: int = 20
+    PROFILE_MAX_SECONDS: int = 60
+
+    # ميزانية ذاكرة الـ KBs لمحرك index بدون INDEX_STORAGE_DIR (بالميغابايت، 0 = بدون حد):
+    # عند تجاوزها تُكتب الـ KBs الأقدم استعلاماً إلى KB_SPILL_DIR (فارغ = مجلد مؤقت) وتُحمّل عند الطلب
+    KB_MEMORY_BUDGET_MB: int = 0
+    KB_SPILL_DIR: str = ""
+
+    # تحديد المعدل (app/core/limiter.py): memory:// داخل كل عامل فقط (N عمّال = N ضعف الحد)،
+    # sqlite:///path/limits.db مشترك بين عمّال الخادم ويبقى بعد إعادة التشغيل، redis://host:6379 لعدة خوادم
+    RATE_LIMIT_STORAGE_URI: str = "memory://"
+    RATE_LIMIT_STRATEGY: str = "sliding-window-counter"  # أو fixed-window / moving-window
 
     def load_secrets_from_keyvault(self):
         """
@@ -0,0 +1,195 @@
+# app/core/executors.py
+"""
+طبقة التنفيذ خارج الـ Event Loop.
+
+- light: ThreadPoolExecutor للعمل الخفيف أو المرتبط بحالة داخل العملية
+  (البحث، الفهرسة في الذاكرة). يحرر الـ Event Loop لكنه يبقى تحت الـ GIL.
+- heavy: ProcessPoolExecutor للعمل الحسابي الثقيل والمستقل (تنظيف PII وتقسيم النص)،
+  فيعمل بالتوازي فعلياً على أنوية أخرى. الدوال المرسلة يجب أن تكون قابلة للـ pickle
+  (دوال على مستوى الـ module).
+
+كل منفذ يسجل: عدد المهام قيد التنفيذ، عمق الطابور (المهام المنتظرة لعامل)،
+وزمن الانتظار قبل بدء التنفيذ. تُعرض هذه الإحصائيات في /health.
+"""
+
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, Optional, Tuple
+
+from app.core.config import settings
+
+
+def _timed_call(fn: Callable, submitted_at: float, *args) -> Tuple[float, Any]:
+    """
+    يُنفذ داخل العامل (thread أو process): يقيس زمن الانتظار منذ الإرسال ثم ينفذ الدالة.
+    نستخدم time.time() لأنه مشترك بين العمليات، بخلاف perf_counter.
+    """
+    waited = time.time() - submitted_at
+    return waited, fn(*args)
+
+
+class InstrumentedExecutor:
+    """
+    غلاف حول Executor يرسل المهام (من الكود الـ async أو من threads) ويجمع إحصائيات الطابور.
+    يُنشأ الـ Executor الفعلي عند أول استخدام (lazy).
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Executor], max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._factory = factory
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = self._factory()
+        return self._executor
+
+    def _prepare(self, fn: Callable, args: tuple) -> Callable[[], Tuple[float, Any]]:
+        call = functools.partial(_timed_call, fn, time.time(), *args)
+        if isinstance(self._get_executor(), ThreadPoolExecutor):
+            # نقل الـ contextvars (مثل سياق التتبع) إلى الـ thread كما يفعل asyncio.to_thread
+            call = functools.partial(contextvars.copy_context().run, call)
+        with self._lock:
+            self.in_flight += 1
+        return call
+
+    def _finish(self, waited: Optional[float]) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            if waited is None:
+                self.failed += 1
+                return
+            self.completed += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """
+        ينفذ fn(*args) على المنفذ وينتظر النتيجة دون حجب الـ Event Loop.
+
+        :param fn: الدالة المراد تنفيذها
+        :param args: معاملات الدالة
+        :return: نتيجة الدالة (أو يُعاد رفع الاستثناء)
+        """
+        call = self._prepare(fn, args)
+        try:
+            waited, result = await asyncio.get_running_loop().run_in_executor(self._get_executor(), call)
+        except BaseException:
+            self._finish(None)
+            raise
+        self._finish(waited)
+        return result
+
+    def call(self, fn: Callable, *args) -> Any:
+        """
+        النسخة المتزامنة من run: لاستخدامها من threads خارج الـ Event Loop
+        (مثل عمّال مهام الإدخال). تحجب الـ thread المستدعي حتى تنتهي المهمة.
+        """
+        return self._collect(self._submit(fn, args))
+
+    def map(self, fn: Callable, items: Iterable) -> Iterator[Any]:
+        """
+        النسخة المتزامنة المتوازية: fn(item) لكل عنصر على عدة عمّال في نفس الوقت،
+        والنتائج تُعاد بنفس الترتيب. عدد المهام المرسلة غير المستهلكة محدود
+        بضعف عدد العمّال، فلا تُقرأ كل العناصر إلى الذاكرة مسبقاً.
+        """
+        window: Deque[Future] = deque()
+        try:
+            for item in items:
+                window.append(self._submit(fn, (item,)))
+                if len(window) >= 2 * self.max_workers:
+                    yield self._collect(window.popleft())
+            while window:
+                yield self._collect(window.popleft())
+        finally:
+            # المستهلك توقف مبكراً (أو حدث خطأ): إلغاء ما لم يبدأ بعد
+            for future in window:
+                future.cancel()
+                self._finish(None)
+
+    def _submit(self, fn: Callable, args: tuple) -> Future:
+        return self._get_executor().submit(self._prepare(fn, args))
+
+    def _collect(self, future: Future) -> Any:
+        try:
+            waited, result = future.result()
+        except BaseException:
+            self._finish(None)
+            raise
+        self._finish(waited)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            done = self.completed or 1
+            return {
+                "workers": self.max_workers,
+                "in_flight": self.in_flight,
+                # المهام التي لم تجد عاملاً متاحاً بعد
+                "queue_depth": max(0, self.in_flight - self.max_workers),
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(self.total_wait / done * 1000, 3),
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _create_heavy_executor() -> InstrumentedExecutor:
+    workers = settings.EXECUTOR_PROCESS_WORKERS
+    if workers <= 0:
+        # بدون عمليات منفصلة: العمل الثقيل يذهب لمنفذ threads خاص به
+        return InstrumentedExecutor(
+            "heavy",
+            lambda: ThreadPoolExecutor(max_workers=1, thread_name_prefix="mrag-heavy"),
+            1,
+        )
+    # spawn بدلاً من fork: العملية الرئيسية تملك threads (الـ light pool) وقد يكون
+    # أحدها ممسكاً بقفل لحظة الـ fork
+    context = multiprocessing.get_context("spawn")
+    return InstrumentedExecutor(
+        "heavy",
+        lambda: ProcessPoolExecutor(max_workers=workers, mp_context=context),
+        workers,
+    )
+
+
+# ✨ نسخ مشتركة (Singletons) عبر التطبيق
+light_executor = InstrumentedExecutor(
+    "light",
+    lambda: ThreadPoolExecutor(
+        max_workers=settings.EXECUTOR_THREAD_WORKERS, thread_name_prefix="mrag-light"
+    ),
+    settings.EXECUTOR_THREAD_WORKERS,
+)
+heavy_executor = _create_heavy_executor()
+
+
+def executor_stats() -> Dict[str, Dict[str, Any]]:
+    """إحصائيات كل المنفذات (تُعرض في /health)."""
+    return {executor.name: executor.stats() for executor in (light_executor, heavy_executor)}
+
+
+def shutdown_executors() -> None:
+    light_executor.shutdown()
+    heavy_executor.shutdown()
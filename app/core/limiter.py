@@ -2,6 +2,10 @@ from slowapi import Limiter
 from slowapi.util import get_remote_address
 from fastapi import Request
 
+from app.core.config import settings
+# استيراد الـ Backend يسجّل المخطط sqlite:// لدى مكتبة limits
+from app.core.limiter_storage import SQLiteStorage  # noqa: F401
+
 def get_rate_limit_key(request: Request):
     """
     يحدد هوية العميل لغرض تحديد المعدل.
@@ -10,4 +14,10 @@ def get_rate_limit_key(request: Request):
     return request.headers.get("X-API-Key", get_remote_address(request))
 
 # ✨ استخدام الدالة الجديدة بدلاً من IP فقط
-limiter = Limiter(key_func=get_rate_limit_key)
+# التخزين من RATE_LIMIT_STORAGE_URI: memory:// لكل عامل على حدة، sqlite:/// مشترك بين
+# عمّال الخادم الواحد (الحد الفعلي = الحد المعلن مهما كان عدد العمّال)، redis:// لعدة خوادم
+limiter = Limiter(
+    key_func=get_rate_limit_key,
+    strategy=settings.RATE_LIMIT_STRATEGY,
+    storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+)
@@ -0,0 +1,177 @@
+# app/core/limiter_storage.py
+"""
+تخزين عدادات تحديد المعدل (Rate Limiting) المشترك بين عمّال uvicorn على نفس الخادم.
+
+- يطبّق واجهة التخزين في مكتبة limits (نفس الواجهة التي تطبقها RedisStorage)، فيُختار
+  الـ Backend من RATE_LIMIT_STORAGE_URI فقط:
+    memory://                 داخل العملية (الافتراضي، وبديل محلي للاختبارات)
+    sqlite:///path/limits.db  ملف مشترك بين العمّال على نفس الخادم (هذا الملف)
+    redis://host:6379         عدة خوادم (يتطلب تثبيت حزمة redis)
+- قرار نافذة الـ Sliding Window Counter (قراءة النافذتين + الزيادة) يتم داخل معاملة
+  BEGIN IMMEDIATE واحدة، فهو ذري بين العمليات بدون سباق ولا تراجع لاحق
+- العدادات على القرص، فلا تُصفّر عند إعادة التشغيل
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from math import floor
+from typing import Optional, Tuple
+
+from limits.storage import SlidingWindowCounterSupport, Storage
+from limits.storage.base import TimestampedSlidingWindow
+
+# كل كم عملية كتابة تُحذف الصفوف المنتهية (بدلاً من مؤقت خلفي)
+PURGE_EVERY = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+# زيادة ذرية: العداد المنتهي يبدأ من جديد بمدة صلاحية جديدة
+_INCR = """
+INSERT INTO rate_limits (key, value, expires_at) VALUES (:key, :amount, :expires_at)
+ON CONFLICT (key) DO UPDATE SET
+    value = CASE WHEN expires_at <= :now THEN excluded.value ELSE value + excluded.value END,
+    expires_at = CASE WHEN expires_at <= :now THEN excluded.expires_at ELSE expires_at END
+RETURNING value
+"""
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """
+    Backend لمكتبة limits على ملف SQLite (وضع WAL).
+
+    :param uri: sqlite:///مسار/مطلق.db أو sqlite://مسار/نسبي.db
+    :param timeout: أقصى انتظار لقفل الكتابة (ثوانٍ) قبل رفع خطأ
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, timeout: float = 5.0, **_: str):
+        self.path = uri.split("://", 1)[1]
+        self.timeout = float(timeout)
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute(_SCHEMA)
+        super().__init__(uri, wrap_exceptions=wrap_exceptions)
+
+    @property
+    def base_exceptions(self) -> type:
+        return sqlite3.Error
+
+    def _connection(self) -> sqlite3.Connection:
+        """اتصال لكل thread ولكل عملية (الاتصال لا يُشارك بعد fork)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # isolation_level=None: كل جملة معاملة مستقلة، والمعاملات الصريحة بـ BEGIN
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    # -----------------------------
+    # 🔢 واجهة Storage الأساسية (Fixed Window)
+    # -----------------------------
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        now = time.time()
+        conn = self._connection()
+        value = conn.execute(
+            _INCR, {"key": key, "amount": amount, "expires_at": now + expiry, "now": now}
+        ).fetchone()[0]
+        self._maybe_purge(conn, now)
+        return value
+
+    def get(self, key: str) -> int:
+        row = self._connection().execute(
+            "SELECT value FROM rate_limits WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT expires_at FROM rate_limits WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    def clear(self, key: str) -> None:
+        self._connection().execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+    def check(self) -> bool:
+        try:
+            self._connection().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> Optional[int]:
+        return self._connection().execute("DELETE FROM rate_limits").rowcount
+
+    def _maybe_purge(self, conn: sqlite3.Connection, now: float) -> None:
+        # العدّاد تقريبي بين الـ threads، ويكفي لتحديد وتيرة التنظيف
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+
+    # -----------------------------
+    # 🪟 Sliding Window Counter
+    # -----------------------------
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        conn = self._connection()
+        # قفل الكتابة من البداية: القراءة والزيادة قرار واحد بين كل العمّال
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            previous_count, previous_ttl, current_count, _ = self._window(conn, previous_key, current_key, expiry, now)
+            allowed = floor(previous_count * previous_ttl / expiry + current_count) + amount <= limit
+            if allowed:
+                # مدة النافذة الحالية ضعف expiry لأنها تصبح "النافذة السابقة" بعدها
+                conn.execute(
+                    _INCR, {"key": current_key, "amount": amount, "expires_at": now + 2 * expiry, "now": now}
+                ).fetchone()
+            conn.execute("COMMIT")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        if allowed:
+            self._maybe_purge(conn, now)
+        return allowed
+
+    def get_sliding_window(self, key: str, expiry: int) -> Tuple[int, float, int, float]:
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        return self._window(self._connection(), previous_key, current_key, expiry, now)
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self._connection().execute("DELETE FROM rate_limits WHERE key IN (?, ?)", (previous_key, current_key))
+
+    def _window(
+        self, conn: sqlite3.Connection, previous_key: str, current_key: str, expiry: int, now: float
+    ) -> Tuple[int, float, int, float]:
+        counts = dict(
+            conn.execute(
+                "SELECT key, value FROM rate_limits WHERE key IN (?, ?) AND expires_at > ?",
+                (previous_key, current_key, now),
+            ).fetchall()
+        )
+        previous_count = counts.get(previous_key, 0)
+        current_count = counts.get(current_key, 0)
+        # نفس حساب MemoryStorage: الجزء المتبقي من النافذة السابقة يحدد وزنها
+        previous_ttl = 0.0 if previous_count == 0 else (1 - (((now - expiry) / expiry) % 1)) * expiry
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
@@ -0,0 +1,244 @@
+# app/core/metrics.py
+"""
+سجل المقاييس (Counters + Latency Histograms) مع عرض بصيغة Prometheus.
+
+التصميم:
+- كل مقياس له موقع ثابت (slot) في مصفوفة أرقام (float64)؛ العداد slot واحد،
+  والـ Histogram خانة لكل bucket + Inf ثم sum ثم count
+- كل thread يكتب في شريحة (shard) خاصة به فقط، فالتحديث في المسار الساخن
+  عملية `slots[i] += v` بدون أقفال وبدون تنافس بين الـ threads
+- القراءة تجمع كل الشرائح. مع METRICS_MULTIPROC_DIR تكون كل شريحة ملفاً مربوطاً
+  بـ mmap في المجلد، فتجمع القراءة من أي عامل (uvicorn --workers) مقاييس كل العمّال
+  (بما فيهم المنتهين: العدادات تراكمية). يُفرّغ المجلد عند بدء التشغيل من قبل المشغّل
+"""
+
+import glob
+import hashlib
+import mmap
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from app.core.config import settings
+
+# العدادات المعروضة في /health و /metrics
+COUNTERS = (
+    "total_requests",
+    "search_errors",
+    "llm_errors",
+    "llm_retries",
+    "successful_responses",
+    "rejected_responses",
+    "total_input_tokens",
+    "total_output_tokens",
+    "estimated_cost_usd",  # (يمكنك إضافة منطق حساب لاحقاً: Tokens * Price)
+    "answer_cache_hits",
+    "answer_cache_misses",
+    "answer_cache_evictions",
+    "search_cache_hits",
+    "search_cache_misses",
+    "coalesced_requests",
+)
+
+# حدود الـ buckets بالملي ثانية (تراكمية عند العرض، مع +Inf)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+HISTOGRAMS = {
+    "retrieval_ms": LATENCY_BUCKETS_MS,
+    "llm_ms": LATENCY_BUCKETS_MS,
+    "total_ms": LATENCY_BUCKETS_MS,
+}
+
+HELP = {
+    "retrieval_ms": "Retrieval latency per chat request (ms).",
+    "llm_ms": "LLM generation latency per chat request (ms).",
+    "total_ms": "End-to-end chat latency (ms).",
+}
+
+
+class _Shard:
+    """شريحة مقاييس يملكها thread واحد (في الذاكرة أو ملف mmap)."""
+
+    __slots__ = ("owner", "slots", "mm")
+
+    def __init__(self, owner: threading.Thread, slots: memoryview, mm: Optional[mmap.mmap] = None):
+        self.owner = owner
+        self.slots = slots
+        self.mm = mm
+
+
+class MetricsRegistry:
+    """
+    سجل مقاييس ثابت البنية: الأسماء تُحدد عند الإنشاء ولا تتغير بعدها.
+
+    :param counters: أسماء العدادات
+    :param histograms: {الاسم: حدود الـ buckets}
+    :param directory: مجلد مشترك بين العمّال (فارغ/None = داخل العملية فقط)
+    """
+
+    def __init__(
+        self,
+        counters: Iterable[str],
+        histograms: Dict[str, Sequence[float]],
+        directory: Optional[str] = None,
+        prefix: str = "mrag",
+    ):
+        self.prefix = prefix
+        self.directory = directory
+        self.counter_names = list(counters)
+        self.histogram_buckets = {name: tuple(buckets) for name, buckets in histograms.items()}
+
+        # البنية: الاسم → أول slot
+        self._index: Dict[str, int] = {}
+        size = 0
+        for name in self.counter_names:
+            self._index[name] = size
+            size += 1
+        for name, buckets in self.histogram_buckets.items():
+            self._index[name] = size
+            size += len(buckets) + 3  # buckets + Inf + sum + count
+        self._size = size
+        # بصمة البنية في اسم الملف: ملفات نسخة أخرى من الكود (بنية مختلفة) لا تُجمع
+        self._layout = hashlib.sha1(
+            repr((self.counter_names, sorted(self.histogram_buckets.items()))).encode()
+        ).hexdigest()[:12]
+
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # العملية الابنة بعد fork لا تكتب في شرائح الأب
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    # -----------------------------
+    # ✍️ الكتابة (المسار الساخن)
+    # -----------------------------
+    def inc(self, name: str, amount: float = 1) -> None:
+        try:
+            slots = self._local.slots
+        except AttributeError:
+            slots = self._attach()
+        slots[self._index[name]] += amount
+
+    def observe(self, name: str, value: float) -> None:
+        try:
+            slots = self._local.slots
+        except AttributeError:
+            slots = self._attach()
+        base = self._index[name]
+        buckets = self.histogram_buckets[name]
+        # أول حد >= القيمة (len(buckets) = +Inf)
+        slots[base + bisect_left(buckets, value)] += 1
+        slots[base + len(buckets) + 1] += value
+        slots[base + len(buckets) + 2] += 1
+
+    def _attach(self) -> memoryview:
+        """أول كتابة من thread: إعادة استخدام شريحة thread منتهٍ أو إنشاء شريحة جديدة."""
+        current = threading.current_thread()
+        with self._lock:
+            for shard in self._shards:
+                if not shard.owner.is_alive():
+                    # القيم تبقى (تراكمية)؛ الـ thread الجديد يكمل عليها
+                    shard.owner = current
+                    break
+            else:
+                shard = self._new_shard(current)
+                self._shards.append(shard)
+        self._local.slots = shard.slots
+        return shard.slots
+
+    def _new_shard(self, owner: threading.Thread) -> _Shard:
+        nbytes = self._size * 8
+        if not self.directory:
+            return _Shard(owner, memoryview(bytearray(nbytes)).cast("d"))
+        path = os.path.join(
+            self.directory, f"metrics_{os.getpid()}_{len(self._shards)}_{self._layout}.db"
+        )
+        # بدون اقتطاع: عامل جديد حصل على pid عامل منتهٍ يكمل على عداداته بدلاً من تصفيرها
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < nbytes:
+                os.ftruncate(fd, nbytes)  # تكبير فقط (الجزء الجديد أصفار)
+            mm = mmap.mmap(fd, nbytes)
+        finally:
+            os.close(fd)
+        return _Shard(owner, memoryview(mm).cast("d"), mm)
+
+    def _reset_after_fork(self) -> None:
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    # -----------------------------
+    # 📖 القراءة
+    # -----------------------------
+    def _totals(self) -> List[float]:
+        totals = [0.0] * self._size
+        if self.directory:
+            pattern = os.path.join(glob.escape(self.directory), f"metrics_*_{self._layout}.db")
+            sources = []
+            for path in glob.glob(pattern):
+                try:
+                    with open(path, "rb") as f:
+                        values = array("d", f.read(self._size * 8))
+                except (OSError, ValueError):
+                    continue  # ملف يُنشأ الآن أو حُذف
+                sources.append(values)
+        else:
+            with self._lock:
+                sources = [shard.slots for shard in self._shards]
+        for values in sources:
+            if len(values) != self._size:
+                continue
+            for i, value in enumerate(values):
+                totals[i] += value
+        return totals
+
+    def value(self, name: str) -> float:
+        """قيمة عداد مجمّعة من كل الـ threads (وكل العمّال في وضع المجلد)."""
+        return self._totals()[self._index[name]]
+
+    def counters(self) -> Dict[str, float]:
+        """كل العدادات كقاموس (تُعرض في /health)."""
+        totals = self._totals()
+        return {name: _number(totals[self._index[name]]) for name in self.counter_names}
+
+    def render_prometheus(self) -> str:
+        """النص بصيغة Prometheus exposition (text/plain; version=0.0.4)."""
+        totals = self._totals()
+        lines = []
+        for name in self.counter_names:
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}_total {_format(totals[self._index[name]])}")
+        for name, buckets in self.histogram_buckets.items():
+            metric = f"{self.prefix}_{name}"
+            base = self._index[name]
+            if name in HELP:
+                lines.append(f"# HELP {metric} {HELP[name]}")
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0.0
+            for i, bound in enumerate(buckets):
+                cumulative += totals[base + i]
+                lines.append(f'{metric}_bucket{{le="{_format(bound)}"}} {_format(cumulative)}')
+            cumulative += totals[base + len(buckets)]
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {_format(cumulative)}')
+            lines.append(f"{metric}_sum {_format(totals[base + len(buckets) + 1])}")
+            lines.append(f"{metric}_count {_format(totals[base + len(buckets) + 2])}")
+        return "\n".join(lines) + "\n"
+
+
+def _number(value: float):
+    return int(value) if value.is_integer() else value
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+# ✨ النسخة المشتركة (Singleton) للتطبيق
+metrics = MetricsRegistry(COUNTERS, HISTOGRAMS, directory=settings.METRICS_MULTIPROC_DIR or None)
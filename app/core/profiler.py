@@ -0,0 +1,252 @@
+# app/core/profiler.py
+"""
+أدوات الـ Profiling عند الطلب (للمشرفين فقط، معطلة افتراضياً عبر PROFILING_ENABLED).
+
+- طلب واحد: ترويسة X-Profile: 1 مع مفتاح مشرف ← cProfile لمدة الطلب، وتُحفظ نتيجة
+  pstats ويُعاد معرفها في ترويسة X-Profile-ID. cProfile يقيس thread الـ Event Loop
+  فقط (يشمل أي طلبات متزامنة عليه)؛ ما يُنفذ على الـ thread pool يظهر في الـ Sampling
+- نافذة زمنية: Sampling Profiler يأخذ عينات من مكدسات كل الـ threads
+  (sys._current_frames) كل interval_ms لمدة N ثانية من الحركة الفعلية، ويحفظها
+  بصيغة collapsed stacks (مدخل مباشر لأدوات Flame Graph)
+
+عند التعطيل لا يُسجل الـ Middleware إطلاقاً ولا يعمل أي thread، فالكلفة صفر.
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.security_service import is_admin_key
+
+logger = logging.getLogger("mrag_service")
+
+
+class ProfileBusyError(Exception):
+    """جلسة Profiling أخرى من نفس النوع قيد التشغيل."""
+
+
+class ProfileRecord:
+    """بيانات نتيجة Profiling واحدة (الملف نفسه على القرص)."""
+
+    __slots__ = ("profile_id", "kind", "status", "path", "created_at", "finished_at", "details", "error")
+
+    def __init__(self, profile_id: str, kind: str, path: str, details: Dict[str, Any]):
+        self.profile_id = profile_id
+        self.kind = kind  # "request" (pstats) أو "sampling" (collapsed stacks)
+        self.status = "running"
+        self.path = path
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.details = details
+        self.error: Optional[str] = None
+
+    @property
+    def format(self) -> str:
+        return "pstats" if self.kind == "request" else "collapsed"
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "profile_id": self.profile_id,
+            "kind": self.kind,
+            "format": self.format,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            **self.details,
+        }
+
+
+class ProfileStore:
+    """
+    مخزن نتائج الـ Profiling: الملفات في مجلد واحد، وتُحفظ آخر max_stored نتيجة فقط.
+
+    جلسة cProfile واحدة وجلسة Sampling واحدة كحد أقصى في نفس الوقت.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_stored: int = 20):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "mrag-profiles")
+        self.max_stored = max_stored
+        self._records: "OrderedDict[str, ProfileRecord]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._request_busy = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    # -----------------------------
+    # 📋 السجلات
+    # -----------------------------
+    def _new_record(self, kind: str, details: Dict[str, Any]) -> ProfileRecord:
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = uuid.uuid4().hex
+        suffix = ".pstats" if kind == "request" else ".collapsed.txt"
+        record = ProfileRecord(profile_id, kind, os.path.join(self.directory, profile_id + suffix), details)
+        with self._lock:
+            self._records[profile_id] = record
+            while len(self._records) > self.max_stored:
+                _, old = self._records.popitem(last=False)
+                try:
+                    os.remove(old.path)
+                except OSError:
+                    pass
+        return record
+
+    def get(self, profile_id: str) -> Optional[ProfileRecord]:
+        with self._lock:
+            return self._records.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [record.snapshot() for record in reversed(self._records.values())]
+
+    # -----------------------------
+    # 🎯 Profiling طلب واحد (cProfile)
+    # -----------------------------
+    def start_request(self, method: str, path: str) -> Optional[tuple]:
+        """
+        :return: (السجل، الـ Profiler) أو None إن كانت جلسة cProfile أخرى قيد التشغيل
+        """
+        if not self._request_busy.acquire(blocking=False):
+            return None
+        record = None
+        try:
+            record = self._new_record("request", {"method": method, "path": path})
+            profiler = cProfile.Profile()
+            profiler.enable()
+        except Exception as e:
+            # ValueError: أداة Profiling أخرى مفعلة على نفس الـ thread؛ OSError: تعذر إنشاء مجلد النتائج
+            self._request_busy.release()
+            if record is not None:
+                record.status, record.error = "failed", str(e)
+            logger.warning(f"⚠️ Request profiling could not start: {e}")
+            return None
+        except BaseException:
+            self._request_busy.release()
+            raise
+        return record, profiler
+
+    def finish_request(self, record: ProfileRecord, profiler: cProfile.Profile) -> None:
+        profiler.disable()
+        try:
+            profiler.dump_stats(record.path)
+            record.status = "completed"
+        except OSError as e:
+            record.status, record.error = "failed", str(e)
+        finally:
+            record.finished_at = time.time()
+            self._request_busy.release()
+
+    # -----------------------------
+    # 📈 Sampling لعدة ثوانٍ من الحركة
+    # -----------------------------
+    def start_sampling(self, seconds: float, interval_ms: float = 5.0) -> ProfileRecord:
+        """
+        :raises ProfileBusyError: إن كانت جلسة Sampling أخرى قيد التشغيل
+        """
+        with self._lock:
+            if self._sampler is not None and self._sampler.is_alive():
+                raise ProfileBusyError("A sampling session is already running.")
+        record = self._new_record("sampling", {"seconds": seconds, "interval_ms": interval_ms, "samples": 0})
+        sampler = threading.Thread(
+            target=self._sample, args=(record, seconds, interval_ms / 1000), name="mrag-profiler", daemon=True
+        )
+        with self._lock:
+            self._sampler = sampler
+        sampler.start()
+        return record
+
+    def _sample(self, record: ProfileRecord, seconds: float, interval: float) -> None:
+        stacks: Counter = Counter()
+        own = threading.get_ident()
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own:
+                        continue
+                    frames = []
+                    while frame is not None:
+                        frames.append(_frame_label(frame))
+                        frame = frame.f_back
+                    frames.append(names.get(thread_id, str(thread_id)))
+                    stacks[";".join(reversed(frames))] += 1
+                record.details["samples"] += 1
+                time.sleep(interval)
+
+            with open(record.path, "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            record.status = "completed"
+        except Exception as e:
+            logger.error(f"❌ Sampling profiler failed: {e}", exc_info=True)
+            record.status, record.error = "failed", str(e)
+        finally:
+            record.finished_at = time.time()
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # آخر مكونين من المسار يكفيان للتمييز ويبقيان الملف صغيراً
+    path = "/".join(code.co_filename.replace("\\", "/").rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+def render_pstats(path: str, limit: int = 40, sort: str = "cumulative") -> str:
+    """ملخص نصي لنتيجة pstats (أعلى الدوال حسب sort)."""
+    out = io.StringIO()
+    stats = pstats.Stats(path, stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+class ProfilingMiddleware:
+    """
+    Middleware (ASGI) يفعّل cProfile للطلب الذي يحمل X-Profile: 1 مع مفتاح مشرف.
+    الطلبات الأخرى تمر مباشرة (بدون أي تغليف). يُسجل فقط إن كان PROFILING_ENABLED مفعلاً.
+    """
+
+    def __init__(self, app, store: Optional[ProfileStore] = None):
+        self.app = app
+        self.store = store or profile_store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile") not in (b"1", b"true") or not is_admin_key(
+            headers.get(b"x-api-key", b"").decode("latin-1")
+        ):
+            return await self.app(scope, receive, send)
+
+        started = self.store.start_request(scope["method"], scope["path"])
+        if started is None:
+            return await self.app(scope, receive, _with_header(send, b"x-profile-status", b"busy"))
+
+        record, profiler = started
+        try:
+            await self.app(scope, receive, _with_header(send, b"x-profile-id", record.profile_id.encode()))
+        finally:
+            self.store.finish_request(record, profiler)
+
+
+def _with_header(send, name: bytes, value: bytes):
+    async def wrapped(message):
+        if message["type"] == "http.response.start":
+            message = {**message, "headers": [*message.get("headers", []), (name, value)]}
+        await send(message)
+
+    return wrapped
+
+
+# ✨ النسخة المشتركة (Singleton) للتطبيق
+profile_store = ProfileStore(directory=settings.PROFILE_DIR or None, max_stored=settings.PROFILE_MAX_STORED)
@@ -0,0 +1,100 @@
+# app/core/rwlock.py
+"""
+أقفال قراءة/كتابة (Reader-Writer Locks) لكل مفتاح (kb_id).
+
+محركات البحث In-Memory كانت تستخدم قفلاً واحداً للخدمة: إدخال كبير في KB واحدة
+يوقف البحث في كل الـ KBs الأخرى، والبحوث في نفس الـ KB تتسلسل رغم أنها قراءة فقط.
+مع KeyedRWLock:
+- كل KB لها قفلها، فالإدخال في KB لا يتنافس مع البحث في غيرها
+- عدة بحوث في نفس الـ KB تعمل معاً (قراءة مشتركة)، والإدخال يحصل على قفل حصري
+- أولوية للكاتب: قارئ جديد ينتظر إن كان هناك كاتب ينتظر، فلا يُجوَّع الإدخال
+
+الأقفال غير قابلة لإعادة الدخول (Non-Reentrant): لا تطلب قفل القراءة مرة ثانية من
+نفس الـ thread وأنت تحمله (مع كاتب ينتظر يحدث Deadlock).
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Dict, Hashable, Iterator
+
+
+class RWLock:
+    """قفل قراءة/كتابة بأولوية للكاتب."""
+
+    __slots__ = ("_cond", "_readers", "_writer", "_waiting_writers")
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self) -> None:
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        with self._cond:
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self) -> None:
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+class KeyedRWLock:
+    """
+    جدول أقفال RWLock حسب المفتاح، يُنشأ قفل المفتاح عند أول استخدام.
+
+    مثال:
+        with locks.read(kb_id): ...   # بحث
+        with locks.write(kb_id): ...  # إدخال
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, RWLock] = {}
+        self._guard = threading.Lock()
+
+    def get(self, key: Hashable) -> RWLock:
+        lock = self._locks.get(key)
+        if lock is None:
+            with self._guard:
+                lock = self._locks.setdefault(key, RWLock())
+        return lock
+
+    def read(self, key: Hashable):
+        return self.get(key).read()
+
+    def write(self, key: Hashable):
+        return self.get(key).write()
@@ -1,7 +1,111 @@
 # app/core/services.py
-from app.services.search_service import MockSearchService
-from app.services.llm_service import GeminiLLMService
+from app.core.config import settings
+from app.core.executors import heavy_executor
+from app.services.search_service import BaseSearchService, MockSearchService
+from app.services.index_search_service import InvertedIndexSearchService
+from app.services.cached_search_service import CachedSearchService
+from app.services.llm_service import BaseLLMService, GeminiLLMService, HTTPLLMService
+from app.services.ingestion_service import IngestionService
+from app.services.ingestion_jobs import IngestionJobQueue
+from app.services.answer_cache import AnswerCache
+
+
+def _create_vector_service() -> BaseSearchService:
+    from app.services.vector_search_service import (
+        HashingEmbedder,
+        SentenceTransformerEmbedder,
+        VectorSearchService,
+    )
+
+    embedder = (
+        SentenceTransformerEmbedder(settings.EMBEDDING_MODEL)
+        if settings.EMBEDDING_MODEL
+        else HashingEmbedder()
+    )
+    return VectorSearchService(
+        embedder=embedder, mode=settings.VECTOR_SEARCH_MODE, nprobe=settings.VECTOR_NPROBE
+    )
+
+
+def create_search_service(backend: str) -> BaseSearchService:
+    """ينشئ خدمة البحث حسب SEARCH_BACKEND، ملفوفة بـ Cache الاسترجاع إن كان مفعّلاً."""
+    service = _create_backend(backend)
+    if settings.SEARCH_CACHE_ENABLED:
+        return CachedSearchService(service, max_entries=settings.SEARCH_CACHE_MAX_ENTRIES)
+    return service
+
+
+def _create_index_service() -> InvertedIndexSearchService:
+    return InvertedIndexSearchService(
+        storage_dir=settings.INDEX_STORAGE_DIR or None,
+        memory_budget_bytes=settings.KB_MEMORY_BUDGET_MB * 1024 * 1024,
+        spill_dir=settings.KB_SPILL_DIR or None,
+    )
+
+
+def _create_backend(backend: str) -> BaseSearchService:
+    """ينشئ خدمة البحث المطلوبة حسب الإعداد SEARCH_BACKEND."""
+    if backend == "mock":
+        return MockSearchService()
+    if backend == "index":
+        return _create_index_service()
+    if backend == "matrix":
+        # استيراد متأخر: NumPy مطلوبة فقط عند اختيار هذا المحرك
+        from app.services.matrix_search_service import SparseMatrixSearchService
+
+        return SparseMatrixSearchService()
+    if backend == "vector":
+        return _create_vector_service()
+    if backend == "hybrid":
+        from app.services.hybrid_search_service import HybridSearchService
+
+        return HybridSearchService(
+            backends={
+                "keyword": _create_index_service(),
+                "vector": _create_vector_service(),
+            },
+            fusion=settings.HYBRID_FUSION,
+        )
+    raise ValueError(f"Unknown search backend: {backend}")
+
+
+def create_llm_service(backend: str) -> BaseLLMService:
+    """ينشئ خدمة الـ LLM المطلوبة حسب الإعداد LLM_BACKEND."""
+    if backend == "mock":
+        return GeminiLLMService()
+    if backend == "gemini":
+        return HTTPLLMService(
+            api_key=settings.GEMINI_API_KEY,
+            base_url=settings.LLM_BASE_URL,
+            model=settings.LLM_MODEL,
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+            connect_timeout=settings.LLM_CONNECT_TIMEOUT_SECONDS,
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            max_retries=settings.LLM_MAX_RETRIES,
+            backoff_base=settings.LLM_BACKOFF_SECONDS,
+            backoff_max=settings.LLM_BACKOFF_MAX_SECONDS,
+        )
+    raise ValueError(f"Unknown LLM backend: {backend}")
+
 
 # ✨ إنشاء نسخ واحدة (Singletons) ليتم مشاركتها عبر التطبيق بالكامل
-search_service_instance = MockSearchService()
-llm_service_instance = GeminiLLMService()
+search_service_instance = create_search_service(settings.SEARCH_BACKEND)
+llm_service_instance = create_llm_service(settings.LLM_BACKEND)
+ingestion_service_instance = IngestionService()
+ingestion_jobs_instance = IngestionJobQueue(
+    ingestion_service_instance,
+    search_service_instance,
+    workers=settings.INGESTION_WORKERS,
+    executor=heavy_executor,
+    max_document_bytes=settings.MAX_UPLOAD_SIZE_MB * 1024 * 1024,
+)
+answer_cache_instance = (
+    AnswerCache(
+        max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+        near_duplicate=settings.ANSWER_CACHE_NEAR_DUPLICATE,
+    )
+    if settings.ANSWER_CACHE_ENABLED
+    else None
+)
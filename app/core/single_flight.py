@@ -0,0 +1,44 @@
+# app/core/single_flight.py
+"""
+دمج الطلبات المتطابقة المتزامنة (Single-Flight / Request Coalescing).
+
+أول طلب لمفتاح معين (القائد) يشغّل العملية كـ Task، وأي طلب بنفس المفتاح يصل
+قبل انتهائها ينتظر نفس النتيجة بدلاً من تكرار العمل. المفتاح يُحذف فور انتهاء
+العملية، فلا يعمل هذا كـ Cache: الطلب التالي بعد الانتهاء يبدأ عملية جديدة.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    جدول العمليات الجارية داخل حلقة الأحداث: {key: Task}.
+
+    - النتيجة أو الاستثناء يصلان لكل المنتظرين
+    - إلغاء أحد المنتظرين (انقطاع العميل) لا يلغي العملية المشتركة (asyncio.shield)
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        :param key: مفتاح الدمج
+        :param fn: دالة بدون معاملات تعيد Awaitable (تُستدعى فقط إن لم توجد عملية جارية)
+        :return: (النتيجة، True إن انضم الطلب لعملية جارية بدلاً من تشغيلها)
+        """
+        task = self._flights.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+
+    def __len__(self) -> int:
+        return len(self._flights)
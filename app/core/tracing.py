@@ -0,0 +1,195 @@
+# app/core/tracing.py
+"""
+تتبع مراحل الطلب (Tracing Spans) داخل العملية.
+
+- trace(trace_id, name): يبدأ تتبعاً جديداً للطلب الحالي (عبر contextvars)، ويُضاف
+  عند انتهائه إلى Ring Buffer بحجم ثابت (آخر TRACE_BUFFER_SIZE تتبع)
+- span(name): يقيس مرحلة واحدة داخل التتبع الحالي. بدون تتبع نشط لا يفعل شيئاً
+  (كلفته قراءة contextvar واحدة)
+- السياق يُنسخ إلى الـ threads عبر app/core/executors.py، فمراحل البحث على الـ
+  thread pool تظهر في تتبع الطلب نفسه. العمليات المنفصلة (heavy executor) لا تُتتبع
+- RequestTracingMiddleware (ASGI) يغلف كل طلب HTTP بتتبع يُغلق بعد إرسال آخر جزء من
+  الجسم، فالردود المتدفقة (StreamingResponse) تُقاس بكامل مدة التوليد
+"""
+
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+class Trace:
+    """تتبع طلب واحد: قائمة spans بترتيب الانتهاء (الاسم، البداية، المدة، العمق)."""
+
+    __slots__ = ("trace_id", "name", "started_at", "start", "duration_ms", "spans", "dropped")
+
+    def __init__(self, trace_id: str, name: str):
+        self.trace_id = trace_id
+        self.name = name
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.spans: List[Tuple[str, float, float, int]] = []
+        self.dropped = 0
+
+    def add(self, name: str, start: float, end: float, depth: int) -> None:
+        # list.append آمن بين الـ threads؛ الحد يمنع تضخم تتبعات المهام الطويلة
+        if len(self.spans) >= settings.TRACE_MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append((name, (start - self.start) * 1000, (end - start) * 1000, depth))
+
+    def snapshot(self) -> Dict[str, Any]:
+        spans = sorted(self.spans, key=lambda s: s[1])
+        # مجموع زمن كل مرحلة (قد تتكرر المرحلة، مثلاً span لكل كتلة في الإدخال)
+        stages: Dict[str, float] = {}
+        for name, _, duration, _ in spans:
+            stages[name] = stages.get(name, 0.0) + duration
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "stages_ms": {name: round(total, 3) for name, total in stages.items()},
+            "spans": [
+                {"name": name, "offset_ms": round(offset, 3), "duration_ms": round(duration, 3), "depth": depth}
+                for name, offset, duration, depth in spans
+            ],
+            "dropped_spans": self.dropped,
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("mrag_trace", default=None)
+_current_depth: ContextVar[int] = ContextVar("mrag_span_depth", default=0)
+
+_buffer: Deque[Trace] = deque(maxlen=settings.TRACE_BUFFER_SIZE)
+_buffer_lock = threading.Lock()
+
+
+class _Span:
+    __slots__ = ("trace", "name", "start", "depth", "token")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self) -> "_Span":
+        self.depth = _current_depth.get()
+        self.token = _current_depth.set(self.depth + 1)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        end = time.perf_counter()
+        try:
+            _current_depth.reset(self.token)
+        except ValueError:
+            # الخروج من سياق مختلف (مثلاً Async Generator استُهلك في Task آخر)
+            _current_depth.set(self.depth)
+        self.trace.add(self.name, self.start, end, self.depth)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str):
+    """
+    Context manager لقياس مرحلة داخل التتبع الحالي.
+
+    مثال: with span("search.score"): ...
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NOOP
+    return _Span(trace, name)
+
+
+@contextmanager
+def trace(trace_id: str, name: str) -> Iterator[Optional[Trace]]:
+    """
+    بدء تتبع للسياق الحالي (طلب HTTP أو مهمة خلفية). يُحفظ في الـ Ring Buffer عند الانتهاء.
+
+    :param trace_id: معرف الربط (X-Request-ID أو معرف المهمة)
+    :param name: وصف مختصر (مثلاً "POST /api/v1/assistant/chat")
+    """
+    if not settings.TRACING_ENABLED:
+        yield None
+        return
+    current = Trace(trace_id, name)
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        current.duration_ms = (time.perf_counter() - current.start) * 1000
+        _current_trace.reset(token)
+        with _buffer_lock:
+            _buffer.append(current)
+
+
+class RequestTracingMiddleware:
+    """
+    Middleware (ASGI) يعطي كل طلب HTTP معرفاً (request.state.request_id وترويسة
+    X-Request-ID) ويتتبعه به.
+
+    ASGI وليس @app.middleware("http"): الأخير يعود من call_next قبل إرسال جسم الرد،
+    فيُغلق تتبع الرد المتدفق قبل أن يبدأ التوليد.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request_id = str(uuid.uuid4())
+        # request.state يقرأ من scope["state"]
+        scope.setdefault("state", {})["request_id"] = request_id
+        header = (b"x-request-id", request_id.encode())
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        # كل الـ spans داخل الطلب (بما فيها ما يُنفذ على الـ thread pool) تُربط بنفس المعرف
+        with trace(request_id, f"{scope['method']} {scope['path']}"):
+            await self.app(scope, receive, send_with_request_id)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def slowest_traces(limit: int = 10, name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    أبطأ التتبعات الأخيرة (من الـ Ring Buffer) مرتبة تنازلياً حسب المدة.
+
+    :param limit: عدد التتبعات المطلوب
+    :param name: تصفية حسب بداية الاسم (مثلاً "POST /api/v1/assistant/chat")
+    """
+    with _buffer_lock:
+        traces = list(_buffer)
+    if name:
+        traces = [t for t in traces if t.name.startswith(name)]
+    traces.sort(key=lambda t: t.duration_ms or 0.0, reverse=True)
+    return [t.snapshot() for t in traces[:limit]]
+
+
+def clear_traces() -> None:
+    with _buffer_lock:
+        _buffer.clear()
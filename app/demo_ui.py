@@ -49,9 +49,19 @@ with st.sidebar:
                 
                 response = requests.post(upload_url, files=files)
                 
-                if response.status_code == 201:
-                    st.success(f"✅ Indexed into: {target_kb}")
-                    st.caption(f"Response: {response.json()}")
+                if response.status_code == 202:
+                    # المعالجة تتم في الخلفية: متابعة حالة المهمة حتى تنتهي
+                    job_url = f"{api_url}{response.json()['status_url']}"
+                    job = requests.get(job_url).json()
+                    while job["status"] in ("queued", "running"):
+                        time.sleep(0.5)
+                        job = requests.get(job_url).json()
+                    
+                    if job["status"] == "completed":
+                        st.success(f"✅ Indexed into: {target_kb}")
+                    else:
+                        st.error(f"❌ Ingestion failed: {job['error']}")
+                    st.caption(f"Job: {job}")
                 else:
                     st.error(f"❌ Error {response.status_code}: {response.text}")
             except Exception as e:
@@ -192,6 +202,54 @@ if st.button("Ask Assistant", type="primary", use_container_width=True):
             except Exception as e:
                 st.error(f"An unexpected error occurred: {e}")
 
+# Streaming Button: نفس السؤال عبر /chat/stream (SSE) مع عرض الإجابة تدريجياً
+def iter_sse_events(response):
+    """قراءة أحداث text/event-stream: (event, data) لكل حدث فور وصوله."""
+    event = None
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            yield event, json.loads(line[len("data: "):])
+
+if st.button("⚡ Ask Assistant (Streaming)", use_container_width=True):
+    if not query:
+        st.warning("⚠️ Please enter a question.")
+    else:
+        headers = {"Content-Type": "application/json", "X-API-Key": api_key}
+        payload = {"kb_id": st.session_state.kb_input, "query": query}
+        try:
+            with requests.post(
+                f"{api_url}/api/v1/assistant/chat/stream", json=payload, headers=headers, stream=True
+            ) as response:
+                if response.status_code != 200:
+                    st.error(f"❌ HTTP Error {response.status_code}: {response.text}")
+                else:
+                    response.encoding = "utf-8"
+                    st.subheader("💬 Answer")
+                    answer_box = st.empty()
+                    answer = ""
+                    for event, data in iter_sse_events(response):
+                        if event == "context":
+                            with st.expander(f"📚 Context ({len(data['context_used'])} sources)"):
+                                st.json(data["context_used"])
+                        elif event == "token":
+                            answer += data["text"]
+                            answer_box.markdown(answer + "▌")
+                        elif event == "done":
+                            if data["status"] == "success":
+                                answer_box.success(answer)
+                            else:
+                                answer_box.warning(f"🛑 {data.get('answer')}")
+                            timings = data["timings"]
+                            t1, t2 = st.columns(2)
+                            t1.metric("Time to First Token", f"{timings.get('first_token_ms') or 0:.0f} ms")
+                            t2.metric("Total Latency", f"{timings['total_ms']:.0f} ms")
+                        elif event == "error":
+                            st.error(f"⚠️ {data['detail']}")
+        except requests.exceptions.ConnectionError:
+            st.error("🔌 Connection Error: Could not reach Backend. Is uvicorn running?")
+
 # --- 5. Global System Health (Live from /health) ---
 st.divider()
 with st.expander("🌍 Live System Metrics (Global Telemetry)"):
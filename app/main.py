@@ -1,8 +1,8 @@
 import os
-import uuid
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 # مكتبات تحديد المعدل
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
@@ -12,6 +12,11 @@ from opencensus.ext.azure.log_exporter import AzureLogHandler
 from app.core.config import settings
 from app.api.router import api_router
 from app.core.limiter import limiter
+from app.core.executors import executor_stats, shutdown_executors
+from app.core.metrics import metrics
+from app.core.tracing import RequestTracingMiddleware
+from app.core.profiler import ProfilingMiddleware
+from app.core.services import ingestion_jobs_instance, llm_service_instance, search_service_instance
 
 # --- 1. إعدادات التسجيل والمراقبة (Logging & Observability) ---
 logging.basicConfig(
@@ -32,11 +37,21 @@ if APPINSIGHTS_CONNECTION_STRING:
         logger.error(f"❌ Failed to attach Azure Insights: {e}")
 
 # --- 2. تهيئة تطبيق FastAPI ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # إيقاف عمّال الإدخال ثم منفذات الخلفية (threads / processes) عند إغلاق التطبيق،
+    # وإغلاق اتصالات عميل الـ LLM المشترك
+    ingestion_jobs_instance.shutdown()
+    shutdown_executors()
+    await llm_service_instance.aclose()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version="0.3.0", # ترقية الإصدار لـ Sprint 3
     docs_url="/docs" if settings.ENVIRONMENT == "development" else None, # إخفاء التوثيق في الإنتاج للأمان
-    redoc_url=None
+    redoc_url=None,
+    lifespan=lifespan
 )
 
 # --- 3. تسجيل البرمجيات الوسيطة والأدوات (Middleware & Tools) ---
@@ -45,13 +60,14 @@ app = FastAPI(
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-# Middleware لإضافة Request ID لكل طلب (للتتبع)
-@app.middleware("http")
-async def add_request_id(request: Request, call_next):
-    request.state.request_id = str(uuid.uuid4())
-    response = await call_next(request)
-    response.headers["X-Request-ID"] = request.state.request_id
-    return response
+# Middleware لإضافة Request ID لكل طلب (للتتبع): ASGI حتى يبقى التتبع مفتوحاً
+# أثناء إرسال الردود المتدفقة (/chat/stream) ويُغلق بعد آخر جزء منها
+app.add_middleware(RequestTracingMiddleware)
+
+# ✨ Profiling عند الطلب (للمشرفين): يُسجل فقط عند التفعيل، فلا كلفة على المسار العادي.
+# يُضاف بعد Middleware المعرف فيغلفه، فيشمل الـ Profile كامل معالجة الطلب
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
 
 # ✨ Global Exception Handler (شبكة الأمان الأخيرة)
 # يضمن أن أي خطأ غير متوقع يعود كـ JSON نظيف ولا يكشف تفاصيل الخادم
@@ -79,9 +95,20 @@ def health_check():
         "status": "ok",
         "environment": settings.ENVIRONMENT,
         "version": "0.3.0",
-        "metrics": settings.METRICS # ✨ عرض العدادات الحية (بما في ذلك التوكنات)
+        "metrics": metrics.counters(), # ✨ عرض العدادات الحية (بما في ذلك التوكنات، مجمّعة من كل العمّال)
+        "executors": executor_stats(), # عمق الطابور وزمن الانتظار لكل منفذ
+        "ingestion_jobs": ingestion_jobs_instance.stats(),
+        "search_memory": search_service_instance.memory_stats() # الـ KBs المقيمة / المُخرجة للقرص وزمن إعادة التحميل
     }
 
+@app.get("/metrics", tags=["Monitoring"], response_class=PlainTextResponse)
+def prometheus_metrics():
+    """
+    العدادات و Histograms زمن الاستجابة (retrieval_ms, llm_ms, total_ms) بصيغة Prometheus،
+    مجمّعة من كل العمّال عند ضبط METRICS_MULTIPROC_DIR.
+    """
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # تضمين الموجهات (Routers)
 app.include_router(api_router, prefix="/api/v1")
 
@@ -11,6 +11,14 @@ class Timings(BaseModel):
     total_ms: float
     retrieval_ms: float
     llm_ms: float
+    # زمن كل محرك بحث فرعي (في البحث الهجين فقط)
+    backend_ms: Optional[Dict[str, float]] = None
+    # الإجابة جاءت من Cache الإجابات (بدون بحث أو LLM)
+    cached: bool = False
+    # الطلب انضم لطلب مطابق جارٍ (Single-Flight) وشاركه البحث والتوليد
+    coalesced: bool = False
+    # زمن أول جزء من الإجابة منذ بدء الطلب (في الدردشة المتدفقة فقط)
+    first_token_ms: Optional[float] = None
 
 # --- نماذج الاستجابة ---
 class ChatResponse(BaseModel):
@@ -20,4 +28,40 @@ class ChatResponse(BaseModel):
     reason: Optional[str] = None
     timings: Optional[Timings] = None
 
-    
\ No newline at end of file
+# --- نماذج الدردشة الدفعية ---
+class BatchChatRequest(BaseModel):
+    requests: List[ChatRequest]
+
+class BatchChatResponse(BaseModel):
+    # بنفس ترتيب BatchChatRequest.requests
+    results: List[ChatResponse]
+
+# --- نماذج مهام الإدخال ---
+class IngestionJobAccepted(BaseModel):
+    status: str = "accepted"
+    job_id: str
+    status_url: str
+    message: str
+
+class IngestionFileStatus(BaseModel):
+    filename: str
+    bytes: int
+    chunks: int
+    error: Optional[str] = None
+
+class IngestionJobStatus(BaseModel):
+    job_id: str
+    kb_id: str
+    filename: Optional[str] = None
+    status: str
+    bytes_total: int
+    bytes_read: int
+    chunks_indexed: int
+    error: Optional[str] = None
+    queue_ms: float
+    duration_ms: float
+    # المهام الجماعية فقط: نتيجة كل مستند
+    files: Optional[List[IngestionFileStatus]] = None
+    # الإنتاجية: MB من النص المعالج و chunks في الثانية
+    mb_per_s: float = 0.0
+    chunks_per_s: float = 0.0
@@ -0,0 +1,89 @@
+# app/services/answer_cache.py
+"""
+Cache للإجابات أمام خدمة الـ LLM.
+
+المفتاح: (kb_id، إصدار الـ KB، الاستعلام المُطبّع). إصدار الـ KB يأتي من
+search_service.get_kb_version ويزيد مع كل إدخال، فتُبطل الإجابات القديمة تلقائياً
+(تصبح غير قابلة للوصول وتخرج بالـ LRU أو الـ TTL).
+
+وضع near_duplicate: المفتاح مجموعة الكلمات بعد إزالة كلمات التوقف والسوابق،
+فيتطابق "ما هي سياسة العمل؟" مع "سياسة العمل ما هي" مثلاً.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.metrics import metrics
+from app.services.arabic_text import ARABIC_STOPWORDS, fold_tokens, stem
+
+
+class AnswerCache:
+    """
+    Cache محدود الحجم (LRU) مع صلاحية زمنية (TTL) للإجابات الناجحة.
+
+    العدادات تُسجل في سجل المقاييس (app/core/metrics.py):
+    answer_cache_hits / answer_cache_misses / answer_cache_evictions
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0, near_duplicate: bool = False):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.near_duplicate = near_duplicate
+        # البنية: {key: (وقت الانتهاء، الإجابة، السياق)} بترتيب الاستخدام (الأحدث في النهاية)
+        self._entries: "OrderedDict[Tuple, Tuple[float, str, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, kb_id: str, kb_version: int, query: str) -> Tuple:
+        tokens = fold_tokens(query)
+        if self.near_duplicate:
+            normalized = tuple(sorted({stem(t) for t in tokens if t not in ARABIC_STOPWORDS}))
+        else:
+            normalized = " ".join(tokens)
+        return kb_id, kb_version, normalized
+
+    # -----------------------------
+    # 🔍 القراءة
+    # -----------------------------
+    def get(self, kb_id: str, kb_version: int, query: str) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        :param kb_id: معرف الـ Knowledge Base
+        :param kb_version: إصدار الـ KB الحالي
+        :param query: استعلام المستخدم
+        :return: (الإجابة، السياق المستخدم) أو None
+        """
+        key = self._key(kb_id, kb_version, query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                metrics.inc("answer_cache_evictions")
+                entry = None
+            if entry is None:
+                metrics.inc("answer_cache_misses")
+                return None
+            self._entries.move_to_end(key)
+            metrics.inc("answer_cache_hits")
+            return entry[1], entry[2]
+
+    # -----------------------------
+    # 📥 الكتابة
+    # -----------------------------
+    def put(
+        self, kb_id: str, kb_version: int, query: str, answer: str, context: List[Dict[str, Any]]
+    ) -> None:
+        key = self._key(kb_id, kb_version, query)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, answer, context)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.inc("answer_cache_evictions")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,100 @@
+# app/services/arabic_text.py
+"""
+معالجة النص العربي المشتركة بين محركات البحث: التطبيع، التقسيم إلى terms،
+وإزالة كلمات التوقف والسوابق.
+
+التطبيع يتم في تمريرتين فقط بدلاً من ست عمليات re.sub:
+- str.translate بجدول ثابت: إزالة التشكيل + توحيد الألف + التاء المربوطة + الألف المقصورة
+- regex واحد مُترجم مسبقاً: استبدال أي تتابع من غير الحروف العربية/الأرقام بمسافة واحدة
+"""
+
+import re
+from functools import lru_cache
+from typing import FrozenSet, List, Optional, Tuple
+
+# قائمة كلمات التوقف العربية (Stopwords) - قابلة للتوسّع
+ARABIC_STOPWORDS = frozenset({
+    "من", "في", "على", "الى", "إلى", "عن", "هو", "هي", "هم", "هن",
+    "هذا", "هذه", "ذلك", "تلك", "ما", "ماذا", "لماذا", "كيف", "هل",
+    "كان", "كانت", "يكون", "مع", "ثم", "كما", "قد", "لقد", "بل",
+    "أو", "و", "يا", "إن", "أن", "إنه", "أنها", "هناك", "هنا"
+})
+
+# السوابق التي تُزال من بداية الكلمة (الأطول أولاً)
+ARABIC_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+
+# جدول الترجمة: التشكيل (U+064B..U+065F) يُحذف، والحروف المتشابهة توحَّد.
+# الجدول قائمة (فهرسة مباشرة) وليس dict لأنها أسرع في str.translate؛
+# الحروف بعد نهاية القائمة تبقى كما هي (LookupError = بدون تغيير).
+_TRANSLATION_TABLE: List[Optional[str]] = [chr(codepoint) for codepoint in range(0x0660)]
+for _codepoint in range(0x064B, 0x0660):
+    _TRANSLATION_TABLE[_codepoint] = None
+for _source, _target in (("أ", "ا"), ("إ", "ا"), ("آ", "ا"), ("ة", "ه"), ("ى", "ي")):
+    _TRANSLATION_TABLE[ord(_source)] = _target
+
+# أي تتابع من غير الحروف العربية/الأرقام (بما فيه المسافات) يصبح مسافة واحدة
+_NON_ARABIC_RE = re.compile(r"[^ء-ي0-9]+")
+
+# كلمة بأي لغة (للمفاتيح التي يجب ألا تُسقط النص اللاتيني)
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_arabic(text: str) -> str:
+    """
+    تطبيع النص العربي لجعله مناسباً للمطابقة البسيطة.
+
+    الخطوات:
+    - إزالة التشكيل
+    - توحيد الألف (أ، إ، آ → ا)
+    - تحويل التاء المربوطة إلى ه
+    - تحويل الألف المقصورة إلى ي
+    - استبدال الرموز غير العربية/الأرقام بمسافة وإزالة المسافات الزائدة
+    """
+    if not text:
+        return ""
+    return _NON_ARABIC_RE.sub(" ", text.translate(_TRANSLATION_TABLE)).strip()
+
+
+def fold_tokens(text: str) -> List[str]:
+    """
+    تقسيم نص إلى كلمات مطبّعة لبناء مفاتيح الـ Cache: نفس توحيد الحروف العربية
+    وإزالة التشكيل، لكن مع الإبقاء على الكلمات اللاتينية (بحروف صغيرة) بدلاً من حذفها.
+    """
+    return _WORD_RE.findall(text.translate(_TRANSLATION_TABLE).casefold())
+
+
+def stem(word: str) -> str:
+    """إزالة سابقة واحدة شائعة مع الإبقاء على جذر لا يقل عن حرفين."""
+    for prefix in ARABIC_PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 2:
+            return word[len(prefix):]
+    return word
+
+
+def analyze(normalized_text: str) -> List[str]:
+    """
+    تحويل نص مُطبّع إلى قائمة terms:
+    - تجاهل الكلمات ذات الطول <= 2 وكلمات التوقف
+    - إزالة السوابق الشائعة
+    """
+    return [
+        stem(w)
+        for w in normalized_text.split()
+        if len(w) > 2 and w not in ARABIC_STOPWORDS
+    ]
+
+
+def analyze_text(text: str) -> List[str]:
+    """تطبيع ثم تحليل نص كامل (مسار الإدخال)."""
+    return analyze(normalize_arabic(text))
+
+
+@lru_cache(maxsize=4096)
+def analyze_query(query: str) -> Tuple[str, FrozenSet[str]]:
+    """
+    مسار الاستعلام مع تخزين مؤقت (LRU): الاستعلامات المتكررة لا يُعاد تطبيعها.
+
+    :return: (الاستعلام المُطبّع، مجموعة terms الاستعلام)
+    """
+    normalized = normalize_arabic(query)
+    return normalized, frozenset(analyze(normalized))
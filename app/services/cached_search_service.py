@@ -0,0 +1,125 @@
+# app/services/cached_search_service.py
+
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.core.metrics import metrics
+from app.core.tracing import span
+from app.services.arabic_text import fold_tokens
+from app.services.search_service import BaseSearchService
+
+
+class CachedSearchService(BaseSearchService):
+    """
+    Decorator حول أي BaseSearchService يخزن نتائج الاسترجاع مؤقتاً (LRU محدود الحجم).
+
+    الخصائص:
+    - المفتاح: (kb_id، إصدار الـ KB، الاستعلام المُطبّع، top_k)
+    - إصدار الـ KB يأتي من الخدمة الداخلية (get_kb_version) ويزيد مع كل add_documents،
+      فالنتائج القديمة لا تُعاد أبداً بعد الإدخال وتخرج بالـ LRU
+    - الإدخال والإصدار يُمرران كما هما للخدمة الداخلية
+    - العدادات في سجل المقاييس: search_cache_hits / search_cache_misses
+    """
+
+    def __init__(self, inner: BaseSearchService, max_entries: int = 4096):
+        super().__init__()
+        self.inner = inner
+        self.max_entries = max_entries
+        # البنية: {key: النتائج} بترتيب الاستخدام (الأحدث في النهاية)
+        self._entries: "OrderedDict[Tuple, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # -----------------------------
+    # 📥 إضافة المستندات
+    # -----------------------------
+    def add_documents(self, kb_id: str, documents: List[str]):
+        """
+        تمرير الإدخال للخدمة الداخلية (التي ترفع إصدار الـ KB فتُبطل نتائجها المخزنة).
+
+        :param kb_id: معرف الـ Knowledge Base
+        :param documents: قائمة نصوص (Chunks)
+        """
+        self.inner.add_documents(kb_id, documents)
+
+    def get_kb_version(self, kb_id: str) -> int:
+        return self.inner.get_kb_version(kb_id)
+
+    def memory_stats(self) -> Dict[str, Any]:
+        return self.inner.memory_stats()
+
+    def incremental_ingest(self) -> bool:
+        return self.inner.incremental_ingest()
+
+    # -----------------------------
+    # 🔍 عملية البحث
+    # -----------------------------
+    def search(self, query: str, kb_id: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        results, _ = self.search_with_timings(query, kb_id, top_k)
+        return results
+
+    def search_with_timings(
+        self, query: str, kb_id: str, top_k: int = 3
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+        """
+        نفس search_with_timings للخدمة الداخلية مع Cache. عند الإصابة لا يُشغّل
+        أي محرك، فتُعاد أزمنة المحركات الفرعية فارغة.
+
+        :return: (النتائج، {اسم المحرك: الزمن بالملي ثانية})
+        """
+        with span("search_cache.lookup"):
+            # الإصدار يُقرأ قبل البحث: إن تغيّر أثناءه تُخزّن النتيجة تحت الإصدار الأقدم فلا تُستخدم
+            key = (kb_id, self.inner.get_kb_version(kb_id), " ".join(fold_tokens(query)), top_k)
+
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    metrics.inc("search_cache_hits")
+                    # نسخ القواميس حتى لا يعدّل المستدعي النسخة المخزنة
+                    return [dict(result) for result in entry], {}
+                metrics.inc("search_cache_misses")
+
+        results, backend_ms = self.inner.search_with_timings(query, kb_id, top_k)
+
+        with self._lock:
+            self._entries[key] = [dict(result) for result in results]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return results, backend_ms
+
+    def search_batch(self, queries: List[str], kb_id: str, top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """
+        الاستعلامات الموجودة في الـ Cache تُعاد مباشرة، والباقي يُرسل للخدمة
+        الداخلية في دفعة واحدة (search_batch الخاص بها).
+        """
+        version = self.inner.get_kb_version(kb_id)
+        keys = [(kb_id, version, " ".join(fold_tokens(query)), top_k) for query in queries]
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(queries)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    results[i] = [dict(result) for result in entry]
+            hits = sum(result is not None for result in results)
+            metrics.inc("search_cache_hits", hits)
+            metrics.inc("search_cache_misses", len(queries) - hits)
+
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            fetched = self.inner.search_batch([queries[i] for i in misses], kb_id, top_k)
+            with self._lock:
+                for i, batch_results in zip(misses, fetched):
+                    results[i] = batch_results
+                    self._entries[keys[i]] = [dict(result) for result in batch_results]
+                    self._entries.move_to_end(keys[i])
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return results
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,284 @@
+# app/services/chunk_store.py
+"""
+تخزين عمودي مضغوط لنصوص الـ chunks (بديل قائمة {"raw": ..., "norm": ...} لكل chunk).
+
+- النصوص الأصلية في buffer متصل بترميز UTF-8 مع مصفوفة offsets، تُفك فقط للنتائج
+- النص المطبّع لا يُخزن: كل KB لها معجم (Vocabulary) يحوّل كل كلمة مطبّعة إلى رقم
+  صحيح عند الإدخال، وكل chunk تُخزن كتسلسل أرقام. التسلسل مرمّز كـ str بحرف واحد
+  لكل كلمة (chr(token_id)) لأن str.find / str.count تبحث في مدى بلغة C بينما
+  array('I') لا تملك count في مدى. الحجم بايتان للكلمة ما دامت أرقام الـ segment
+  < 0x10000، وإلا أربعة (مثل array('I'))
+- أرقام بعد sys.maxunicode (أكثر من ~1.1 مليون كلمة مميزة في KB) لا تُرمّز كأحرف:
+  الـ segment الذي يحتويها يُخزن كـ array('I') ويُبحث فيه بمسار أبطأ، بدون حد للمعجم
+- البيانات مقسمة إلى segments ثابتة (immutable): الإضافة تنشئ ChunkStore جديداً
+  يشارك segments القديمة (والمعجم) ولا ينسخ إلا آخر segment غير مكتمل، فيبقى البحث
+  على لقطة ثابتة بدون أقفال (Copy-on-Write على مستوى الـ segment)
+- المطابقة تتم مرة واحدة لكل كلمة استعلام على تسلسل الـ segment كاملاً: str.find
+  ثم bisect لتحويل الموقع إلى رقم chunk، فلا تُلمس الـ chunks التي لا تحتوي الكلمة؛
+  الكلمات الشائعة تُعد بـ str.count لكل chunk عبر map (بدون حلقة Python لكل chunk).
+  المطابقة على كلمات كاملة: "عمل" لا تطابق "العمل" (بخلاف str.count على النص)
+"""
+
+import sys
+from array import array
+from bisect import bisect_right
+from itertools import compress, repeat
+from operator import add
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# أقصى عدد chunks في segment واحد (يحدد كلفة نسخ آخر segment عند الإدخال)
+SEGMENT_CHUNKS = 4096
+
+# كلمة تظهر في أكثر من 1/DENSE_FRACTION من chunks الـ segment تُعد بالمرور على كل chunk
+DENSE_FRACTION = 16
+
+# الرقم 0 محجوز فاصلاً بين الـ chunks (فلا تعبر مطابقة متعددة الكلمات حدود chunk)
+_SEPARATOR = "\x00"
+# أكبر رقم يُرمّز كحرف في str؛ ما بعده يحوّل الـ segment إلى array('I')
+_MAX_STR_TOKEN_ID = sys.maxunicode
+
+
+class Vocabulary:
+    """
+    معجم KB واحدة: كلمة مطبّعة ↔ رقم صحيح، بالإضافة فقط (لا تُحذف كلمات).
+
+    الكتابة (intern) تتم تحت قفل كتابة الـ KB؛ القرّاء يستخدمون lookup فقط، وكلمة
+    أُضيفت بعد لقطتهم لا تظهر في تسلسلاتها فلا تطابق شيئاً.
+    """
+
+    __slots__ = ("ids", "tokens")
+
+    def __init__(self):
+        # البنية: {كلمة: رقم}، و tokens[رقم] = كلمة (الرقم 0 للفاصل)
+        self.ids: Dict[str, int] = {}
+        self.tokens: List[str] = [""]
+
+    def __len__(self) -> int:
+        return len(self.tokens) - 1
+
+    def intern(self, words: Iterable[str]) -> Sequence:
+        """
+        أرقام الكلمات (مع إضافة الجديدة منها): str بحرف لكل كلمة، أو array('I')
+        إذا تجاوز أحد الأرقام _MAX_STR_TOKEN_ID.
+        """
+        ids, tokens = self.ids, self.tokens
+        sequence = []
+        for word in words:
+            token_id = ids.get(word)
+            if token_id is None:
+                token_id = len(tokens)
+                ids[word] = token_id
+                tokens.append(word)
+            sequence.append(token_id)
+        if sequence and max(sequence) > _MAX_STR_TOKEN_ID:
+            return array("I", sequence)
+        return "".join(map(chr, sequence))
+
+    def lookup(self, word: str) -> Optional[int]:
+        """رقم الكلمة، أو None إذا لم تظهر في أي chunk."""
+        return self.ids.get(word)
+
+    def decode(self, sequence: Sequence) -> List[str]:
+        tokens = self.tokens
+        return [tokens[token_id] for token_id in _token_ids(sequence)]
+
+
+def _token_ids(sequence: Sequence) -> Iterable[int]:
+    """أرقام تسلسل مرمّز كـ str أو array('I')."""
+    return map(ord, sequence) if isinstance(sequence, str) else sequence
+
+
+class _Segment:
+    """
+    chunks متتالية في buffers ثابتة.
+
+    - raw / raw_offsets: النصوص الأصلية (UTF-8) و uint64 × (n + 1) لبداية كل نص بالبايت
+    - tokens / token_offsets: تسلسلات أرقام الكلمات، كل منها متبوع بـ _SEPARATOR
+      (str، أو array('I') إذا احتوى الـ segment رقماً بعد _MAX_STR_TOKEN_ID)
+    """
+
+    __slots__ = ("raw", "raw_offsets", "tokens", "token_offsets")
+
+    def __init__(self, raw: bytes, raw_offsets: array, tokens: Sequence, token_offsets: array):
+        self.raw = raw
+        self.raw_offsets = raw_offsets
+        self.tokens = tokens
+        self.token_offsets = token_offsets
+
+    @classmethod
+    def build(cls, raws: Sequence[str], sequences: Sequence[Sequence], base: "_Segment" = None) -> "_Segment":
+        """segment جديد = base (إن وُجد) + الـ chunks الجديدة، بدون فك ترميز base."""
+        raw_parts = [text.encode("utf-8") for text in raws]
+        wide = any(not isinstance(sequence, str) for sequence in sequences) or (
+            base is not None and not isinstance(base.tokens, str)
+        )
+        if wide:
+            token_parts = [array("I", [*_token_ids(sequence), 0]) for sequence in sequences]
+        else:
+            token_parts = [sequence + _SEPARATOR for sequence in sequences]
+
+        raw_offsets = array("Q", base.raw_offsets if base else [0])
+        token_offsets = array("Q", base.token_offsets if base else [0])
+        for offsets, parts in ((raw_offsets, raw_parts), (token_offsets, token_parts)):
+            position = offsets[-1]
+            for part in parts:
+                position += len(part)
+                offsets.append(position)
+
+        raw = (base.raw if base else b"") + b"".join(raw_parts)
+        if wide:
+            tokens = array("I", _token_ids(base.tokens) if base else ())
+            for part in token_parts:
+                tokens.extend(part)
+        else:
+            tokens = (base.tokens if base else "") + "".join(token_parts)
+        return cls(raw, raw_offsets, tokens, token_offsets)
+
+    def __len__(self) -> int:
+        return len(self.raw_offsets) - 1
+
+    def text(self, i: int) -> str:
+        return self.raw[self.raw_offsets[i]:self.raw_offsets[i + 1]].decode("utf-8")
+
+    def sequence(self, i: int) -> Sequence:
+        return self.tokens[self.token_offsets[i]:self.token_offsets[i + 1] - 1]
+
+    def count(self, token_id: int, scores: List[int]) -> None:
+        """يضيف لـ scores[i] عدد مرات ظهور الكلمة token_id في الـ chunk رقم i."""
+        blob, offsets = self.tokens, self.token_offsets
+        if not isinstance(blob, str):
+            return self._count_wide(token_id, scores)
+        if token_id > _MAX_STR_TOKEN_ID:
+            return  # لا يظهر في segment مرمّز كـ str
+        pattern = chr(token_id)
+        # كلمة نادرة: القفز بين المطابقات؛ كلمة شائعة: عدّ كل chunk متبقٍ مباشرة
+        limit = len(scores) // DENSE_FRACTION
+        hits = 0
+        position = blob.find(pattern)
+        while position != -1:
+            i = bisect_right(offsets, position) - 1
+            end = offsets[i + 1]
+            scores[i] += blob.count(pattern, position, end)
+            hits += 1
+            if hits > limit:
+                rest = map(blob.count, repeat(pattern), offsets[i + 1:-1], offsets[i + 2:])
+                scores[i + 1:] = map(add, scores[i + 1:], rest)
+                return
+            position = blob.find(pattern, end)
+
+    def _count_wide(self, token_id: int, scores: List[int]) -> None:
+        """نفس count لـ segment مخزن كـ array('I') (index للقفز ثم count على شريحة الـ chunk)."""
+        blob, offsets = self.tokens, self.token_offsets
+        position = _array_find(blob, token_id, 0)
+        while position != -1:
+            i = bisect_right(offsets, position) - 1
+            end = offsets[i + 1]
+            scores[i] += blob[position:end].count(token_id)
+            position = _array_find(blob, token_id, end)
+
+    @property
+    def nbytes(self) -> int:
+        tokens = self.tokens
+        return (
+            len(self.raw)
+            + (sys.getsizeof(tokens) if isinstance(tokens, str) else len(tokens) * tokens.itemsize)
+            + (len(self.raw_offsets) + len(self.token_offsets)) * self.raw_offsets.itemsize
+        )
+
+
+def _array_find(blob: array, token_id: int, start: int) -> int:
+    try:
+        return blob.index(token_id, start)
+    except ValueError:
+        return -1
+
+
+class ChunkStore:
+    """
+    لقطة ثابتة لـ chunks KB واحدة (النص الأصلي + تسلسل أرقام الكلمات) بأرقام من 0.
+
+    مثال:
+        store = ChunkStore().extend(raws, [normalize_arabic(raw).split() for raw in raws])
+        scores = store.count_matches(["الاجازه", "السنويه"])   # {chunk_id: عدد المطابقات}
+        store.text(chunk_id)
+    """
+
+    __slots__ = ("vocabulary", "segments", "starts", "size")
+
+    def __init__(self, vocabulary: Optional[Vocabulary] = None, segments: Tuple[_Segment, ...] = ()):
+        self.vocabulary = vocabulary or Vocabulary()
+        self.segments = segments
+        # رقم أول chunk في كل segment
+        self.starts: List[int] = []
+        size = 0
+        for segment in segments:
+            self.starts.append(size)
+            size += len(segment)
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def extend(self, raws: Sequence[str], tokens: Sequence[Sequence[str]]) -> "ChunkStore":
+        """
+        لقطة جديدة بعد إضافة chunks؛ اللقطة الحالية لا تتغير (المعجم المشترك يكبر فقط).
+
+        :param raws: النصوص الأصلية
+        :param tokens: كلمات النص المطبّع لكل chunk (بنفس الترتيب والطول)
+        """
+        if len(raws) != len(tokens):
+            raise ValueError("raws and tokens must have the same length.")
+        sequences = [self.vocabulary.intern(words) for words in tokens]
+
+        segments = list(self.segments)
+        start = 0
+        # آخر segment غير مكتمل يُدمج مع أول الدفعة (نسخ محدود بـ SEGMENT_CHUNKS)
+        if segments and len(segments[-1]) < SEGMENT_CHUNKS:
+            base = segments.pop()
+            start = SEGMENT_CHUNKS - len(base)
+            segments.append(_Segment.build(raws[:start], sequences[:start], base))
+        while start < len(raws):
+            end = start + SEGMENT_CHUNKS
+            segments.append(_Segment.build(raws[start:end], sequences[start:end]))
+            start = end
+        return ChunkStore(self.vocabulary, tuple(segments))
+
+    def _locate(self, chunk_id: int) -> Tuple[_Segment, int]:
+        if not 0 <= chunk_id < self.size:
+            raise IndexError(chunk_id)
+        i = bisect_right(self.starts, chunk_id) - 1
+        return self.segments[i], chunk_id - self.starts[i]
+
+    def text(self, chunk_id: int) -> str:
+        segment, i = self._locate(chunk_id)
+        return segment.text(i)
+
+    def tokens(self, chunk_id: int) -> List[str]:
+        """كلمات النص المطبّع للـ chunk (مُعاد بناؤها من المعجم)."""
+        segment, i = self._locate(chunk_id)
+        return self.vocabulary.decode(segment.sequence(i))
+
+    def count_matches(self, words: Iterable[str]) -> Dict[int, int]:
+        """
+        مجموع مرات ظهور كل كلمة (ككلمة كاملة) في كل chunk
+        (نفس sum(tokens.count(word) for word in words) لكل chunk).
+
+        :return: {chunk_id: العدد} للـ chunks ذات العدد > 0 فقط
+        """
+        # تحويل الاستعلام إلى أرقام مرة واحدة؛ كلمة خارج المعجم لا تطابق شيئاً
+        token_ids = [token_id for token_id in map(self.vocabulary.lookup, words) if token_id]
+        counts: Dict[int, int] = {}
+        if not token_ids:
+            return counts
+        for segment, base_id in zip(self.segments, self.starts):
+            scores = [0] * len(segment)
+            for token_id in token_ids:
+                segment.count(token_id, scores)
+            for i in compress(range(len(scores)), scores):
+                counts[base_id + i] = scores[i]
+        return counts
+
+    @property
+    def nbytes(self) -> int:
+        """حجم الـ buffers والـ offsets بالبايت (بدون المعجم ورؤوس الكائنات الثابتة)."""
+        return sum(segment.nbytes for segment in self.segments)
@@ -0,0 +1,157 @@
+# app/services/hybrid_search_service.py
+
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+from app.core.tracing import span
+from app.services.search_service import BaseSearchService
+
+
+class HybridSearchService(BaseSearchService):
+    """
+    خدمة بحث مركبة (Hybrid) تجمع عدة محركات (مثلاً الكلمات المفتاحية + المتجهات).
+
+    الخصائص:
+    - تشغيل كل المحركات بالتوازي على Thread Pool داخلي، فزمن الاسترجاع ≈ أبطأ
+      محرك وليس مجموعها
+    - دمج الترتيب عبر Reciprocal Rank Fusion (rrf) أو مجموع موزون للـ scores
+      بعد تطبيعها على أعلى score لكل محرك (weighted)
+    - الإدخال يُوزّع على كل المحركات
+    - نفس شكل النتائج: [{"text": "...", "score": 0.032}, ...]
+    """
+
+    def __init__(
+        self,
+        backends: Dict[str, BaseSearchService],
+        fusion: str = "rrf",
+        weights: Optional[Dict[str, float]] = None,
+        rrf_k: int = 60,
+        oversample: int = 3,
+    ):
+        if fusion not in ("rrf", "weighted"):
+            raise ValueError(f"Unknown fusion method: {fusion}")
+        super().__init__()
+        self.backends = backends
+        self.fusion = fusion
+        self.weights = {name: 1.0 for name in backends}
+        self.weights.update(weights or {})
+        # ثابت RRF: كلما كبر قلّ الفرق بين المراتب الأولى
+        self.rrf_k = rrf_k
+        # كل محرك يعيد top_k * oversample مرشحاً قبل الدمج
+        self.oversample = oversample
+        self.executor = ThreadPoolExecutor(
+            max_workers=len(backends), thread_name_prefix="hybrid-search"
+        )
+
+    # -----------------------------
+    # 📥 إضافة المستندات
+    # -----------------------------
+    def add_documents(self, kb_id: str, documents: List[str]):
+        """
+        إضافة المستندات لكل المحركات بالتوازي.
+
+        :param kb_id: معرف الـ Knowledge Base
+        :param documents: قائمة نصوص (Chunks)
+        """
+        futures = [
+            self.executor.submit(backend.add_documents, kb_id, documents)
+            for backend in self.backends.values()
+        ]
+        for future in futures:
+            future.result()
+
+    def get_kb_version(self, kb_id: str) -> int:
+        """إصدار الـ KB المركب: مجموع إصدارات المحركات (يتغير بتغير أي منها)."""
+        return sum(backend.get_kb_version(kb_id) for backend in self.backends.values())
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """حالة الذاكرة لكل محرك يحاسبها: {اسم المحرك: stats}."""
+        stats = {name: backend.memory_stats() for name, backend in self.backends.items()}
+        return {name: value for name, value in stats.items() if value}
+
+    def incremental_ingest(self) -> bool:
+        return all(backend.incremental_ingest() for backend in self.backends.values())
+
+    # -----------------------------
+    # 🔍 عملية البحث
+    # -----------------------------
+    def search(self, query: str, kb_id: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        results, _ = self.search_with_timings(query, kb_id, top_k)
+        return results
+
+    def search_with_timings(
+        self, query: str, kb_id: str, top_k: int = 3
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+        """
+        بحث هجين:
+        - تشغيل كل المحركات بالتوازي وقياس زمن كل منها
+        - دمج القوائم حسب طريقة الـ fusion واختيار أفضل top_k
+
+        :param query: استعلام المستخدم
+        :param kb_id: معرف الـ Knowledge Base
+        :param top_k: عدد النتائج المراد إرجاعها
+        :return: (النتائج المدمجة، {اسم المحرك: الزمن بالملي ثانية})
+        """
+        fetch_k = top_k * self.oversample
+        # نسخة من السياق لكل محرك: spans المحركات تظهر في تتبع الطلب نفسه
+        futures = {
+            name: self.executor.submit(
+                contextvars.copy_context().run, self._timed_search, name, backend, query, kb_id, fetch_k
+            )
+            for name, backend in self.backends.items()
+        }
+
+        rankings: Dict[str, List[Dict[str, Any]]] = {}
+        timings: Dict[str, float] = {}
+        for name, future in futures.items():
+            rankings[name], timings[name] = future.result()
+
+        with span("search.fuse"):
+            return self._fuse(rankings)[:top_k], timings
+
+    def search_batch(self, queries: List[str], kb_id: str, top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """
+        كل محرك يبحث الدفعة كاملة (search_batch الخاص به) بالتوازي مع بقية المحركات،
+        ثم تُدمج النتائج لكل استعلام على حدة.
+        """
+        fetch_k = top_k * self.oversample
+        futures = {
+            name: self.executor.submit(
+                contextvars.copy_context().run, backend.search_batch, queries, kb_id, fetch_k
+            )
+            for name, backend in self.backends.items()
+        }
+        batches = {name: future.result() for name, future in futures.items()}
+        return [
+            self._fuse({name: batch[i] for name, batch in batches.items()})[:top_k]
+            for i in range(len(queries))
+        ]
+
+    @staticmethod
+    def _timed_search(
+        name: str, backend: BaseSearchService, query: str, kb_id: str, top_k: int
+    ) -> Tuple[List[Dict[str, Any]], float]:
+        t0 = time.perf_counter()
+        with span(f"search.backend.{name}"):
+            results = backend.search(query, kb_id, top_k)
+        return results, round((time.perf_counter() - t0) * 1000, 2)
+
+    def _fuse(self, rankings: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """دمج قوائم المحركات في قائمة واحدة مرتبة تنازلياً (المفتاح: نص الـ chunk)."""
+        fused: Dict[str, float] = {}
+        for name, results in rankings.items():
+            if not results:
+                continue
+            weight = self.weights.get(name, 1.0)
+            top_score = max(r["score"] for r in results) or 1.0
+            for rank, result in enumerate(results, start=1):
+                if self.fusion == "rrf":
+                    contribution = weight / (self.rrf_k + rank)
+                else:
+                    contribution = weight * result["score"] / top_score
+                fused[result["text"]] = fused.get(result["text"], 0.0) + contribution
+
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+        return [{"text": text, "score": round(score, 4)} for text, score in ranked]
@@ -0,0 +1,384 @@
+# app/services/index_search_service.py
+
+import heapq
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+
+from app.core.rwlock import KeyedRWLock
+from app.core.tracing import span
+from app.services.arabic_text import analyze_query, analyze_text
+from app.services.index_storage import KBIndexStorage, MmapKBIndex
+from app.services.kb_memory import KBMemoryManager
+from app.services.search_service import BaseSearchService, MockSearchService
+
+# تقدير كلفة الكائنات في الذاكرة (CPython 64-bit) لمحاسبة حجم الـ KB:
+# مستند = خانة في chunks و doc_lengths و doc_norms + كائن float للـ norm
+_DOC_BYTES = 3 * 8 + 24
+# term جديد = مدخل في postings + رأس القائمة
+_TERM_BYTES = 100 + 56
+# posting = tuple (doc_id, tf) + خانة في القائمة
+_POSTING_BYTES = 64 + 8
+
+
+class _KBIndex:
+    """
+    فهرس معكوس (Inverted Index) لقاعدة معرفة واحدة.
+
+    - chunks: النصوص الأصلية مرتبة حسب رقم المستند (doc_id)
+    - postings: term -> [(doc_id, tf), ...] مرتبة تصاعدياً حسب doc_id
+    - doc_lengths / total_length: أطوال المستندات (بعدد الـ terms) لحساب BM25، تراكمية
+    - IDF يُحسب عند الاستعلام من df (طول قائمة الـ postings) لكل term في الاستعلام فقط
+    - doc_norms: معامل تطبيع الطول لكل مستند، يُعاد حسابه مرة عند أول قراءة بعد الإدخال
+      (يعتمد على متوسط الطول فيتغير مع كل دفعة)، فلا يكلف الإدخال O(حجم الـ KB) لكل دفعة
+    - text_bytes / term_bytes / n_postings: عدادات تدريجية لتقدير الحجم (nbytes)
+    """
+
+    __slots__ = (
+        "k1", "b", "chunks", "postings", "doc_lengths", "total_length", "_doc_norms",
+        "text_bytes", "term_bytes", "n_postings",
+    )
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunks: List[str] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+        self.total_length = 0
+        self._doc_norms: List[float] = []
+        self.text_bytes = 0
+        self.term_bytes = 0
+        self.n_postings = 0
+
+    @classmethod
+    def from_mmap(cls, source: MmapKBIndex, k1: float, b: float) -> "_KBIndex":
+        """تحميل فهرس محفوظ على القرص بالكامل إلى الذاكرة."""
+        index = cls(k1, b)
+        index.chunks = [source.text(doc_id) for doc_id in range(source.n_docs)]
+        index.doc_lengths = list(source.doc_lengths())
+        index.total_length = source.total_length
+        index.text_bytes = sum(sys.getsizeof(text) for text in index.chunks)
+        for term_bytes, docs, tfs in source.iter_terms():
+            term = term_bytes.decode("utf-8")
+            index.postings[term] = list(zip(docs, tfs))
+            index.term_bytes += sys.getsizeof(term)
+            index.n_postings += len(docs)
+        return index
+
+    @property
+    def nbytes(self) -> int:
+        """حجم تقديري للفهرس في الذاكرة (بالبايت)."""
+        return (
+            self.text_bytes
+            + self.term_bytes
+            + len(self.chunks) * _DOC_BYTES
+            + len(self.postings) * _TERM_BYTES
+            + self.n_postings * _POSTING_BYTES
+        )
+
+    def add(self, text: str, terms: List[str]) -> None:
+        doc_id = len(self.chunks)
+        self.chunks.append(text)
+        self.doc_lengths.append(len(terms))
+        self.total_length += len(terms)
+        self.text_bytes += sys.getsizeof(text)
+
+        tf: Dict[str, int] = {}
+        for term in terms:
+            tf[term] = tf.get(term, 0) + 1
+
+        for term, count in tf.items():
+            plist = self.postings.get(term)
+            if plist is None:
+                plist = self.postings[term] = []
+                self.term_bytes += sys.getsizeof(term)
+            plist.append((doc_id, count))
+        self.n_postings += len(tf)
+
+    def lookup(self, term: str) -> Optional[Tuple[float, Iterable[Tuple[int, int]]]]:
+        """
+        :return: (IDF، [(doc_id, tf), ...]) أو None إن لم يوجد الـ term.
+        IDF بصيغة Lucene: ln(1 + (N - df + 0.5) / (df + 0.5)) وهي موجبة دائماً.
+        """
+        plist = self.postings.get(term)
+        if not plist:
+            return None
+        n_docs, df = len(self.chunks), len(plist)
+        return math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)), plist
+
+    def text(self, doc_id: int) -> str:
+        return self.chunks[doc_id]
+
+    @property
+    def doc_norms(self) -> List[float]:
+        """
+        k1 * (1 - b + b * dl / avg_length) لكل مستند. يُعاد حسابه فقط إذا أُضيفت مستندات
+        منذ آخر قراءة (القراءة تحت قفل القراءة والإضافة تحت قفل الكتابة، فلا تتداخلان؛
+        قارئان متزامنان قد يحسبان نفس القائمة مرتين بلا ضرر).
+        """
+        norms = self._doc_norms
+        n_docs = len(self.doc_lengths)
+        if len(norms) != n_docs:
+            k1, b = self.k1, self.b
+            avg_length = (self.total_length / n_docs if n_docs else 0.0) or 1.0
+            norms = self._doc_norms = [k1 * (1.0 - b + b * dl / avg_length) for dl in self.doc_lengths]
+        return norms
+
+
+class InvertedIndexSearchService(BaseSearchService):
+    """
+    خدمة بحث In-Memory مبنية على فهرس معكوس لكل Knowledge Base.
+
+    بدلاً من المرور على كل الـ chunks في كل استعلام (كما في MockSearchService)،
+    يُبنى الفهرس تدريجياً عند add_documents، ويلمس الاستعلام فقط قوائم
+    الـ postings الخاصة بكلماته.
+
+    الخصائص:
+    - نفس التطبيع وكلمات التوقف وقواعد الـ Demo الخاصة بـ MockSearchService
+    - مطابقة على مستوى الكلمة بعد إزالة السوابق الشائعة (ال، وال، بال...)
+      بدلاً من مطابقة الـ substring (انظر arabic_text.analyze)
+    - ترتيب BM25: الإدخال يحدّث الإحصائيات التراكمية للدفعة فقط، و IDF / تطبيع الطول
+      يُحسبان عند الاستعلام (بدون إعادة حساب كامل الـ KB مع كل دفعة)
+    - اختيار أفضل top_k عبر heap محدود بدلاً من ترتيب كل المرشحين
+    - تخزين دائم اختياري (storage_dir): كل KB تُحفظ على القرص وتُفتح عبر mmap،
+      فيخدم الـ worker الاستعلامات فور إعادة التشغيل دون إعادة الفهرسة
+    - قفل قراءة/كتابة لكل KB (app/core/rwlock.py): الإدخال في KB لا يوقف البحث في غيرها،
+      وتحليل النصوص يتم قبل أخذ قفل الكتابة
+    - ميزانية ذاكرة اختيارية (memory_budget_bytes، بدون التخزين الدائم فقط): عند تجاوزها
+      تُكتب الـ KBs الأقدم استعلاماً إلى القرص بتنسيق index_storage وتُحذف من الذاكرة،
+      ثم تُحمّل كاملة عند أول استعلام أو إدخال عليها
+    - نفس شكل النتائج: [{"text": "...", "score": 2.41}, ...]
+    """
+
+    FORBIDDEN_TOPICS = MockSearchService.FORBIDDEN_TOPICS
+
+    def __init__(
+        self,
+        k1: float = 1.2,
+        b: float = 0.75,
+        storage_dir: Optional[str] = None,
+        reload_interval: float = 1.0,
+        memory_budget_bytes: int = 0,
+        spill_dir: Optional[str] = None,
+    ):
+        super().__init__()
+        # معاملات BM25: k1 لتشبع التكرار، b لتطبيع طول المستند
+        self.k1 = k1
+        self.b = b
+        # البنية: {kb_id: _KBIndex} في الذاكرة، أو {kb_id: MmapKBIndex} مع التخزين الدائم
+        self.indexes: Dict[str, Any] = {}
+        self._locks = KeyedRWLock()
+
+        self.storage = KBIndexStorage(storage_dir) if storage_dir else None
+        # أقل فترة (بالثواني) بين فحصين لـ commits من workers أخرى على نفس الـ KB
+        self.reload_interval = reload_interval
+        self._last_reload_check: Dict[str, float] = {}
+        if self.storage:
+            for kb_id in self.storage.list_kbs():
+                self.indexes[kb_id] = self.storage.open(kb_id)
+
+        # محاسبة حجم الـ KBs المقيمة (في وضع الذاكرة)، والإخراج للقرص عند تحديد ميزانية
+        self.memory = KBMemoryManager(0 if self.storage else memory_budget_bytes)
+        self.spill_storage = None
+        if self.memory.budget_bytes:
+            # مجلد لكل عملية: عمّال uvicorn لا يتشاركون الـ KBs المقيمة في الذاكرة،
+            # وملفات تشغيل سابق لا قيمة لها (محتوى الذاكرة لا يبقى بعد إعادة التشغيل)
+            base_dir = spill_dir or os.path.join(tempfile.gettempdir(), "mrag-spill")
+            root = os.path.join(base_dir, f"worker-{os.getpid()}")
+            shutil.rmtree(root, ignore_errors=True)
+            self.spill_storage = KBIndexStorage(root)
+
+    # -----------------------------
+    # 📥 إضافة المستندات
+    # -----------------------------
+    def add_documents(self, kb_id: str, documents: List[str]):
+        """
+        فهرسة مستندات جديدة في KB محددة (تحديث تدريجي للفهرس).
+
+        :param kb_id: معرف الـ Knowledge Base
+        :param documents: قائمة نصوص (Chunks)
+        """
+        # التحليل (الجزء الأبطأ) خارج القفل؛ قفل الكتابة يخص هذه الـ KB فقط
+        analyzed = [(doc, analyze_text(doc)) for doc in documents]
+
+        with self._locks.write(kb_id):
+            if self.storage:
+                # الدفعة تُفهرس في الذاكرة ثم تُدمج مع النسخة على القرص في commit واحد
+                delta = _KBIndex(self.k1, self.b)
+                for doc, terms in analyzed:
+                    delta.add(doc, terms)
+                if delta.chunks:
+                    self.indexes[kb_id] = self.storage.commit(kb_id, delta, self.k1, self.b)
+                return
+
+            if self.memory.is_spilled(kb_id):
+                self._reload(kb_id)
+            index = self.indexes.get(kb_id)
+            if index is None:
+                index = self.indexes[kb_id] = _KBIndex(self.k1, self.b)
+
+            # كلفة الدفعة بحجمها فقط: df و total_length تراكمية، و IDF / doc_norms
+            # تُحسب عند الاستعلام (انظر _KBIndex)
+            for doc, terms in analyzed:
+                index.add(doc, terms)
+            self.memory.update(kb_id, index.nbytes)
+            self._bump_kb_version(kb_id)
+
+        # خارج قفل الـ KB: الإخراج يأخذ أقفال KBs أخرى (لا تداخل أقفال = لا Deadlock)
+        self._enforce_budget(protect=kb_id)
+
+    def incremental_ingest(self) -> bool:
+        """مع التخزين الدائم كل commit يعيد كتابة ملفات postings / IDF / norms للـ KB كاملة."""
+        return self.storage is None
+
+    def get_kb_version(self, kb_id: str) -> int:
+        """
+        مع التخزين الدائم: رقم الجيل على القرص، فيشمل الـ commits من workers أخرى.
+        بدونه: عداد الإضافات في هذه العملية.
+        """
+        if not self.storage:
+            return super().get_kb_version(kb_id)
+        with self._locks.read(kb_id):
+            index = self._get_index(kb_id)
+        return index.generation if index is not None else 0
+
+    def _get_index(self, kb_id: str):
+        """
+        الفهرس الحالي للـ KB. مع التخزين الدائم، يُعاد فتح الـ KB إذا كتب
+        worker آخر جيلاً أحدث (يُفحص مرة كل reload_interval ثانية على الأكثر).
+        """
+        index = self.indexes.get(kb_id)
+        if not self.storage:
+            return index
+
+        now = time.monotonic()
+        if index is not None and now - self._last_reload_check.get(kb_id, 0.0) < self.reload_interval:
+            return index
+        self._last_reload_check[kb_id] = now
+
+        meta = self.storage.read_meta(kb_id)
+        if meta is not None and (index is None or meta["generation"] != index.generation):
+            index = self.indexes[kb_id] = self.storage.open(kb_id)
+        return index
+
+    # -----------------------------
+    # 💾 ميزانية الذاكرة (Spill / Reload)
+    # -----------------------------
+    def _enforce_budget(self, protect: str) -> None:
+        """إخراج الـ KBs الأقدم استعلاماً إلى القرص حتى يعود الحجم المقيم تحت الميزانية."""
+        for kb_id in self.memory.victims(protect):
+            with self._locks.write(kb_id):
+                index = self.indexes.get(kb_id)
+                if index is None:
+                    continue
+                with span("index.spill"):
+                    self.spill_storage.commit(kb_id, index, self.k1, self.b)
+                del self.indexes[kb_id]
+                self.memory.mark_spilled(kb_id)
+
+    def _reload(self, kb_id: str) -> None:
+        """تحميل KB مُخرجة إلى الذاكرة وحذف نسختها على القرص (يتطلب قفل الكتابة للـ KB)."""
+        t0 = time.perf_counter()
+        with span("index.reload"):
+            source = self.spill_storage.open(kb_id)
+            index = _KBIndex.from_mmap(source, self.k1, self.b)
+            del source
+            shutil.rmtree(self.spill_storage.kb_path(kb_id), ignore_errors=True)
+        self.indexes[kb_id] = index
+        self.memory.mark_reloaded(kb_id, index.nbytes, (time.perf_counter() - t0) * 1000)
+
+    @contextmanager
+    def _reading(self, kb_id: str) -> Iterator[Any]:
+        """قفل القراءة على فهرس الـ KB، مع إعادة تحميلها أولاً إن كانت على القرص."""
+        lock = self._locks.get(kb_id)
+        while True:
+            with span("search.lock_wait"):
+                lock.acquire_read()
+            index = self._get_index(kb_id)
+            if index is not None or not self.memory.is_spilled(kb_id):
+                break
+            # التحميل يحتاج قفل الكتابة؛ قد تُخرج الـ KB مجدداً قبل القراءة فنعيد المحاولة
+            lock.release_read()
+            with lock.write():
+                if self.memory.is_spilled(kb_id):
+                    self._reload(kb_id)
+            self._enforce_budget(protect=kb_id)
+        try:
+            self.memory.touch(kb_id)
+            yield index
+        finally:
+            lock.release_read()
+
+    def memory_stats(self) -> Dict[str, Any]:
+        return self.memory.stats()
+
+    # -----------------------------
+    # 🔍 عملية البحث
+    # -----------------------------
+    def search_batch(self, queries: List[str], kb_id: str, top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """نفس التنفيذ الافتراضي لكن تحت قفل قراءة واحد للدفعة كاملة (الإدخال لا يتخلل الدفعة)."""
+        analyzed = {query: self._analyze(query) for query in dict.fromkeys(queries)}
+        with self._reading(kb_id) as index:
+            unique = {query: self._score(index, terms, top_k) for query, terms in analyzed.items()}
+        return [[dict(result) for result in unique[query]] for query in queries]
+
+    def search(self, query: str, kb_id: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """
+        بحث عبر الفهرس المعكوس:
+        - تطبيع الاستعلام ورفض المواضيع الممنوعة (خاص بـ Demo)
+        - استخراج terms الاستعلام
+        - حساب BM25 من الـ postings الخاصة بها فقط
+        - اختيار أفضل top_k عبر heap (O(n log k) بدلاً من O(n log n))
+
+        :param query: استعلام المستخدم
+        :param kb_id: معرف الـ Knowledge Base
+        :param top_k: عدد النتائج المراد إرجاعها
+        :return: قائمة من النتائج مرتبة تنازلياً: [{"text": "...", "score": 2.41}, ...]
+        """
+        # التطبيع وإزالة كلمات التوقف لا يحتاجان الفهرس، فيتمان خارج القفل
+        query_terms = self._analyze(query)
+        if not query_terms:
+            return []
+
+        with self._reading(kb_id) as index:
+            return self._score(index, query_terms, top_k)
+
+    def _analyze(self, query: str) -> List[str]:
+        """terms الاستعلام، أو قائمة فارغة للمواضيع الممنوعة."""
+        with span("search.analyze"):
+            normalized_query, query_terms = analyze_query(query)
+        if any(topic in normalized_query for topic in self.FORBIDDEN_TOPICS):
+            return []
+        return query_terms
+
+    def _score(self, index, query_terms: List[str], top_k: int) -> List[Dict[str, Any]]:
+        """BM25 وأفضل top_k (يُستدعى تحت قفل القراءة الخاص بالـ KB)."""
+        if index is None or not query_terms:
+            return []
+
+        k1_plus_1 = self.k1 + 1.0
+        doc_norms = index.doc_norms
+
+        with span("search.score"):
+            scores: Dict[int, float] = {}
+            for term in query_terms:
+                entry = index.lookup(term)
+                if entry is None:
+                    continue
+                idf, plist = entry
+                for doc_id, tf in plist:
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * k1_plus_1 / (tf + doc_norms[doc_id])
+
+        # كل مرشح حصل على score > 0 لأن IDF موجبة دائماً
+        with span("search.sort"):
+            top = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [
+                {"text": index.text(doc_id), "score": round(score, 4)}
+                for doc_id, score in top
+            ]
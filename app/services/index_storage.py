@@ -0,0 +1,326 @@
+# app/services/index_storage.py
+"""
+تخزين دائم لفهارس الـ KB على القرص مع تحميل عبر mmap.
+
+تنسيق المجلد لكل KB ({root}/{kb_id مُرمّز}/):
+- chunks.seg   : نصوص الـ chunks بترميز UTF-8 متتالية (append-only)
+- chunks.off   : uint64 × (N + 1) بداية كل chunk داخل chunks.seg (append-only)
+- doclen.u32   : uint32 × N طول كل مستند بعدد الـ terms (append-only)
+- terms-{g}.dat / terms-{g}.off : الـ terms مرتبة حسب بايتات UTF-8 + offsets (uint64 × (V + 1))
+- postings-{g}.off : uint64 × (V + 1) بداية postings كل term
+- postings-{g}.doc / postings-{g}.tf : uint32 لرقم المستند وتكراره
+- idf-{g}.f32 / norms-{g}.f32 : IDF لكل term ومعامل تطبيع الطول لكل مستند (BM25)
+- meta.json    : نقطة الـ commit؛ يحدد الجيل g الحالي وعدد المستندات المعتمد
+
+الملفات بترتيب البايتات الأصلي للجهاز (native endianness). الملفات المعاد كتابتها
+تحمل رقم الجيل في اسمها، لذا لا تتأثر العمليات التي فتحتها بـ mmap قبل commit جديد،
+وعدة عمليات (uvicorn workers) تتشارك نفس صفحات الذاكرة للقراءة فقط.
+"""
+
+import fcntl
+import json
+import math
+import mmap
+import os
+from array import array
+from contextlib import contextmanager
+from typing import Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+
+# الملفات التي يُعاد كتابتها مع كل commit (تحمل رقم الجيل في الاسم)
+_GENERATION_FILES = (
+    "terms-{g}.dat", "terms-{g}.off", "postings-{g}.off",
+    "postings-{g}.doc", "postings-{g}.tf", "idf-{g}.f32", "norms-{g}.f32",
+)
+
+
+def _map_file(path: str) -> Tuple[Optional[mmap.mmap], memoryview]:
+    """فتح ملف للقراءة فقط عبر mmap (الملف الفارغ يعطي memoryview فارغة)."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return None, memoryview(b"")
+        mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    return mapped, memoryview(mapped)
+
+
+class MmapKBIndex:
+    """
+    عرض للقراءة فقط لفهرس KB محفوظ على القرص.
+
+    لا يُحمَّل أي شيء في الذاكرة عند الفتح: البحث عن term يتم بـ binary search
+    مباشرة على الملفات المعيّنة (mmap)، والنصوص تُفك عند طلبها فقط.
+    يوفّر نفس واجهة القراءة الخاصة بالفهرس في الذاكرة (lookup / text / doc_norms).
+    """
+
+    def __init__(self, path: str, meta: dict):
+        self.path = path
+        self.generation: int = meta["generation"]
+        self.n_docs: int = meta["n_docs"]
+        self.total_length: int = meta["total_length"]
+        self.k1: float = meta["k1"]
+        self.b: float = meta["b"]
+
+        # نحتفظ بكائنات mmap حتى تبقى الـ memoryviews صالحة
+        self._maps = []
+        self._segment = self._open("chunks.seg")
+        self._chunk_offsets = self._open("chunks.off").cast("Q")
+        self._doc_lengths = self._open("doclen.u32").cast("I")
+        self._terms_blob = self._open(f"terms-{self.generation}.dat")
+        self._term_offsets = self._open(f"terms-{self.generation}.off").cast("Q")
+        self._postings_offsets = self._open(f"postings-{self.generation}.off").cast("Q")
+        self._postings_docs = self._open(f"postings-{self.generation}.doc").cast("I")
+        self._postings_tf = self._open(f"postings-{self.generation}.tf").cast("I")
+        self._idf = self._open(f"idf-{self.generation}.f32").cast("f")
+        self.doc_norms = self._open(f"norms-{self.generation}.f32").cast("f")
+        self.n_terms = len(self._term_offsets) - 1
+
+    def _open(self, name: str) -> memoryview:
+        mapped, view = _map_file(os.path.join(self.path, name))
+        self._maps.append(mapped)
+        return view
+
+    def _term_at(self, i: int) -> bytes:
+        return bytes(self._terms_blob[self._term_offsets[i]:self._term_offsets[i + 1]])
+
+    def _find(self, term: str) -> int:
+        """Binary search على الـ terms المرتبة؛ يعيد -1 إن لم يوجد."""
+        key = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n_terms and self._term_at(lo) == key else -1
+
+    def lookup(self, term: str) -> Optional[Tuple[float, Iterable[Tuple[int, int]]]]:
+        """:return: (IDF، [(doc_id, tf), ...]) أو None إن لم يوجد الـ term."""
+        i = self._find(term)
+        if i < 0:
+            return None
+        start, end = self._postings_offsets[i], self._postings_offsets[i + 1]
+        return self._idf[i], zip(self._postings_docs[start:end], self._postings_tf[start:end])
+
+    def text(self, doc_id: int) -> str:
+        start, end = self._chunk_offsets[doc_id], self._chunk_offsets[doc_id + 1]
+        return bytes(self._segment[start:end]).decode("utf-8")
+
+    def iter_terms(self) -> Iterator[Tuple[bytes, memoryview, memoryview]]:
+        """كل الـ terms بالترتيب مع شرائح postings الخاصة بها (تُستخدم عند الدمج)."""
+        for i in range(self.n_terms):
+            start, end = self._postings_offsets[i], self._postings_offsets[i + 1]
+            yield self._term_at(i), self._postings_docs[start:end], self._postings_tf[start:end]
+
+    def doc_lengths(self) -> memoryview:
+        return self._doc_lengths[: self.n_docs]
+
+
+class KBIndexStorage:
+    """
+    إدارة مجلدات الفهارس الدائمة: الفتح، قراءة الجيل الحالي، وإضافة دفعات جديدة.
+
+    الكتابة لنفس الـ KB من عدة عمليات محمية بقفل ملف (flock)، والـ commit
+    يصبح مرئياً لحظة استبدال meta.json (os.replace ذري).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def kb_path(self, kb_id: str) -> str:
+        return os.path.join(self.root, quote(kb_id, safe=""))
+
+    def list_kbs(self) -> List[str]:
+        return sorted(
+            unquote(name)
+            for name in os.listdir(self.root)
+            if os.path.exists(os.path.join(self.root, name, META_FILE))
+        )
+
+    def read_meta(self, kb_id: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.kb_path(kb_id), META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def open(self, kb_id: str, retries: int = 3) -> Optional[MmapKBIndex]:
+        """
+        فتح آخر جيل معتمد. إذا حذف commit متزامن ملفات الجيل الذي قرأناه للتو
+        من meta.json، نعيد قراءة meta.json ونحاول مجدداً.
+        """
+        for attempt in range(retries):
+            meta = self.read_meta(kb_id)
+            if meta is None:
+                return None
+            if meta.get("format") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported index format for KB '{kb_id}': {meta.get('format')}")
+            try:
+                return MmapKBIndex(self.kb_path(kb_id), meta)
+            except FileNotFoundError:
+                if attempt == retries - 1:
+                    raise
+        return None
+
+    @contextmanager
+    def _locked(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, LOCK_FILE), "a") as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def commit(self, kb_id: str, delta, k1: float, b: float) -> MmapKBIndex:
+        """
+        دمج دفعة جديدة (فهرس في الذاكرة بأرقام مستندات محلية تبدأ من 0) مع
+        آخر نسخة على القرص، وكتابة جيل جديد.
+
+        - النصوص وأطوال المستندات تُلحق بنهاية الملفات (append-only)
+        - postings القديمة تُنسخ كبايتات مباشرة من الـ mmap دون تحويلها لكائنات Python
+        - IDF ومعاملات الطول تُحسب مرة واحدة لكل commit
+
+        :param delta: فهرس الدفعة الجديدة (chunks / postings / doc_lengths)
+        :return: عرض mmap للجيل الجديد
+        """
+        path = self.kb_path(kb_id)
+        with self._locked(path):
+            base = self.open(kb_id)
+            n_base = base.n_docs if base else 0
+            generation = (base.generation if base else 0) + 1
+
+            self._append_documents(path, base, delta)
+
+            n_docs = n_base + len(delta.doc_lengths)
+            total_length = (base.total_length if base else 0) + delta.total_length
+            avg_length = (total_length / n_docs if n_docs else 0.0) or 1.0
+
+            doc_lengths = list(base.doc_lengths()) if base else []
+            doc_lengths.extend(delta.doc_lengths)
+            norms = array("f", (k1 * (1.0 - b + b * dl / avg_length) for dl in doc_lengths))
+            self._write(path, f"norms-{generation}.f32", norms.tobytes())
+
+            self._write_postings(path, generation, base, delta, n_base, n_docs)
+
+            meta = {
+                "format": FORMAT_VERSION,
+                "generation": generation,
+                "n_docs": n_docs,
+                "total_length": total_length,
+                "k1": k1,
+                "b": b,
+            }
+            tmp = os.path.join(path, META_FILE + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, os.path.join(path, META_FILE))
+
+            # العمليات التي ما زالت تقرأ الجيل القديم تحتفظ بصفحاتها حتى تغلقها
+            if base:
+                for pattern in _GENERATION_FILES:
+                    try:
+                        os.remove(os.path.join(path, pattern.format(g=base.generation)))
+                    except FileNotFoundError:
+                        pass
+
+            return MmapKBIndex(path, meta)
+
+    @staticmethod
+    def _write(path: str, name: str, data: bytes) -> None:
+        with open(os.path.join(path, name), "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _append_documents(path: str, base: Optional[MmapKBIndex], delta) -> None:
+        """إلحاق نصوص الدفعة؛ أي بيانات بعد آخر commit (كتابة منقطعة) تُقتطع أولاً."""
+        n_base = base.n_docs if base else 0
+        segment_size = base._chunk_offsets[n_base] if base else 0
+
+        encoded = [chunk.encode("utf-8") for chunk in delta.chunks]
+        offsets = array("Q")
+        position = segment_size
+        for data in encoded:
+            position += len(data)
+            offsets.append(position)
+
+        for name, keep, payload in (
+            ("chunks.seg", segment_size, b"".join(encoded)),
+            ("chunks.off", (n_base + 1) * 8 if base else 0,
+             (offsets if base else array("Q", [0]) + offsets).tobytes()),
+            ("doclen.u32", n_base * 4, array("I", delta.doc_lengths).tobytes()),
+        ):
+            file_path = os.path.join(path, name)
+            with open(file_path, "r+b" if os.path.exists(file_path) else "wb") as f:
+                f.truncate(keep)
+                f.seek(keep)
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _write_postings(
+        self, path: str, generation: int, base: Optional[MmapKBIndex], delta, n_base: int, n_docs: int
+    ) -> None:
+        """دمج terms القديمة (مرتبة) مع terms الدفعة في ملفات جيل جديد."""
+        delta_terms = sorted((term.encode("utf-8"), term) for term in delta.postings)
+        base_terms = base.iter_terms() if base else iter(())
+
+        term_offsets, postings_offsets = array("Q", [0]), array("Q", [0])
+        idf = array("f")
+        names = {key: os.path.join(path, f"{key}-{generation}") for key in ("terms", "postings")}
+
+        with open(names["terms"] + ".dat", "wb") as terms_file, \
+                open(names["postings"] + ".doc", "wb") as docs_file, \
+                open(names["postings"] + ".tf", "wb") as tf_file:
+
+            def emit(term_bytes: bytes, parts: List[Tuple[bytes, bytes]], df: int) -> None:
+                terms_file.write(term_bytes)
+                term_offsets.append(term_offsets[-1] + len(term_bytes))
+                for docs, tfs in parts:
+                    docs_file.write(docs)
+                    tf_file.write(tfs)
+                postings_offsets.append(postings_offsets[-1] + df)
+                idf.append(math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)))
+
+            def delta_part(term: str) -> Tuple[bytes, bytes, int]:
+                plist = delta.postings[term]
+                docs = array("I", (n_base + doc_id for doc_id, _ in plist))
+                tfs = array("I", (tf for _, tf in plist))
+                return docs.tobytes(), tfs.tobytes(), len(plist)
+
+            current = next(base_terms, None)
+            i = 0
+            while current is not None or i < len(delta_terms):
+                if current is not None and (i >= len(delta_terms) or current[0] <= delta_terms[i][0]):
+                    term_bytes, docs, tfs = current
+                    parts, df = [(docs, tfs)], len(docs)
+                    if i < len(delta_terms) and delta_terms[i][0] == term_bytes:
+                        new_docs, new_tfs, new_df = delta_part(delta_terms[i][1])
+                        parts.append((new_docs, new_tfs))
+                        df += new_df
+                        i += 1
+                    emit(term_bytes, parts, df)
+                    current = next(base_terms, None)
+                else:
+                    term_bytes, term = delta_terms[i]
+                    new_docs, new_tfs, new_df = delta_part(term)
+                    emit(term_bytes, [(new_docs, new_tfs)], new_df)
+                    i += 1
+
+            for f in (terms_file, docs_file, tf_file):
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._write(path, f"terms-{generation}.off", term_offsets.tobytes())
+        self._write(path, f"postings-{generation}.off", postings_offsets.tobytes())
+        self._write(path, f"idf-{generation}.f32", idf.tobytes())
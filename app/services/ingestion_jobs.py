@@ -0,0 +1,309 @@
+# app/services/ingestion_jobs.py
+"""
+مهام الإدخال في الخلفية (Background Ingestion Jobs).
+
+نقطة الرفع تحفظ الملف في ملف مؤقت وتضيف مهمة إلى طابور داخل العملية
+(queue.Queue) ثم تعود فوراً بـ 202. مجموعة عمّال (threads) تسحب المهام:
+تقرأ الملف على دفعات، تنظف وتقسم النص (عبر الـ heavy executor إن وُجد)،
+وتفهرس كل دفعة chunks فور جاهزيتها، مع تحديث تقدم المهمة أولاً بأول.
+إذا كان add_documents يعيد كتابة فهرس الـ KB كاملاً (الفهرس الدائم على القرص،
+incremental_ingest = False) تُجمع chunks الملف وتُفهرس في commit واحد للمهمة.
+
+مهام الإدخال الجماعي (Bulk): عدة ملفات و/أو أرشيفات zip/tar في مهمة واحدة.
+المستندات تُقسم بالتوازي على الـ executor ثم تُفهرس في استدعاء add_documents
+واحد، فتُحدّث إحصاءات الـ corpus (df/avgdl/الإصدار) مرة واحدة بدلاً من مرة لكل ملف.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.core.tracing import current_trace, span, trace
+from app.services.ingestion_service import ARCHIVE_ERRORS, IngestionService
+from app.services.search_service import BaseSearchService
+
+logger = logging.getLogger("mrag_service")
+
+
+class IngestionJob:
+    """حالة مهمة إدخال واحدة: queued → running → completed / failed."""
+
+    __slots__ = (
+        "job_id", "kb_id", "filename", "path", "status", "bytes_total", "bytes_read",
+        "chunks_indexed", "error", "created_at", "started_at", "finished_at", "sources", "files",
+        "request_id",
+    )
+
+    def __init__(
+        self,
+        kb_id: str,
+        path: Optional[str],
+        filename: Optional[str],
+        bytes_total: int,
+        sources: Optional[List[Tuple[str, Optional[str]]]] = None,
+    ):
+        self.job_id = uuid.uuid4().hex
+        self.kb_id = kb_id
+        self.filename = filename
+        self.path = path
+        self.status = "queued"
+        self.bytes_total = bytes_total
+        self.bytes_read = 0
+        self.chunks_indexed = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # الملفات المؤقتة للمهمة: [(المسار، الاسم الأصلي)]
+        self.sources = sources if sources is not None else [(path, filename)]
+        # المهام الجماعية فقط: نتيجة كل مستند {filename, bytes, chunks, error}
+        self.files: Optional[List[Dict[str, Any]]] = [] if sources is not None else None
+        # X-Request-ID لطلب الرفع: تتبع المهمة يُربط به
+        active = current_trace()
+        self.request_id: Optional[str] = active.trace_id if active is not None else None
+
+    @property
+    def bulk(self) -> bool:
+        return self.files is not None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """نسخة قابلة للتحويل إلى JSON من حالة المهمة (تُعرض في GET /kb/jobs/{job_id})."""
+        now = time.time()
+        started = self.started_at
+        elapsed = ((self.finished_at or now) - started) if started else 0.0
+        # الإنتاجية على حجم النص الفعلي (بعد فك الأرشيف في المهام الجماعية)
+        text_bytes = sum(f["bytes"] for f in self.files) if self.bulk else self.bytes_read
+        return {
+            "job_id": self.job_id,
+            "kb_id": self.kb_id,
+            "filename": self.filename,
+            "status": self.status,
+            "bytes_total": self.bytes_total,
+            "bytes_read": self.bytes_read,
+            "chunks_indexed": self.chunks_indexed,
+            "error": self.error,
+            # زمن الانتظار في الطابور وزمن المعالجة (حتى الآن إن لم تنتهِ)
+            "queue_ms": round(((started or now) - self.created_at) * 1000, 2),
+            "duration_ms": round(elapsed * 1000, 2),
+            "files": [dict(f) for f in self.files] if self.bulk else None,
+            "mb_per_s": round(text_bytes / (1024 * 1024) / elapsed, 6) if elapsed > 0 else 0.0,
+            "chunks_per_s": round(self.chunks_indexed / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+
+class _ProgressReader:
+    """غلاف حول الملف يحدّث bytes_read للمهمة مع كل قراءة."""
+
+    def __init__(self, fileobj, job: IngestionJob):
+        self.fileobj = fileobj
+        self.job = job
+
+    def read(self, size: int = -1) -> bytes:
+        block = self.fileobj.read(size)
+        self.job.bytes_read += len(block)
+        return block
+
+
+class IngestionJobQueue:
+    """
+    طابور مهام الإدخال مع مجموعة عمّال ثابتة.
+
+    - العمّال threads (وليسوا عمليات) لأن الفهرسة تعدّل حالة خدمة البحث داخل العملية؛
+      الجزء الحسابي المستقل (تنظيف PII والتقسيم) يُرسل إلى executor إن مُرّر
+    - العمّال يُنشؤون عند أول مهمة (lazy)
+    - تُحفظ حالة آخر max_finished مهمة منتهية فقط
+    - المهام الجماعية (submit_bulk) تُقسم مستنداتها بالتوازي وتُفهرس مرة واحدة
+    """
+
+    def __init__(
+        self,
+        ingestion_service: IngestionService,
+        search_service: BaseSearchService,
+        workers: int = 2,
+        executor=None,
+        max_finished: int = 1000,
+        max_document_bytes: Optional[int] = None,
+    ):
+        self.ingestion_service = ingestion_service
+        self.search_service = search_service
+        self.workers = workers
+        self.executor = executor
+        self.max_finished = max_finished
+        # الحد الأقصى لحجم المستند الواحد داخل الأرشيفات (بعد فك الضغط)
+        self.max_document_bytes = max_document_bytes
+
+        self._queue: "queue.Queue[Optional[IngestionJob]]" = queue.Queue()
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    # -----------------------------
+    # 📥 إضافة ومتابعة المهام
+    # -----------------------------
+    def submit(self, kb_id: str, path: str, filename: Optional[str], bytes_total: int) -> IngestionJob:
+        """
+        إضافة مهمة لفهرسة ملف محفوظ مسبقاً. الملف يُحذف بعد انتهاء المهمة.
+
+        :param kb_id: معرف الـ Knowledge Base
+        :param path: مسار الملف المؤقت
+        :param filename: اسم الملف الأصلي (للعرض فقط)
+        :param bytes_total: حجم الملف بالبايت
+        :return: المهمة الجديدة (بحالة queued)
+        """
+        return self._enqueue(IngestionJob(kb_id, path, filename, bytes_total))
+
+    def submit_bulk(self, kb_id: str, sources: List[Tuple[str, Optional[str], int]]) -> IngestionJob:
+        """
+        إضافة مهمة إدخال جماعي لعدة ملفات محفوظة مسبقاً (نصوص أو أرشيفات zip/tar).
+        كل الـ chunks تُفهرس في دفعة واحدة في النهاية. الملفات تُحذف بعد انتهاء المهمة.
+
+        :param kb_id: معرف الـ Knowledge Base
+        :param sources: قائمة (مسار الملف المؤقت، اسم الملف الأصلي، الحجم بالبايت)
+        :return: المهمة الجديدة (بحالة queued)
+        """
+        job = IngestionJob(
+            kb_id, None, None,
+            bytes_total=sum(size for _, _, size in sources),
+            sources=[(path, filename) for path, filename, _ in sources],
+        )
+        return self._enqueue(job)
+
+    def _enqueue(self, job: IngestionJob) -> IngestionJob:
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._start_workers()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        counts["workers"] = len(self._threads)
+        return counts
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """إيقاف العمّال بعد إنهاء المهمة الحالية لكل منهم (المهام المتبقية في الطابور تُهمل)."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout)
+
+    # -----------------------------
+    # ⚙️ العمّال
+    # -----------------------------
+    def _start_workers(self) -> None:
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"mrag-ingest-{len(self._threads)}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker_loop(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            # تتبع لكل مهمة بمعرف طلب الرفع نفسه، فيظهر بجانب تتبع الطلب في /debug/traces
+            kind = "ingestion_bulk" if job.bulk else "ingestion_job"
+            with trace(job.request_id or job.job_id, f"{kind} {job.job_id}"):
+                self._run(job)
+
+    def _run(self, job: IngestionJob) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        status = "failed"
+        try:
+            if job.bulk:
+                self._run_bulk(job)
+            else:
+                self._run_file(job)
+            status = "completed"
+        except Exception as e:
+            logger.error(f"❌ Ingestion job {job.job_id} failed: {e}", exc_info=True)
+            job.error = str(e)
+        finally:
+            for path, _ in job.sources:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            # finished_at قبل الحالة: من يرى completed يرى المدة النهائية
+            job.finished_at = time.time()
+            job.status = status
+            self._evict_finished()
+
+    def _run_file(self, job: IngestionJob) -> None:
+        """
+        ملف واحد: فهرسة كل دفعة فور جاهزيتها، إلا إذا كان الـ commit يكلف حجم الـ KB كاملة
+        (incremental_ingest = False، مثل الفهرس الدائم): عندها commit واحد للمهمة، مثل _run_bulk.
+        """
+        incremental = self.search_service.incremental_ingest()
+        pending: List[str] = []
+        with open(job.path, "rb") as f:
+            reader = _ProgressReader(f, job)
+            for batch in self.ingestion_service.iter_file_chunks(reader, executor=self.executor):
+                if not incremental:
+                    pending.extend(batch)
+                    continue
+                with span("index.add"):
+                    self.search_service.add_documents(job.kb_id, batch)
+                job.chunks_indexed += len(batch)
+        if pending:
+            with span("index.add"):
+                self.search_service.add_documents(job.kb_id, pending)
+            job.chunks_indexed = len(pending)
+
+    def _run_bulk(self, job: IngestionJob) -> None:
+        """
+        تقسيم كل المستندات بالتوازي ثم فهرستها في استدعاء add_documents واحد.
+        المستند الفاشل (نوع غير مدعوم، حجم زائد، ترميز غير صالح) يُسجل في files ولا يوقف المهمة.
+        """
+        chunks: List[str] = []
+        documents = self._iter_bulk_documents(job)
+        for name, size, doc_chunks, error in self.ingestion_service.iter_document_chunks(
+            documents, executor=self.executor
+        ):
+            job.files.append({"filename": name, "bytes": size, "chunks": len(doc_chunks), "error": error})
+            chunks.extend(doc_chunks)
+
+        if chunks:
+            with span("index.add"):
+                self.search_service.add_documents(job.kb_id, chunks)
+        job.chunks_indexed = len(chunks)
+
+    def _iter_bulk_documents(self, job: IngestionJob) -> Iterator[Tuple[str, Optional[bytes], Optional[str]]]:
+        for path, filename in job.sources:
+            try:
+                yield from self.ingestion_service.iter_documents(
+                    path, filename, max_bytes=self.max_document_bytes
+                )
+            except ARCHIVE_ERRORS as e:
+                # أرشيف تالف: يُسجل كملف فاشل ويُكمل الباقي
+                yield filename or os.path.basename(path), None, f"Unreadable archive: {e}"
+            job.bytes_read += os.path.getsize(path)
+
+    def _evict_finished(self) -> None:
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.done]
+            for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+                del self._jobs[job_id]
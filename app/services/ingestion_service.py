@@ -1,30 +1,256 @@
+import codecs
+import lzma
+import os
 import re
-from typing import List
+import tarfile
+import tempfile
+import zipfile
+import zlib
+from functools import partial
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
 from fastapi import UploadFile
 
+from app.core.tracing import span
+
+# PII patterns, compiled once
+_EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+_PHONE_RE = re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b')
+
+
+def clean_pii(text: str) -> str:
+    # Remove Emails
+    text = _EMAIL_RE.sub('[EMAIL_REDACTED]', text)
+    # Remove Phone Numbers (Simple pattern)
+    text = _PHONE_RE.sub('[PHONE_REDACTED]', text)
+    return text
+
+
+def clean_and_split(text: str) -> List[str]:
+    """
+    The CPU-heavy step of ingestion: PII redaction + word split of one block.
+    Module-level (picklable) so it can run in the process pool.
+    """
+    return clean_pii(text).split()
+
+
+def chunk_document(
+    item: Tuple[str, Optional[bytes], Optional[str]], chunk_size: int, chunk_overlap: int
+) -> Tuple[str, int, List[str], Optional[str]]:
+    """
+    Whole-document path used by bulk ingestion: decode + clean + chunk one
+    (name, data, error) item. Returns (name, size, chunks, error); failures are
+    returned rather than raised so one bad file does not abort the batch.
+    Module-level (picklable) so it can run in the process pool.
+    """
+    name, data, error = item
+    if error is not None or data is None:
+        return name, 0, [], error
+    try:
+        words = clean_and_split(data.decode("utf-8"))
+    except UnicodeDecodeError:
+        return name, len(data), [], "File is not valid UTF-8 text."
+    step = chunk_size - chunk_overlap
+    chunks = [" ".join(words[i:i + chunk_size]) for i in range(0, len(words), step)]
+    return name, len(data), chunks, None
+
+
+# Errors raised while reading a damaged archive or one of its members: bad
+# headers/CRCs, truncated or corrupt compressed streams (deflate, gzip, bz2, xz)
+ARCHIVE_ERRORS = (OSError, EOFError, zlib.error, lzma.LZMAError, zipfile.BadZipFile, tarfile.TarError)
+
+
+def is_archive(filename: Optional[str]) -> bool:
+    """True for the archive formats accepted by bulk ingestion (.zip, .tar, .tar.gz, .tgz)."""
+    lower = (filename or "").lower()
+    return lower.endswith((".zip", ".tar", ".tar.gz", ".tgz"))
+
+
+class FileTooLargeError(Exception):
+    """Raised when a streamed upload exceeds the configured size limit."""
+
+
+class _ChunkStream:
+    """
+    Incremental decoder + PII cleaner + chunker.
+
+    Bytes are decoded with an incremental UTF-8 decoder, so multi-byte Arabic
+    characters split across blocks are reassembled. Text is only cleaned up to
+    the last whitespace of each block (emails/phones never contain whitespace),
+    and chunks are emitted as soon as a full window of words is available.
+    The output is identical to `_clean_pii` + `_create_chunks` on the whole text.
+    """
+
+    def __init__(self, service: "IngestionService"):
+        self.service = service
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.carry = ""
+        self.words: List[str] = []
+
+    def feed(self, data: bytes, final: bool = False) -> List[str]:
+        return self.push(clean_and_split(self.take(data, final)), final)
+
+    def take(self, data: bytes, final: bool) -> str:
+        """Decodes a block and returns the text that is safe to clean (up to the last whitespace)."""
+        text = self.carry + self.decoder.decode(data, final)
+        if final:
+            ready, self.carry = text, ""
+            return ready
+        cut = max(text.rfind(" "), text.rfind("\n"), text.rfind("\t"), text.rfind("\r"))
+        if cut < 0:
+            self.carry = text
+            return ""
+        ready, self.carry = text[:cut + 1], text[cut + 1:]
+        return ready
+
+    def push(self, words: List[str], final: bool) -> List[str]:
+        """Appends cleaned words and returns every chunk that is now complete."""
+        self.words.extend(words)
+        size = self.service.chunk_size
+        step = self.service.chunk_size - self.service.chunk_overlap
+        chunks = []
+        while len(self.words) >= size or (final and self.words):
+            chunks.append(" ".join(self.words[:size]))
+            del self.words[:step]
+        return chunks
+
+
 class IngestionService:
     def __init__(self):
         self.chunk_size = 500
         self.chunk_overlap = 50
+        # Streaming parameters
+        self.block_size = 64 * 1024
+        self.batch_size = 256
 
-    async def process_file(self, file: UploadFile) -> List[str]:
-        """Reads, cleans, and chunks the uploaded file."""
-        content = await file.read()
-        text = content.decode("utf-8")
-        
-        # 1. PII Cleaning (Simple Regex for Emails & Phones)
-        text = self._clean_pii(text)
-        
-        # 2. Chunking
-        chunks = self._create_chunks(text)
-        return chunks
+    async def spool_upload(
+        self, file: UploadFile, max_bytes: Optional[int] = None, directory: Optional[str] = None
+    ) -> Tuple[str, int]:
+        """
+        Copies the upload to a private temporary file in blocks so it can be
+        processed after the request has finished (background ingestion).
+
+        Returns (path, size). Raises FileTooLargeError once more than `max_bytes`
+        have been read; the partial file is removed.
+        """
+        fd, path = tempfile.mkstemp(prefix="mrag-upload-", suffix=".txt", dir=directory)
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    block = await file.read(self.block_size)
+                    if not block:
+                        break
+                    size += len(block)
+                    if max_bytes is not None and size > max_bytes:
+                        raise FileTooLargeError(f"Upload exceeds {max_bytes} bytes.")
+                    out.write(block)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, size
+
+    def iter_file_chunks(self, fileobj: BinaryIO, executor=None) -> Iterator[List[str]]:
+        """
+        Streams a local binary file (a spooled upload, read by the background
+        ingestion workers) in fixed-size blocks and yields batches of up to
+        `batch_size` cleaned chunks, keeping memory flat regardless of file size.
+
+        If an `executor` (app.core.executors.InstrumentedExecutor) is given, the
+        PII redaction of each block runs on it instead of the calling thread.
+        """
+        stream = _ChunkStream(self)
+        pending: List[str] = []
+
+        while True:
+            with span("ingest.read"):
+                block = fileobj.read(self.block_size)
+            final = not block
+            with span("ingest.clean"):
+                ready = stream.take(block, final)
+                if not ready:
+                    words = []
+                elif executor is not None:
+                    words = executor.call(clean_and_split, ready)
+                else:
+                    words = clean_and_split(ready)
+            with span("ingest.chunk"):
+                pending.extend(stream.push(words, final))
+            while len(pending) >= self.batch_size:
+                yield pending[:self.batch_size]
+                pending = pending[self.batch_size:]
+
+            if final:
+                break
+
+        if pending:
+            yield pending
+
+    def iter_documents(
+        self, path: str, filename: Optional[str], max_bytes: Optional[int] = None
+    ) -> Iterator[Tuple[str, Optional[bytes], Optional[str]]]:
+        """
+        Yields (name, data, error) for every document in a spooled upload.
+        Archives are expanded member by member (only .txt members are read);
+        any other file is treated as a single plain-text document (its type is
+        validated by the endpoint). Documents
+        larger than `max_bytes` are reported with an error instead of read, and
+        so are archive members that fail to decompress. Errors in the archive
+        itself (`ARCHIVE_ERRORS`) propagate to the caller.
+        """
+        name = filename or os.path.basename(path)
+        lower = name.lower()
+        if lower.endswith(".zip"):
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        yield self._read_member(
+                            f"{name}/{info.filename}", info.file_size, lambda: archive.open(info), max_bytes
+                        )
+        elif is_archive(lower):
+            with tarfile.open(path, "r:*") as archive:
+                for member in archive:
+                    if member.isfile():
+                        yield self._read_member(
+                            f"{name}/{member.name}", member.size, lambda: archive.extractfile(member), max_bytes
+                        )
+        else:
+            yield self._read_member(name, os.path.getsize(path), lambda: open(path, "rb"), max_bytes, plain=True)
+
+    def _read_member(self, name: str, size: int, opener, max_bytes: Optional[int], plain: bool = False):
+        with span("ingest.read"):
+            return self._read_member_data(name, size, opener, max_bytes, plain)
+
+    def _read_member_data(self, name: str, size: int, opener, max_bytes: Optional[int], plain: bool):
+        if not plain and not name.lower().endswith(".txt"):
+            return name, None, "Only .txt files are supported."
+        if max_bytes is not None and size > max_bytes:
+            return name, None, f"File exceeds {max_bytes} bytes."
+        try:
+            with opener() as f:
+                # The declared size comes from the archive header; never trust it for the read itself
+                data = f.read() if max_bytes is None else f.read(max_bytes + 1)
+        except ARCHIVE_ERRORS as e:
+            if plain:
+                raise
+            return name, None, f"Corrupt archive member: {e}"
+        if max_bytes is not None and len(data) > max_bytes:
+            return name, None, f"File exceeds {max_bytes} bytes."
+        return name, data, None
+
+    def iter_document_chunks(
+        self, documents: Iterable[Tuple[str, Optional[bytes], Optional[str]]], executor=None
+    ) -> Iterator[Tuple[str, int, List[str], Optional[str]]]:
+        """
+        Chunks whole documents in parallel on `executor` (in input order) and
+        yields `chunk_document` results. Without an executor, runs inline.
+        """
+        fn = partial(chunk_document, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        if executor is None:
+            return map(fn, documents)
+        return executor.map(fn, documents)
 
     def _clean_pii(self, text: str) -> str:
-        # Remove Emails
-        text = re.sub(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', '[EMAIL_REDACTED]', text)
-        # Remove Phone Numbers (Simple pattern)
-        text = re.sub(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b', '[PHONE_REDACTED]', text)
-        return text
+        return clean_pii(text)
 
     def _create_chunks(self, text: str) -> List[str]:
         # Simple split by words for now
@@ -34,5 +260,5 @@ class IngestionService:
             chunk = " ".join(words[i:i + self.chunk_size])
             chunks.append(chunk)
         return chunks
-    
-    
\ No newline at end of file
+
+
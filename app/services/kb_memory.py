@@ -0,0 +1,97 @@
+# app/services/kb_memory.py
+"""
+محاسبة ذاكرة الـ Knowledge Bases المقيمة، واختيار الـ KBs الباردة للإخراج إلى القرص.
+
+المدير لا يلمس الفهارس نفسها: المحرك (InvertedIndexSearchService) يبلغه بحجم كل KB
+بعد الإدخال، وبكل استعلام (LRU)، ويسأله عن الضحايا عند تجاوز الميزانية، ثم يبلغه
+بنتيجة الإخراج (spill) أو إعادة التحميل (reload).
+"""
+
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+
+class KBMemoryManager:
+    """
+    :param budget_bytes: أقصى حجم تقديري للـ KBs المقيمة في الذاكرة (0 = بدون حد، محاسبة فقط)
+    """
+
+    def __init__(self, budget_bytes: int = 0):
+        self.budget_bytes = budget_bytes
+        # البنية: {kb_id: الحجم بالبايت} بترتيب الاستخدام (الأحدث في النهاية)
+        self._resident: "OrderedDict[str, int]" = OrderedDict()
+        self._resident_bytes = 0
+        self._spilled = set()
+        self._lock = threading.Lock()
+
+        self.spills = 0
+        self.reloads = 0
+        self._reload_ms: Deque[float] = deque(maxlen=256)
+
+    # -----------------------------
+    # 📝 تحديث الحالة
+    # -----------------------------
+    def touch(self, kb_id: str) -> None:
+        """استعلام على الـ KB: تصبح الأحدث استخداماً."""
+        with self._lock:
+            if kb_id in self._resident:
+                self._resident.move_to_end(kb_id)
+
+    def update(self, kb_id: str, nbytes: int) -> None:
+        """الحجم الجديد للـ KB بعد الإدخال (وهي مقيمة والأحدث استخداماً)."""
+        with self._lock:
+            self._resident_bytes += nbytes - self._resident.pop(kb_id, 0)
+            self._resident[kb_id] = nbytes
+            self._spilled.discard(kb_id)
+
+    def is_spilled(self, kb_id: str) -> bool:
+        return kb_id in self._spilled
+
+    def mark_spilled(self, kb_id: str) -> None:
+        with self._lock:
+            self._resident_bytes -= self._resident.pop(kb_id, 0)
+            self._spilled.add(kb_id)
+            self.spills += 1
+
+    def mark_reloaded(self, kb_id: str, nbytes: int, elapsed_ms: float) -> None:
+        self.update(kb_id, nbytes)
+        with self._lock:
+            self.reloads += 1
+            self._reload_ms.append(elapsed_ms)
+
+    # -----------------------------
+    # 🧹 اختيار الضحايا
+    # -----------------------------
+    def victims(self, protect: Optional[str] = None) -> List[str]:
+        """
+        الـ KBs الأقدم استخداماً التي يكفي إخراجها للعودة تحت الميزانية.
+        protect (الـ KB التي تُستخدم الآن) لا تُخرج أبداً، حتى لو تجاوزت الميزانية وحدها.
+        """
+        if not self.budget_bytes:
+            return []
+        with self._lock:
+            excess = self._resident_bytes - self.budget_bytes
+            chosen = []
+            for kb_id, nbytes in self._resident.items():
+                if excess <= 0:
+                    break
+                if kb_id == protect:
+                    continue
+                chosen.append(kb_id)
+                excess -= nbytes
+            return chosen
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            reload_ms = list(self._reload_ms)
+            return {
+                "budget_bytes": self.budget_bytes,
+                "resident_bytes": self._resident_bytes,
+                "resident_kbs": len(self._resident),
+                "spilled_kbs": len(self._spilled),
+                "spills": self.spills,
+                "reloads": self.reloads,
+                "reload_ms_avg": round(sum(reload_ms) / len(reload_ms), 3) if reload_ms else 0.0,
+                "reload_ms_max": round(max(reload_ms), 3) if reload_ms else 0.0,
+            }
@@ -1,20 +1,309 @@
+import asyncio
+import json
 import logging
+import random
+import re
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+
+import httpx
+
+from app.core.metrics import metrics
+from app.core.tracing import span
 
 logger = logging.getLogger("mrag_service")
 
+# الإجابة عند فشل التوليد نهائياً (تحتوي "Error" فتُعامل كفشل في نقاط الدردشة)
+LLM_ERROR_ANSWER = "Error generating answer."
+# الإجابة عند عدم وجود أي مرشح في الاستجابة (مثلاً حُجبت بفلاتر المزود)
+NO_ANSWER = "I don't have enough information."
+
 class BaseLLMService(ABC):
     @abstractmethod
     async def generate_answer(self, query: str, context: List[Dict]) -> str:
         pass
 
+    async def stream_answer(self, query: str, context: List[Dict]) -> AsyncIterator[str]:
+        """
+        توليد الإجابة كأجزاء متتالية (Tokens) لبثها للعميل فور توليدها.
+        التنفيذ الافتراضي يولد الإجابة كاملة ثم يقسمها إلى كلمات؛ الخدمات التي
+        تدعم البث من المزود تعيد تعريفه. دمج الأجزاء يعطي نفس نص generate_answer.
+        """
+        answer = await self.generate_answer(query, context)
+        for token in re.findall(r"\s*\S+\s*", answer):
+            yield token
+
+    async def aclose(self) -> None:
+        """تحرير الموارد (الاتصالات المفتوحة) عند إغلاق التطبيق."""
+
+
+def build_prompt(query: str, context: List[Dict]) -> str:
+    # تجميع السياق
+    context_text = "\n\n".join([c.get("text", "") for c in context])
+    return f"""
+        You are a helpful AI assistant. Answer the user's question based ONLY on the context below.
+        If the answer is not in the context, say "I don't have enough information."
+
+        Context:
+        ---
+        {context_text}
+        ---
+
+        Question: {query}
+
+        Answer:
+        """
+
+
+class _RetryableError(Exception):
+    """خطأ مؤقت من المزود (انقطاع، مهلة، 429، 5xx) تجوز إعادة المحاولة بعده."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class HTTPLLMService(BaseLLMService):
+    """
+    خدمة LLM حقيقية عبر Gemini REST API (generateContent / streamGenerateContent).
+
+    الخصائص:
+    - عميل httpx.AsyncClient واحد مشترك بين كل الطلبات (Keep-Alive + Connection Pool)
+    - مهلة لكل طلب (اتصال / قراءة)
+    - Semaphore يحدد أقصى عدد توليدات متزامنة لدى المزود
+    - إعادة المحاولة للأخطاء المؤقتة مع Exponential Backoff عشوائي (Full Jitter)،
+      ويُحترم Retry-After إن أرسله المزود. الـ Semaphore لا يُحجز أثناء الانتظار
+      ولا أثناء انتظار مستهلك البث
+    - تسجيل استهلاك التوكنات في سجل المقاييس (total_input_tokens / total_output_tokens)
+
+    transport: لتمرير httpx.MockTransport أو خادم محلي بديل في الاختبارات.
+    """
+
+    RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://generativelanguage.googleapis.com/v1beta",
+        model: str = "gemini-1.5-flash",
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        max_connections: int = 20,
+        max_concurrency: int = 8,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.transport = transport
+        # إعدادات التوليد (لضمان الثبات)
+        self.generation_config = {"temperature": 0.1, "topP": 0.95, "topK": 40, "maxOutputTokens": 512}
+
+        # العميل والـ Semaphore مرتبطان بحلقة الأحداث، فيُنشآن عند أول استخدام داخلها
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        logger.info(f"✅ HTTP LLM Service initialized (model: {model}).")
+
+    # -----------------------------
+    # ⚙️ العميل المشترك
+    # -----------------------------
+    def _get_client(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # حلقة أحداث جديدة (مثلاً في الاختبارات): اتصالات الحلقة القديمة غير صالحة فيها
+            if self._client is not None:
+                self._close_on_loop(self._client, self._loop)
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                headers={"x-goog-api-key": self.api_key},
+                transport=self.transport,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client, self._semaphore
+
+    @staticmethod
+    def _close_on_loop(client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        إغلاق عميل حلقة سابقة على حلقته (مقابسه مسجلة فيها)، ولو كانت تعمل في thread آخر.
+        إن أُغلقت الحلقة فلا يمكن إغلاق مقابسها عبرها؛ تُغلق مع جمع العميل (GC).
+        """
+        if loop.is_closed():
+            return
+        loop.call_soon_threadsafe(loop.create_task, client.aclose())
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _check_status(self, response: httpx.Response) -> None:
+        if response.status_code in self.RETRY_STATUSES:
+            retry_after = response.headers.get("Retry-After")
+            raise _RetryableError(
+                f"HTTP {response.status_code}",
+                float(retry_after) if retry_after and retry_after.isdigit() else None,
+            )
+        response.raise_for_status()
+
+    def _payload(self, query: str, context: List[Dict]) -> Tuple[str, Dict[str, Any]]:
+        prompt = build_prompt(query, context)
+        return prompt, {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": self.generation_config,
+        }
+
+    # -----------------------------
+    # 🤖 التوليد
+    # -----------------------------
+    async def generate_answer(self, query: str, context: List[Dict]) -> str:
+        with span("llm.prompt"):
+            prompt, payload = self._payload(query, context)
+        client, semaphore = self._get_client()
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                with span("llm.semaphore_wait"):
+                    await semaphore.acquire()
+                try:
+                    with span("llm.request"):
+                        response = await client.post(f"/models/{self.model}:generateContent", json=payload)
+                    self._check_status(response)
+                finally:
+                    semaphore.release()
+                data = response.json()
+                answer = _candidate_text(data).strip() or NO_ANSWER
+                _record_usage(data.get("usageMetadata"), prompt, answer)
+                return answer
+            except (_RetryableError, httpx.TransportError) as e:
+                if attempt == self.max_retries:
+                    logger.error(f"❌ LLM generation failed after {attempt + 1} attempts: {e}")
+                    return LLM_ERROR_ANSWER
+                delay = self._backoff(attempt, getattr(e, "retry_after", None))
+                metrics.inc("llm_retries")
+                logger.warning(f"⚠️ LLM call failed ({e}); retrying in {delay:.2f}s")
+                with span("llm.backoff"):
+                    await asyncio.sleep(delay)
+            except Exception as e:
+                # أخطاء غير مؤقتة (4xx، استجابة غير صالحة): لا فائدة من إعادة المحاولة
+                logger.error(f"❌ Gemini Generation Error: {e}")
+                return LLM_ERROR_ANSWER
+        return LLM_ERROR_ANSWER
+
+    async def stream_answer(self, query: str, context: List[Dict]) -> AsyncIterator[str]:
+        """
+        بث الإجابة من المزود (streamGenerateContent بصيغة SSE). إعادة المحاولة ممكنة
+        فقط قبل وصول أول جزء؛ بعده يُنهى البث بـ LLM_ERROR_ANSWER عند الفشل.
+
+        القراءة من المزود في task منفصلة تضع الأجزاء في طابور، فيُحجز الـ Semaphore
+        لمدة الطلب عند المزود فقط، وليس أثناء انتظار مستهلك بطيء (عميل SSE).
+        """
+        parts: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        pump = asyncio.create_task(self._pump_stream(query, context, parts))
+        try:
+            while True:
+                text = await parts.get()
+                if text is None:
+                    return
+                yield text
+        finally:
+            # المستهلك انقطع قبل النهاية: لا داعي لإكمال القراءة من المزود
+            pump.cancel()
+
+    async def _pump_stream(self, query: str, context: List[Dict], out: "asyncio.Queue[Optional[str]]") -> None:
+        """قراءة البث من المزود (مع إعادة المحاولة) إلى out، ثم None كعلامة نهاية."""
+        prompt, payload = self._payload(query, context)
+        client, semaphore = self._get_client()
+        url = f"/models/{self.model}:streamGenerateContent"
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                parts: List[str] = []
+                usage = None
+                try:
+                    async with semaphore:
+                        async with client.stream("POST", url, params={"alt": "sse"}, json=payload) as response:
+                            self._check_status(response)
+                            async for line in response.aiter_lines():
+                                if not line.startswith("data:"):
+                                    continue
+                                data = json.loads(line[5:])
+                                usage = data.get("usageMetadata") or usage
+                                text = _candidate_text(data)
+                                if text:
+                                    parts.append(text)
+                                    out.put_nowait(text)
+                    if not parts:
+                        out.put_nowait(NO_ANSWER)
+                    _record_usage(usage, prompt, "".join(parts))
+                    return
+                except (_RetryableError, httpx.TransportError) as e:
+                    if parts or attempt == self.max_retries:
+                        logger.error(f"❌ LLM streaming failed: {e}")
+                        out.put_nowait(LLM_ERROR_ANSWER)
+                        return
+                    delay = self._backoff(attempt, getattr(e, "retry_after", None))
+                    metrics.inc("llm_retries")
+                    logger.warning(f"⚠️ LLM stream failed ({e}); retrying in {delay:.2f}s")
+                    with span("llm.backoff"):
+                        await asyncio.sleep(delay)
+                except Exception as e:
+                    logger.error(f"❌ Gemini Streaming Error: {e}")
+                    out.put_nowait(LLM_ERROR_ANSWER)
+                    return
+        finally:
+            out.put_nowait(None)
+
+
+def _candidate_text(data: Dict[str, Any]) -> str:
+    candidates = data.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+def _record_usage(usage: Optional[Dict[str, Any]], prompt: str, answer: str) -> None:
+    # ✨ حوكمة التكلفة: تسجيل استهلاك التوكنات (تقدير تقريبي إن لم يرسلها المزود)
+    if usage:
+        in_tokens = usage.get("promptTokenCount", 0)
+        out_tokens = usage.get("candidatesTokenCount", 0)
+    else:
+        in_tokens = len(prompt) // 4
+        out_tokens = len(answer) // 4
+    metrics.inc("total_input_tokens", in_tokens)
+    metrics.inc("total_output_tokens", out_tokens)
+
 # خدمة وهمية (Mock) للاختبارات ولتجاوز حدود جوجل
 class GeminiLLMService(BaseLLMService):
     def __init__(self):
         logger.info("✅ Mock LLM Service initialized (Simulation Mode).")
 
     async def generate_answer(self, query: str, context: List[Dict]) -> str:
+        with span("llm.mock"):
+            answer = self._simulate(query)
+        # تقدير الاستهلاك كما لو أُرسل الموجه لنموذج حقيقي
+        _record_usage(None, build_prompt(query, context), answer)
+        return answer
+
+    def _simulate(self, query: str) -> str:
         query_lower = query.lower()
         
         # محاكاة الإجابات بناءً على أسئلة ملف التقييم
@@ -0,0 +1,311 @@
+# app/services/matrix_search_service.py
+
+from contextlib import contextmanager
+from typing import Iterator, List, Dict, Any, Optional
+
+import numpy as np
+
+from app.core.rwlock import KeyedRWLock
+from app.core.tracing import span
+from app.services.arabic_text import analyze_query, analyze_text
+from app.services.search_service import BaseSearchService, MockSearchService
+
+
+class _KBMatrix:
+    """
+    مصفوفة term-document متفرقة (CSR) لقاعدة معرفة واحدة.
+
+    - indptr / indices / data: مصفوفات CSR (صف لكل chunk، عمود لكل term، القيمة = tf)
+    - row_ids: رقم الصف لكل عنصر غير صفري (لتجميع الـ scores عبر bincount)
+    - المصفوفات تُحجز بسعة تتضاعف عند الامتلاء، لذا الإلحاق amortized O(1)
+    - المستندات الجديدة تُجمع في pending وتُلحق دفعة واحدة عند flush()
+    """
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.vocab: Dict[str, int] = {}
+        self.pending: List[Dict[int, int]] = []
+
+        self.n_rows = 0
+        self.nnz = 0
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.empty(0, dtype=np.int32)
+        self.row_ids = np.empty(0, dtype=np.int32)
+        self.data = np.empty(0, dtype=np.float32)
+
+        # إحصائيات BM25
+        self.df = np.empty(0, dtype=np.int64)
+        self.doc_lengths = np.empty(0, dtype=np.float32)
+        self.idf = np.empty(0, dtype=np.float32)
+        self.doc_norms = np.empty(0, dtype=np.float32)
+
+    @staticmethod
+    def _grow(array: np.ndarray, needed: int) -> np.ndarray:
+        """توسيع المصفوفة بمضاعفة السعة حتى تتسع لـ needed عنصراً."""
+        if needed <= len(array):
+            return array
+        capacity = max(needed, 2 * len(array), 1024)
+        grown = np.zeros(capacity, dtype=array.dtype)
+        grown[: len(array)] = array
+        return grown
+
+    def add(self, text: str, terms: List[str]) -> None:
+        self.chunks.append(text)
+        tf: Dict[int, int] = {}
+        for term in terms:
+            col = self.vocab.get(term)
+            if col is None:
+                col = self.vocab[term] = len(self.vocab)
+            tf[col] = tf.get(col, 0) + 1
+        self.pending.append(tf)
+
+    def flush(self, k1: float, b: float) -> None:
+        """إلحاق المستندات المعلّقة بالمصفوفة دفعة واحدة وتحديث الإحصائيات."""
+        if not self.pending:
+            return
+
+        batch_nnz = sum(len(tf) for tf in self.pending)
+        n_new = len(self.pending)
+        start_row, start = self.n_rows, self.nnz
+        end = start + batch_nnz
+
+        self.indices = self._grow(self.indices, end)
+        self.row_ids = self._grow(self.row_ids, end)
+        self.data = self._grow(self.data, end)
+        self.indptr = self._grow(self.indptr, start_row + n_new + 1)
+        self.doc_lengths = self._grow(self.doc_lengths, start_row + n_new)
+
+        cols = np.fromiter(
+            (col for tf in self.pending for col in tf), dtype=np.int32, count=batch_nnz
+        )
+        counts = np.fromiter(
+            (count for tf in self.pending for count in tf.values()), dtype=np.float32, count=batch_nnz
+        )
+        row_sizes = np.fromiter((len(tf) for tf in self.pending), dtype=np.int64, count=n_new)
+
+        self.indices[start:end] = cols
+        self.data[start:end] = counts
+        self.row_ids[start:end] = np.repeat(
+            np.arange(start_row, start_row + n_new, dtype=np.int32), row_sizes
+        )
+        self.indptr[start_row + 1: start_row + n_new + 1] = start + np.cumsum(row_sizes)
+        self.doc_lengths[start_row: start_row + n_new] = np.fromiter(
+            (sum(tf.values()) for tf in self.pending), dtype=np.float32, count=n_new
+        )
+
+        self.df = self._grow(self.df, len(self.vocab))
+        np.add.at(self.df, cols, 1)
+
+        self.n_rows += n_new
+        self.nnz = end
+        self.pending = []
+
+        n_docs = self.n_rows
+        df = self.df[: len(self.vocab)].astype(np.float64)
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        lengths = self.doc_lengths[:n_docs]
+        avg_length = float(lengths.mean()) or 1.0
+        self.doc_norms = (k1 * (1.0 - b + b * lengths / avg_length)).astype(np.float32)
+
+
+class SparseMatrixSearchService(BaseSearchService):
+    """
+    خدمة بحث In-Memory متجهة (Vectorized) باستخدام NumPy.
+
+    كل KB مخزنة كمصفوفة term-document متفرقة بصيغة CSR، ويُحسب score الاستعلام
+    بعملية ضرب متفرقة واحدة (بدون حلقات Python على الـ chunks):
+    - نفس تحليل النص وترتيب BM25 الخاص بـ InvertedIndexSearchService
+    - اختيار أفضل top_k عبر np.argpartition
+    - الإدخال يُجمع في دفعات (batch_size) ويُلحق بالمصفوفة بشكل amortized
+    - قفل قراءة/كتابة لكل KB: البحوث تعمل معاً، والإدخال يحجز KB واحدة فقط
+    """
+
+    FORBIDDEN_TOPICS = MockSearchService.FORBIDDEN_TOPICS
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, batch_size: int = 1024):
+        super().__init__()
+        self.k1 = k1
+        self.b = b
+        # عدد المستندات المعلّقة التي يُفرض عندها الإلحاق بالمصفوفة
+        self.batch_size = batch_size
+        # البنية: {kb_id: _KBMatrix}
+        self.matrices: Dict[str, _KBMatrix] = {}
+        self._locks = KeyedRWLock()
+
+    # -----------------------------
+    # 📥 إضافة المستندات
+    # -----------------------------
+    def add_documents(self, kb_id: str, documents: List[str]):
+        """
+        إضافة مستندات إلى KB محددة. تُلحق بالمصفوفة كلما تجاوز عدد المعلّق
+        batch_size، والباقي يُلحق عند أول بحث.
+
+        :param kb_id: معرف الـ Knowledge Base
+        :param documents: قائمة نصوص (Chunks)
+        """
+        # التحليل خارج القفل؛ قفل الكتابة يخص هذه الـ KB فقط
+        analyzed = [(doc, analyze_text(doc)) for doc in documents]
+
+        with self._locks.write(kb_id):
+            matrix = self.matrices.get(kb_id)
+            if matrix is None:
+                matrix = self.matrices[kb_id] = _KBMatrix()
+
+            for doc, terms in analyzed:
+                matrix.add(doc, terms)
+                if len(matrix.pending) >= self.batch_size:
+                    matrix.flush(self.k1, self.b)
+            self._bump_kb_version(kb_id)
+
+    @contextmanager
+    def _read(self, kb_id: str) -> Iterator[Optional[_KBMatrix]]:
+        """
+        قفل قراءة على مصفوفة الـ KB بعد إلحاق المعلّق بها (الإلحاق يحتاج قفل الكتابة).
+        مستندات تُضاف بعد الإلحاق وقبل القراءة تبقى معلّقة حتى البحث التالي، ومفرداتها
+        الجديدة خارج len(matrix.idf) فتُتجاهل.
+        """
+        lock = self._locks.get(kb_id)
+        matrix = self.matrices.get(kb_id)
+        if matrix is not None and matrix.pending:
+            with span("search.flush"), lock.write():
+                matrix.flush(self.k1, self.b)
+        with span("search.lock_wait"):
+            lock.acquire_read()
+        try:
+            yield matrix
+        finally:
+            lock.release_read()
+
+    # -----------------------------
+    # 🔍 عملية البحث
+    # -----------------------------
+    def search(self, query: str, kb_id: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """
+        بحث متجه داخل الـ KB:
+        - تطبيع الاستعلام ورفض المواضيع الممنوعة (خاص بـ Demo)
+        - بناء متجه الاستعلام (IDF لكل term موجود في المفردات)
+        - حساب BM25 لكل الصفوف بعملية متجهة واحدة على عناصر CSR
+        - اختيار أفضل top_k عبر argpartition
+
+        :param query: استعلام المستخدم
+        :param kb_id: معرف الـ Knowledge Base
+        :param top_k: عدد النتائج المراد إرجاعها
+        :return: قائمة من النتائج مرتبة تنازلياً: [{"text": "...", "score": 2.41}, ...]
+        """
+        with span("search.analyze"):
+            normalized_query, query_terms = analyze_query(query)
+        if any(topic in normalized_query for topic in self.FORBIDDEN_TOPICS):
+            return []
+
+        with self._read(kb_id) as matrix:
+            if matrix is None:
+                return []
+
+            n_terms = len(matrix.idf)
+            cols = [matrix.vocab[term] for term in query_terms if matrix.vocab.get(term, n_terms) < n_terms]
+            if not cols:
+                return []
+            nnz = matrix.nnz
+
+            with span("search.score"):
+                # متجه الاستعلام: IDF للـ terms الموجودة، صفر لغيرها
+                query_weights = np.zeros(n_terms, dtype=np.float32)
+                query_weights[cols] = matrix.idf[cols]
+
+                # الضرب المتفرق: نأخذ فقط عناصر CSR التي تقع أعمدتها في الاستعلام
+                weights = query_weights[matrix.indices[:nnz]]
+                hits = np.flatnonzero(weights)
+                tf = matrix.data[hits]
+                rows = matrix.row_ids[hits]
+                contrib = weights[hits] * tf * (self.k1 + 1.0) / (tf + matrix.doc_norms[rows])
+                scores = np.bincount(rows, weights=contrib, minlength=matrix.n_rows)
+
+            with span("search.sort"):
+                candidates = np.flatnonzero(scores > 0)
+                if len(candidates) > top_k > 0:
+                    part = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+                    candidates = candidates[part]
+                ranked = candidates[np.argsort(-scores[candidates], kind="stable")][:top_k]
+
+                return [
+                    {"text": matrix.chunks[row], "score": round(float(scores[row]), 4)}
+                    for row in ranked
+                ]
+
+    def search_batch(self, queries: List[str], kb_id: str, top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """
+        بحث دفعة استعلامات بتمريرة واحدة على عناصر CSR:
+        - اتحاد أعمدة كل الاستعلامات ومسح indices مرة واحدة (بدلاً من مرة لكل استعلام)
+        - جزء BM25 المشترك يُحسب مرة لكل عنصر، ثم تُوسّع أزواج (استعلام، عمود)
+          إلى عناصر عمودها بدون حلقات Python
+        - تجميع الـ scores لكل زوج (استعلام، مستند) عبر مفاتيح مسطحة + bincount
+        - ترتيب واحد (lexsort) يعطي أفضل top_k لكل استعلام
+
+        :param queries: استعلامات المستخدمين
+        :param kb_id: معرف الـ Knowledge Base
+        :param top_k: عدد النتائج لكل استعلام
+        :return: قائمة نتائج لكل استعلام بنفس ترتيب queries
+        """
+        results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        analyzed = [analyze_query(query) for query in queries]
+        with self._read(kb_id) as matrix:
+            if matrix is None or top_k <= 0:
+                return results
+
+            n_terms = len(matrix.idf)
+            query_cols: List[np.ndarray] = []
+            for normalized_query, query_terms in analyzed:
+                cols = []
+                if not any(topic in normalized_query for topic in self.FORBIDDEN_TOPICS):
+                    cols = [
+                        matrix.vocab[term] for term in query_terms if matrix.vocab.get(term, n_terms) < n_terms
+                    ]
+                query_cols.append(np.array(sorted(cols), dtype=np.int32))
+
+            active = [i for i, cols in enumerate(query_cols) if len(cols)]
+            if not active:
+                return results
+
+            nnz, n_rows = matrix.nnz, matrix.n_rows
+
+            union = np.unique(np.concatenate([query_cols[i] for i in active]))
+            hits = np.flatnonzero(np.isin(matrix.indices[:nnz], union))
+            # تجميع العناصر حسب العمود (ترتيب مستقر) لتصبح لكل عمود شريحة متصلة
+            positions = np.searchsorted(union, matrix.indices[hits])
+            by_column = np.argsort(positions, kind="stable")
+            hits, positions = hits[by_column], positions[by_column]
+            column_start = np.searchsorted(positions, np.arange(len(union)))
+            column_end = np.searchsorted(positions, np.arange(len(union)), side="right")
+
+            tf = matrix.data[hits]
+            rows = matrix.row_ids[hits]
+            # جزء BM25 الذي لا يعتمد على الاستعلام
+            bm25 = tf * (self.k1 + 1.0) / (tf + matrix.doc_norms[rows])
+
+            # أزواج (استعلام، عمود) ثم توسيع كل زوج إلى شريحة عناصر عموده
+            pair_slot = np.repeat(np.arange(len(active)), [len(query_cols[i]) for i in active])
+            pair_column = np.concatenate([np.searchsorted(union, query_cols[i]) for i in active])
+            lengths = column_end[pair_column] - column_start[pair_column]
+            entry_pair = np.repeat(np.arange(len(pair_column)), lengths)
+            entry_hit = column_start[pair_column][entry_pair] + (
+                np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            )
+
+            contrib = matrix.idf[union][pair_column][entry_pair] * bm25[entry_hit]
+            keys = pair_slot[entry_pair].astype(np.int64) * n_rows + rows[entry_hit]
+            pairs, inverse = np.unique(keys, return_inverse=True)
+            scores = np.bincount(inverse, weights=contrib)
+
+            pair_slots = pairs // n_rows
+            pair_rows = pairs % n_rows
+            # ترتيب حسب الاستعلام ثم الـ score تنازلياً (lexsort مستقر: التعادل بترتيب المستند)
+            order = np.lexsort((-scores, pair_slots))
+            bounds = np.searchsorted(pair_slots[order], np.arange(len(active) + 1))
+            for slot, i in enumerate(active):
+                best = order[bounds[slot]: bounds[slot + 1]][:top_k]
+                results[i] = [
+                    {"text": matrix.chunks[int(pair_rows[p])], "score": round(float(scores[p]), 4)}
+                    for p in best
+                ]
+            return results
+
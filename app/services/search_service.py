@@ -1,8 +1,13 @@
 # app/services/search_service.py
 
+import heapq
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
-import re
+from typing import List, Dict, Any, Tuple
+
+from app.core.rwlock import KeyedRWLock
+from app.core.tracing import span
+from app.services.arabic_text import ARABIC_STOPWORDS, normalize_arabic
+from app.services.chunk_store import ChunkStore
 
 
 class BaseSearchService(ABC):
@@ -13,8 +18,42 @@ class BaseSearchService(ABC):
     - Azure AI Search
     - ElasticSearch
     - أي محرك بحث آخر
+
+    كل تنفيذ يستدعي _bump_kb_version بعد كل add_documents، فيتغير get_kb_version
+    وتُبطل تلقائياً أي نتائج مخزنة مؤقتاً (Cache) مبنية على نسخة أقدم من الـ KB.
     """
 
+    def __init__(self):
+        # البنية: {kb_id: رقم الإصدار}
+        self._kb_versions: Dict[str, int] = {}
+
+    def get_kb_version(self, kb_id: str) -> int:
+        """
+        رقم إصدار الـ KB: يزيد مع كل إضافة مستندات.
+
+        :param kb_id: معرف الـ Knowledge Base
+        :return: رقم الإصدار (0 لـ KB غير موجودة)
+        """
+        return self._kb_versions.get(kb_id, 0)
+
+    def _bump_kb_version(self, kb_id: str) -> None:
+        self._kb_versions[kb_id] = self._kb_versions.get(kb_id, 0) + 1
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """
+        حالة ذاكرة الـ KBs (تُعرض في /health): الحجم المقيم، عدد الـ KBs المقيمة
+        والمُخرجة للقرص، وزمن إعادة التحميل. التنفيذ الافتراضي لا يحاسب الذاكرة.
+        """
+        return {}
+
+    def incremental_ingest(self) -> bool:
+        """
+        هل كلفة add_documents تتناسب مع حجم الدفعة فقط؟ مهام الإدخال تفهرس الملف دفعة
+        دفعة عندها، وإلا (مثلاً commit يعيد كتابة فهرس الـ KB على القرص) تجمع chunks
+        المهمة وتفهرسها في استدعاء واحد.
+        """
+        return True
+
     @abstractmethod
     def add_documents(self, kb_id: str, documents: List[str]):
         """
@@ -37,6 +76,32 @@ class BaseSearchService(ABC):
         """
         pass
 
+    def search_with_timings(
+        self, query: str, kb_id: str, top_k: int = 3
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, float]]:
+        """
+        نفس search مع أزمنة داخلية (بالملي ثانية) لكل محرك فرعي إن وُجد.
+        التنفيذ الافتراضي لا يملك محركات فرعية فيعيد قاموساً فارغاً.
+
+        :return: (النتائج، {اسم المحرك: الزمن بالملي ثانية})
+        """
+        return self.search(query, kb_id, top_k), {}
+
+    def search_batch(self, queries: List[str], kb_id: str, top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """
+        بحث عدة استعلامات في نفس الـ KB دفعة واحدة.
+        التنفيذ الافتراضي يبحث كل استعلام مميز مرة واحدة فقط؛ المحركات المتجهة
+        (matrix / vector) تعيد تعريفه لتقييم الدفعة كاملة بعمليات مصفوفات.
+
+        :param queries: استعلامات المستخدمين
+        :param kb_id: معرف الـ Knowledge Base
+        :param top_k: عدد النتائج لكل استعلام
+        :return: قائمة نتائج لكل استعلام بنفس ترتيب queries
+        """
+        unique = {query: self.search(query, kb_id, top_k) for query in dict.fromkeys(queries)}
+        # نسخ القواميس حتى لا تتشارك الاستعلامات المكررة نفس الكائنات
+        return [[dict(result) for result in unique[query]] for query in queries]
+
 
 class MockSearchService(BaseSearchService):
     """
@@ -45,17 +110,16 @@ class MockSearchService(BaseSearchService):
     الخصائص:
     - تطبيع نصوص عربية (Normalization)
     - إزالة كلمات التوقف (Arabic Stopwords)
-    - حساب Score بسيط بناءً على تكرار الكلمات
+    - حساب Score بسيط بناءً على تكرار كلمات الاستعلام (ككلمات كاملة) في كل chunk
     - قاعدة قواعد خاصة للـ Demo (رفض أسئلة معينة بإرجاع نتائج فارغة)
+    - نسخ عند الكتابة (Copy-on-Write) لكل KB: الإدخال يبني ChunkStore جديداً ثم يستبدله،
+      فيقرأ البحث لقطة ثابتة بدون أقفال ولا يرى دفعة نصف مكتملة
+    - النصوص في buffers متصلة (app/services/chunk_store.py) بدلاً من قاموس لكل chunk،
+      والنص المطبّع كتسلسل أرقام كلمات من معجم خاص بكل KB
     """
 
-    # قائمة كلمات التوقف العربية (Stopwords) - قابلة للتوسّع
-    ARABIC_STOPWORDS = {
-        "من", "في", "على", "الى", "إلى", "عن", "هو", "هي", "هم", "هن",
-        "هذا", "هذه", "ذلك", "تلك", "ما", "ماذا", "لماذا", "كيف", "هل",
-        "كان", "كانت", "يكون", "مع", "ثم", "كما", "قد", "لقد", "بل",
-        "أو", "و", "يا", "إن", "أن", "إنه", "أنها", "هناك", "هنا"
-    }
+    # قائمة كلمات التوقف العربية (Stopwords) - معرفة في app/services/arabic_text.py
+    ARABIC_STOPWORDS = ARABIC_STOPWORDS
 
     # مواضيع ممنوعة (خاصة بالـ Demo / التقييم) نجبر النظام على رفضها
     FORBIDDEN_TOPICS = {
@@ -67,65 +131,41 @@ class MockSearchService(BaseSearchService):
     }
 
     def __init__(self):
-        # البنية: {kb_id: [{"raw": "...", "norm": "..."}]}
-        self.store: Dict[str, List[Dict[str, str]]] = {}
+        super().__init__()
+        # البنية: {kb_id: ChunkStore} (النصوص الأصلية وأرقام الكلمات)؛ اللقطة المنشورة لا تُعدّل أبداً
+        self.store: Dict[str, ChunkStore] = {}
+        # الكتّاب على نفس الـ KB يتسلسلون (حتى لا تضيع دفعة)، والقرّاء لا ينتظرون
+        self._locks = KeyedRWLock()
 
     # -----------------------------
     # 🔤 Arabic Normalization
     # -----------------------------
     def _normalize_arabic(self, text: str) -> str:
         """
-        تطبيع النص العربي لجعله مناسباً للمطابقة البسيطة.
-
-        الخطوات:
-        - إزالة التشكيل
-        - توحيد الألف (أ، إ، آ → ا)
-        - تحويل التاء المربوطة إلى ه
-        - تحويل الألف المقصورة إلى ي
-        - إزالة الرموز غير العربية/الأرقام/المسافات
+        تطبيع النص العربي لجعله مناسباً للمطابقة البسيطة
+        (التنفيذ أحادي التمرير في app/services/arabic_text.py).
         """
-        if not text:
-            return ""
-
-        # إزالة التشكيل
-        text = re.sub(r'[\u064B-\u065F]', '', text)
-
-        # توحيد الألف
-        text = re.sub(r'[أإآ]', 'ا', text)
-
-        # تحويل التاء المربوطة إلى ه
-        text = re.sub(r'ة', 'ه', text)
-
-        # تحويل الألف المقصورة إلى ي
-        text = re.sub(r'ى', 'ي', text)
-
-        # استبدال أي شيء غير حروف عربية/أرقام/مسافات بمسافة
-        text = re.sub(r'[^ء-ي0-9 ]+', ' ', text)
-
-        # إزالة المسافات الزائدة
-        text = re.sub(r'\s+', ' ', text).strip()
-
-        return text
+        return normalize_arabic(text)
 
     # -----------------------------
     # 📥 إضافة المستندات
     # -----------------------------
     def add_documents(self, kb_id: str, documents: List[str]):
         """
-        إضافة مستندات إلى KB محددة، مع تخزين النسخة الأصلية والمطبّعة.
+        إضافة مستندات إلى KB محددة، مع تخزين النسخة الأصلية وكلمات النسخة المطبّعة
+        (كأرقام من معجم الـ KB).
 
         :param kb_id: معرف الـ Knowledge Base
         :param documents: قائمة نصوص (Chunks)
         """
-        if kb_id not in self.store:
-            self.store[kb_id] = []
+        # التطبيع والتقسيم (الجزء المكلف) خارج القفل؛ تحويل الكلمات إلى أرقام داخله
+        tokens = [self._normalize_arabic(doc).split() for doc in documents]
 
-        for doc in documents:
-            norm = self._normalize_arabic(doc)
-            self.store[kb_id].append({
-                "raw": doc,
-                "norm": norm,
-            })
+        with self._locks.write(kb_id):
+            # لقطة جديدة = القديمة + الدفعة (تشارك الـ segments القديمة)، ثم استبدال ذري للمرجع
+            chunks = self.store.get(kb_id) or ChunkStore()
+            self.store[kb_id] = chunks.extend(documents, tokens)
+            self._bump_kb_version(kb_id)
 
     # -----------------------------
     # 🔍 عملية البحث
@@ -136,7 +176,7 @@ class MockSearchService(BaseSearchService):
         - تطبيع الاستعلام
         - رفض مواضيع ممنوعة (خاص بـ Demo)
         - إزالة كلمات التوقف والكلمات القصيرة
-        - حساب score بناءً على تكرار الكلمات في كل chunk
+        - حساب score بناءً على تكرار الكلمات (ككلمات كاملة) في كل chunk
 
         :param query: استعلام المستخدم
         :param kb_id: معرف الـ Knowledge Base
@@ -144,12 +184,14 @@ class MockSearchService(BaseSearchService):
         :return: قائمة من النتائج: [{"text": "...", "score": 3}, ...]
         """
 
-        # 1) التحقق من وجود قاعدة المعرفة
-        if kb_id not in self.store:
+        # 1) التحقق من وجود قاعدة المعرفة (ولقطة ثابتة لها طوال البحث)
+        chunks = self.store.get(kb_id)
+        if chunks is None:
             return []
 
         # 2) تطبيع الاستعلام
-        normalized_query = self._normalize_arabic(query)
+        with span("search.normalize"):
+            normalized_query = self._normalize_arabic(query)
 
         # 3) قاعدة الـ Demo: رفض الأسئلة الخارجة عن نطاق الـ KB
         #    إذا اشتمل الاستعلام (بعد التطبيع) على أي من المواضيع الممنوعة،
@@ -161,41 +203,25 @@ class MockSearchService(BaseSearchService):
         #    - تقسيم إلى كلمات
         #    - إزالة كلمات التوقف
         #    - تجاهل الكلمات ذات الطول <= 2
-        query_words = {
-            w
-            for w in normalized_query.split()
-            if len(w) > 2 and w not in self.ARABIC_STOPWORDS
-        }
+        with span("search.stopwords"):
+            query_words = {
+                w
+                for w in normalized_query.split()
+                if len(w) > 2 and w not in self.ARABIC_STOPWORDS
+            }
 
         # إذا لم يتبقَّ أي كلمة ذات معنى، فلا داعي للبحث
         if not query_words:
             return []
 
-        results: List[Dict[str, Any]] = []
-
-        # 5) البحث داخل كل chunk
-        for item in self.store[kb_id]:
-            chunk_text = item["raw"]
-            chunk_norm = item["norm"]
-
-            score = 0
-
-            # حساب عدد مرات ظهور كل كلمة من الاستعلام داخل النص
-            for word in query_words:
-                if not word:
-                    continue
-                # count يعطي عدد مرات ظهور الكلمة (مطابقة بسيطة)
-                score += chunk_norm.count(word)
-
-            # فقط نضيف النتائج التي حصلت على score > 0
-            if score > 0:
-                results.append({
-                    "text": chunk_text,
-                    "score": score,
-                })
+        # 5) البحث داخل كل chunk: عدد مرات ظهور كل كلمة من الاستعلام (بأرقام المعجم)،
+        #    ولا تُعاد إلا الـ chunks التي حصلت على score > 0
+        with span("search.score"):
+            scores = chunks.count_matches(query_words)
 
-        # 6) ترتيب النتائج حسب score تنازلياً
-        results.sort(key=lambda x: x["score"], reverse=True)
+        # 6) ترتيب النتائج حسب score تنازلياً (التعادل بترتيب الإدخال) وأخذ أفضل top_k
+        with span("search.sort"):
+            ranked = heapq.nsmallest(top_k, scores.items(), key=lambda item: (-item[1], item[0]))
 
-        # 7) إرجاع أفضل top_k نتيجة
-        return results[:top_k]
+        # 7) فك ترميز نصوص النتائج المختارة فقط
+        return [{"text": chunks.text(chunk_id), "score": score} for chunk_id, score in ranked]
@@ -11,6 +11,11 @@ VALID_API_KEYS = [
     "client-a-key"
 ]
 
+# مفاتيح المشرفين (لأدوات التشخيص مثل الـ Profiler)؛ يجب أن تكون ضمن VALID_API_KEYS
+ADMIN_API_KEYS = [
+    "admin-key-xyz"
+]
+
 async def get_api_key(api_key_header: str = Security(api_key_header)):
     """يتحقق من صحة مفتاح API الوارد في الترويسة."""
     if api_key_header in VALID_API_KEYS:
@@ -20,3 +25,18 @@ async def get_api_key(api_key_header: str = Security(api_key_header)):
         status_code=status.HTTP_403_FORBIDDEN,
         detail="Invalid or missing API Key"
     )
+
+
+def is_admin_key(api_key: str) -> bool:
+    return api_key in ADMIN_API_KEYS
+
+
+async def get_admin_api_key(api_key_header: str = Security(api_key_header)):
+    """مثل get_api_key لكن يقبل مفاتيح المشرفين فقط."""
+    if is_admin_key(api_key_header):
+        return api_key_header
+
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Admin API Key required"
+    )
@@ -0,0 +1,358 @@
+# app/services/vector_search_service.py
+
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from app.core.rwlock import KeyedRWLock
+from app.core.tracing import span
+from app.services.arabic_text import analyze_text, normalize_arabic
+from app.services.search_service import BaseSearchService, MockSearchService
+
+logger = logging.getLogger("mrag_service")
+
+
+# -----------------------------
+# 🧮 نماذج التضمين (Embedders)
+# -----------------------------
+class BaseEmbedder(ABC):
+    """واجهة مجردة لتحويل النصوص إلى متجهات float32 مطبّعة (L2 = 1)."""
+
+    dim: int
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        :param texts: قائمة نصوص
+        :return: مصفوفة (len(texts), dim) من نوع float32
+        """
+        pass
+
+
+def _hash_feature(feature: str, dim: int):
+    """(bucket, sign) ثابتان لكل feature عبر blake2b (مستقل عن hash() العشوائي في Python)."""
+    value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return (value >> 1) % dim, 1.0 if value & 1 else -1.0
+
+
+@lru_cache(maxsize=200_000)
+def _term_features(term: str, dim: int, ngram: int):
+    """
+    buckets/signs للـ term نفسه ولكل char n-gram فيه.
+    التخزين المؤقت لكل term يجعل كلفة التضمين شبه خطية في عدد الكلمات.
+    """
+    padded = f"#{term}#"
+    features = [term] + [padded[i:i + ngram] for i in range(len(padded) - ngram + 1)]
+    hashed = [_hash_feature(feature, dim) for feature in features]
+    return tuple(bucket for bucket, _ in hashed), tuple(sign for _, sign in hashed)
+
+
+class HashingEmbedder(BaseEmbedder):
+    """
+    تضمين حتمي (Deterministic) بدون نموذج، مخصص للتطوير والاختبارات.
+
+    يستخدم Feature Hashing على terms النص (بعد التطبيع) وعلى الـ char n-grams
+    لكل term، مع إشارة (±1) لتقليل أثر التصادمات. نفس النص ينتج دائماً نفس
+    المتجه بغض النظر عن العملية (لا يعتمد على hash() العشوائي في Python).
+    """
+
+    def __init__(self, dim: int = 256, ngram: int = 3):
+        self.dim = dim
+        self.ngram = ngram
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        rows: List[int] = []
+        buckets: List[int] = []
+        signs: List[float] = []
+        for row, text in enumerate(texts):
+            for term in analyze_text(text):
+                term_buckets, term_signs = _term_features(term, self.dim, self.ngram)
+                rows.extend([row] * len(term_buckets))
+                buckets.extend(term_buckets)
+                signs.extend(term_signs)
+
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(vectors, (rows, buckets), signs)
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+class SentenceTransformerEmbedder(BaseEmbedder):
+    """
+    تضمين عبر نموذج محلي (sentence-transformers) يعمل على الـ CPU فقط.
+    المكتبة اختيارية ولا تُستورد إلا عند استخدام هذا الـ Embedder.
+    """
+
+    def __init__(self, model_name: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        logger.info(f"✅ Local embedding model loaded: {model_name} (dim={self.dim})")
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+# -----------------------------
+# 🗂️ تخزين المتجهات لكل KB
+# -----------------------------
+class _KBVectors:
+    """
+    متجهات KB واحدة في مصفوفة float32 متصلة (contiguous) مع فهرس IVF اختياري.
+
+    - vectors: مصفوفة (capacity, dim) تتضاعف سعتها عند الامتلاء؛ الصفوف [0, count) فعّالة
+    - centroids / assignments: مراكز العناقيد وانتماء كل متجه لعنقود (IVF)
+    - lists: معرفات المتجهات لكل عنقود، تُعاد بناؤها عند الحاجة فقط
+    """
+
+    def __init__(self, dim: int):
+        self.chunks: List[str] = []
+        self.count = 0
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_size = 0
+        self.lists: List[np.ndarray] = []
+        self.lists_dirty = False
+
+    @property
+    def active(self) -> np.ndarray:
+        return self.vectors[: self.count]
+
+    def add(self, texts: List[str], vectors: np.ndarray) -> None:
+        needed = self.count + len(vectors)
+        if needed > len(self.vectors):
+            capacity = max(needed, 2 * len(self.vectors), 256)
+            grown = np.zeros((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown[: self.count] = self.active
+            self.vectors = grown
+            assignments = np.zeros(capacity, dtype=np.int32)
+            assignments[: self.count] = self.assignments[: self.count]
+            self.assignments = assignments
+
+        self.vectors[self.count: needed] = vectors
+        if self.centroids is not None:
+            self.assignments[self.count: needed] = np.argmax(vectors @ self.centroids.T, axis=1)
+            self.lists_dirty = True
+        self.chunks.extend(texts)
+        self.count = needed
+
+    def train(self, n_lists: int, n_iter: int = 10, seed: int = 0) -> None:
+        """Spherical k-means على المتجهات الحالية لبناء مراكز IVF."""
+        data = self.active
+        rng = np.random.default_rng(seed)
+        centroids = data[rng.choice(self.count, size=n_lists, replace=False)].copy()
+
+        for _ in range(n_iter):
+            assignments = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, data)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # العناقيد الفارغة تحتفظ بمركزها السابق
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+        self.centroids = centroids.astype(np.float32)
+        self.assignments[: self.count] = np.argmax(data @ self.centroids.T, axis=1)
+        self.trained_size = self.count
+        self.lists_dirty = True
+
+    def probe_lists(self) -> List[np.ndarray]:
+        if self.lists_dirty:
+            assignments = self.assignments[: self.count]
+            order = np.argsort(assignments, kind="stable").astype(np.int32)
+            bounds = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+            self.lists = [order[bounds[i]: bounds[i + 1]] for i in range(len(self.centroids))]
+            self.lists_dirty = False
+        return self.lists
+
+
+class VectorSearchService(BaseSearchService):
+    """
+    خدمة بحث دلالي (Dense Retrieval) داخل الذاكرة.
+
+    الخصائص:
+    - تضمين الـ chunks عند الإدخال عبر Embedder قابل للاستبدال
+      (HashingEmbedder افتراضياً، أو نموذج محلي على الـ CPU)
+    - وضع exact: ضرب مصفوفة × متجه على كل المتجهات (Cosine)
+    - وضع ivf: تقسيم المتجهات لعناقيد (k-means) وفحص أقرب nprobe عنقود فقط؛
+      زيادة nprobe ترفع الـ recall على حساب الزمن
+    - نفس قواعد الـ Demo (المواضيع الممنوعة) ونفس شكل النتائج
+    """
+
+    FORBIDDEN_TOPICS = MockSearchService.FORBIDDEN_TOPICS
+
+    def __init__(
+        self,
+        embedder: Optional[BaseEmbedder] = None,
+        mode: str = "exact",
+        nprobe: int = 4,
+        ivf_min_size: int = 2048,
+        min_score: float = 0.1,
+    ):
+        if mode not in ("exact", "ivf"):
+            raise ValueError(f"Unknown vector search mode: {mode}")
+        super().__init__()
+        self.embedder = embedder or HashingEmbedder()
+        self.mode = mode
+        # عدد العناقيد التي تُفحص في وضع ivf (مقايضة recall / latency)
+        self.nprobe = nprobe
+        # لا يُبنى فهرس IVF قبل هذا الحجم (البحث الكامل أسرع للـ KB الصغيرة)
+        self.ivf_min_size = ivf_min_size
+        # أقل تشابه Cosine يُعتبر نتيجة ذات صلة
+        self.min_score = min_score
+        # البنية: {kb_id: _KBVectors}
+        self.stores: Dict[str, _KBVectors] = {}
+        # قفل قراءة/كتابة لكل KB؛ التضمين (الجزء المكلف) يتم خارج الأقفال
+        self._locks = KeyedRWLock()
+
+    # -----------------------------
+    # 📥 إضافة المستندات
+    # -----------------------------
+    def add_documents(self, kb_id: str, documents: List[str]):
+        """
+        تضمين المستندات وإضافتها لمصفوفة الـ KB. يُعاد تدريب IVF كلما تضاعف
+        حجم الـ KB منذ آخر تدريب (في وضع ivf فقط).
+
+        :param kb_id: معرف الـ Knowledge Base
+        :param documents: قائمة نصوص (Chunks)
+        """
+        if not documents:
+            return
+        vectors = self.embedder.embed(documents)
+
+        with self._locks.write(kb_id):
+            store = self.stores.get(kb_id)
+            if store is None:
+                store = self.stores[kb_id] = _KBVectors(self.embedder.dim)
+
+            store.add(documents, vectors)
+
+            if (
+                self.mode == "ivf"
+                and store.count >= self.ivf_min_size
+                and store.count >= 2 * store.trained_size
+            ):
+                store.train(n_lists=max(1, int(np.sqrt(store.count))))
+            if store.centroids is not None:
+                # قوائم IVF تُبنى هنا (تحت قفل الكتابة) حتى لا يعدّل البحث أي حالة
+                store.probe_lists()
+            self._bump_kb_version(kb_id)
+
+    # -----------------------------
+    # 🔍 عملية البحث
+    # -----------------------------
+    def search(
+        self,
+        query: str,
+        kb_id: str,
+        top_k: int = 3,
+        mode: Optional[str] = None,
+        nprobe: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        بحث دلالي داخل الـ KB:
+        - رفض المواضيع الممنوعة (خاص بـ Demo)
+        - تضمين الاستعلام
+        - حساب التشابه (exact أو ivf) واختيار أفضل top_k عبر argpartition
+
+        :param query: استعلام المستخدم
+        :param kb_id: معرف الـ Knowledge Base
+        :param top_k: عدد النتائج المراد إرجاعها
+        :param mode: تجاوز وضع البحث الافتراضي لهذا الاستعلام ("exact" / "ivf")
+        :param nprobe: تجاوز عدد العناقيد المفحوصة لهذا الاستعلام
+        :return: قائمة من النتائج مرتبة تنازلياً: [{"text": "...", "score": 0.83}, ...]
+        """
+        if kb_id not in self.stores:
+            return []
+
+        if any(topic in normalize_arabic(query) for topic in self.FORBIDDEN_TOPICS):
+            return []
+
+        with span("search.embed"):
+            query_vector = self.embedder.embed([query])[0]
+        if not query_vector.any():
+            return []
+
+        lock = self._locks.get(kb_id)
+        with span("search.lock_wait"):
+            lock.acquire_read()
+        try:
+            store = self.stores[kb_id]
+            if store.count == 0:
+                return []
+
+            mode = mode or self.mode
+            with span("search.score"):
+                if mode == "ivf" and store.centroids is not None:
+                    nprobe = min(nprobe or self.nprobe, len(store.centroids))
+                    centroid_scores = store.centroids @ query_vector
+                    probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+                    lists = store.probe_lists()
+                    candidates = np.concatenate([lists[c] for c in probed])
+                    scores = store.vectors[candidates] @ query_vector
+                else:
+                    candidates = None
+                    scores = store.active @ query_vector
+
+            with span("search.sort"):
+                return self._top_results(store, scores, candidates, top_k)
+        finally:
+            lock.release_read()
+
+    def search_batch(self, queries: List[str], kb_id: str, top_k: int = 3) -> List[List[Dict[str, Any]]]:
+        """
+        بحث دفعة استعلامات: تضمينها كلها باستدعاء واحد ثم ضرب مصفوفة × مصفوفة
+        (بدلاً من مصفوفة × متجه لكل استعلام). وضع ivf يبحث كل استعلام على حدة.
+
+        :param queries: استعلامات المستخدمين
+        :param kb_id: معرف الـ Knowledge Base
+        :param top_k: عدد النتائج لكل استعلام
+        :return: قائمة نتائج لكل استعلام بنفس ترتيب queries
+        """
+        if kb_id not in self.stores or self.mode != "exact":
+            # كل search يأخذ قفل القراءة بنفسه (الأقفال غير قابلة لإعادة الدخول)
+            return super().search_batch(queries, kb_id, top_k)
+
+        query_vectors = self.embedder.embed(queries)
+        with self._locks.read(kb_id):
+            store = self.stores[kb_id]
+            scores = store.active @ query_vectors.T
+
+            results: List[List[Dict[str, Any]]] = []
+            for i, query in enumerate(queries):
+                if (
+                    any(topic in normalize_arabic(query) for topic in self.FORBIDDEN_TOPICS)
+                    or not query_vectors[i].any()
+                ):
+                    results.append([])
+                else:
+                    results.append(self._top_results(store, scores[:, i], None, top_k))
+            return results
+
+    def _top_results(
+        self, store: _KBVectors, scores: np.ndarray, candidates: Optional[np.ndarray], top_k: int
+    ) -> List[Dict[str, Any]]:
+        """اختيار أفضل top_k عبر argpartition مع استبعاد ما دون min_score."""
+        if len(scores) > top_k > 0:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind="stable")][:top_k]
+
+        results = []
+        for i in best:
+            score = float(scores[i])
+            if score <= self.min_score:
+                break
+            doc_id = int(candidates[i]) if candidates is not None else int(i)
+            results.append({"text": store.chunks[doc_id], "score": round(score, 4)})
+        return results
@@ -1,5 +1,9 @@
 from locust import HttpUser, task, between
 
+# لقياس تحديد المعدل بين العمّال: شغّل الخادم بـ --workers N مرة مع RATE_LIMIT_STORAGE_URI=memory://
+# ومرة مع sqlite:///tmp/limits.db؛ مع التخزين المشترك تبقى الطلبات المقبولة ضمن 100/minute للمفتاح
+# (كلفة الـ Limiter لكل طلب بمعزل عن الشبكة: scripts/benchmark_limiter.py)
+
 class MRAGUser(HttpUser):
     # وقت انتظار عشوائي بين الطلبات (1 إلى 3 ثواني)
     wait_time = between(1, 3)
@@ -0,0 +1,109 @@
+"""
+قياس ذاكرة تخزين الـ chunks (بايت لكل chunk) وزمن البحث في MockSearchService:
+قائمة {"raw": ..., "norm": ...} لكل chunk (التخزين السابق) مقابل ChunkStore العمودي
+(نص أصلي UTF-8 + أرقام كلمات من معجم الـ KB). الأول يطابق أجزاء الكلمات (str.count)
+والثاني كلمات كاملة، فعدد النتائج قد يختلف.
+
+ملاحظة: تسلسل الأرقام str بحرف لكل كلمة يكلف بايتين للكلمة فقط ما دامت أرقام الـ
+segment < 0x10000. القاعدة هنا (قاعدة مكررة، معجم صغير) تبقى تحت ذلك؛ مع معجم واقعي
+يتجاوز 65536 كلمة مميزة تصبح الكلمة 4 بايت (مثل array('I'))، فيختفي الفرق في حجم
+التسلسلات ويبقى توفير الكائنات والنص المطبّع فقط.
+
+الذاكرة تُقاس بـ tracemalloc بعد حذف قائمة المستندات المُدخلة، أي ما يبقى مملوكاً
+للمخزن فقط (بما فيه المعجم، كما بعد انتهاء طلب الإدخال).
+
+التشغيل (من جذر المشروع):
+    python scripts/benchmark_chunk_store.py
+    python scripts/benchmark_chunk_store.py --chunks 100000 --queries 50
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.arabic_text import normalize_arabic  # noqa: E402
+from app.services.chunk_store import ChunkStore  # noqa: E402
+from app.services.search_service import MockSearchService  # noqa: E402
+from benchmark_search import QUERIES, build_corpus, percentile  # noqa: E402
+
+
+def build_dicts(documents: list) -> list:
+    return [{"raw": doc, "norm": normalize_arabic(doc)} for doc in documents]
+
+
+def build_store(documents: list) -> ChunkStore:
+    return ChunkStore().extend(documents, [normalize_arabic(doc).split() for doc in documents])
+
+
+def search_dicts(items: list, words: set) -> list:
+    results = []
+    for item in items:
+        score = sum(item["norm"].count(word) for word in words)
+        if score > 0:
+            results.append({"text": item["raw"], "score": score})
+    results.sort(key=lambda x: x["score"], reverse=True)
+    return results[:3]
+
+
+def search_store(store: ChunkStore, words: set) -> list:
+    scores = store.count_matches(words)
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:3]
+    return [{"text": store.text(i), "score": score} for i, score in ranked]
+
+
+def measure(build, corpus: list):
+    gc.collect()
+    tracemalloc.start()
+    # نسخ جديدة من النصوص (كما تصل من طلب الإدخال)، تُحذف بعد البناء
+    documents = [doc.encode("utf-8").decode("utf-8") for doc in corpus]
+    baseline = tracemalloc.get_traced_memory()[0] - sum(sys.getsizeof(doc) for doc in documents)
+    store = build(documents)
+    del documents
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return store, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MRAG chunk storage memory benchmark")
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    mock = MockSearchService()
+    query_words = [
+        {w for w in normalize_arabic(q).split() if len(w) > 2 and w not in mock.ARABIC_STOPWORDS}
+        for q in QUERIES
+    ]
+
+    # المولّد بطيء مع الأحجام الكبيرة: قاعدة من 5000 chunk تُكرر حتى الحجم المطلوب
+    base = build_corpus(min(args.chunks, 5000))
+    corpus = [base[i % len(base)] for i in range(args.chunks)]
+
+    print(f"{args.chunks} chunks\n")
+    print(f"{'layout':<11} | {'MB':>8} | {'bytes/chunk':>11} | {'p50 (ms)':>9} | {'p95 (ms)':>9}")
+    print("-" * 60)
+    for name, build, search in (
+        ("dicts", build_dicts, search_dicts),
+        ("chunk-store", build_store, search_store),
+    ):
+        store, retained = measure(build, corpus)
+        latencies = []
+        for i in range(args.queries):
+            t0 = time.perf_counter()
+            search(store, query_words[i % len(QUERIES)])
+            latencies.append((time.perf_counter() - t0) * 1000)
+        print(
+            f"{name:<11} | {retained / 1e6:>8.1f} | {retained / args.chunks:>11.0f} | "
+            f"{percentile(latencies, 0.5):>9.2f} | {percentile(latencies, 0.95):>9.2f}"
+        )
+        del store
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+قياس زمن البحث (p50/p95) أثناء إدخال متزامن عبر عدة Knowledge Bases.
+
+لكل محرك بحث: قفل عام واحد للخدمة (السلوك السابق، يُحاكى بغلاف GlobalLock) مقابل
+أقفال القراءة/الكتابة لكل KB. الإدخال يكتب في نصف الـ KBs والبحث يقرأ من كلها.
+
+التشغيل (من جذر المشروع):
+    python scripts/benchmark_kb_concurrency.py
+    python scripts/benchmark_kb_concurrency.py --kbs 32 --writers 4 --readers 8 --seconds 5
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmark_search import BACKENDS, QUERIES, build_corpus, percentile  # noqa: E402
+
+
+class GlobalLock:
+    """غلاف يسلسل كل الإدخال والبحث عبر قفل واحد (كما كانت الخدمات قبل أقفال الـ KB)."""
+
+    def __init__(self, service):
+        self.service = service
+        self.lock = threading.Lock()
+
+    def add_documents(self, kb_id, documents):
+        with self.lock:
+            self.service.add_documents(kb_id, documents)
+
+    def search(self, query, kb_id, top_k=3):
+        with self.lock:
+            return self.service.search(query, kb_id, top_k)
+
+
+def run(service, kb_ids: list, corpus: list, args) -> dict:
+    for kb_id in kb_ids:
+        service.add_documents(kb_id, corpus[: args.seed_chunks])
+
+    stop = threading.Event()
+    latencies = [[] for _ in range(args.readers)]
+    ingested = [0] * args.writers
+
+    def writer(slot: int):
+        rng = random.Random(slot)
+        targets = kb_ids[: max(1, len(kb_ids) // 2)]
+        while not stop.is_set():
+            start = rng.randrange(len(corpus) - args.batch)
+            service.add_documents(rng.choice(targets), corpus[start: start + args.batch])
+            ingested[slot] += args.batch
+
+    def reader(slot: int):
+        rng = random.Random(1000 + slot)
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            service.search(rng.choice(QUERIES), rng.choice(kb_ids))
+            latencies[slot].append((time.perf_counter() - t0) * 1000)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    merged = [value for values in latencies for value in values]
+    return {
+        "p50": percentile(merged, 0.5),
+        "p95": percentile(merged, 0.95),
+        "qps": len(merged) / args.seconds,
+        "chunks_per_s": sum(ingested) / args.seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MRAG concurrent ingest + query benchmark")
+    parser.add_argument("--backends", nargs="+", default=["mock", "index", "matrix"], choices=sorted(BACKENDS))
+    parser.add_argument("--kbs", type=int, default=16)
+    parser.add_argument("--seed-chunks", type=int, default=500, help="chunks per KB before the run")
+    parser.add_argument("--batch", type=int, default=50, help="chunks per add_documents call")
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    corpus = build_corpus(5000)
+    kb_ids = [f"kb-{i}" for i in range(args.kbs)]
+    print(f"{args.kbs} KBs, {args.writers} writers, {args.readers} readers, {args.seconds}s per run\n")
+    print(f"{'backend':<8} | {'locking':<7} | {'p50 (ms)':>9} | {'p95 (ms)':>9} | {'qps':>8} | {'chunks/s':>9}")
+    print("-" * 64)
+    for name in args.backends:
+        for locking in ("global", "per-kb"):
+            service = BACKENDS[name]()
+            if locking == "global":
+                service = GlobalLock(service)
+            stats = run(service, kb_ids, corpus, args)
+            print(
+                f"{name:<8} | {locking:<7} | {stats['p50']:>9.3f} | {stats['p95']:>9.3f} | "
+                f"{stats['qps']:>8.0f} | {stats['chunks_per_s']:>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+قياس كلفة تحديد المعدل لكل طلب (p50/p95 بالميكروثانية) ودقته بين العمّال لكل Backend تخزين.
+
+كل عملية تحاكي عامل uvicorn يخدم عدة عملاء (مفاتيح API) بحد 100/minute كما في chat_with_kb.
+المقبول الكلي يجب ألا يتجاوز (عدد العملاء × الحد) مهما كان عدد العمّال؛ مع memory:// يتضاعف.
+
+التشغيل (من جذر المشروع):
+    python scripts/benchmark_limiter.py
+    python scripts/benchmark_limiter.py --workers 1 4 8 --requests 5000 --clients 50
+
+للقياس تحت حمل حقيقي: شغّل الخادم بعدة عمّال مع RATE_LIMIT_STORAGE_URI=sqlite:///tmp/limits.db
+ثم locust -f locustfile.py، وقارن زمن الطلبات ونسبة 429 مع memory://.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmark_search import percentile  # noqa: E402
+from limits import parse  # noqa: E402
+from limits.storage import storage_from_string  # noqa: E402
+from limits.strategies import STRATEGIES  # noqa: E402
+
+import app.core.limiter_storage  # noqa: E402,F401  (تسجيل sqlite://)
+
+LIMIT = parse("100/minute")
+
+
+def worker(uri: str, strategy: str, requests: int, clients: int, seed: int, results) -> None:
+    limiter = STRATEGIES[strategy](storage_from_string(uri))
+    rng = random.Random(seed)
+    latencies, accepted = [], 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        key = f"client-{rng.randrange(clients)}"
+        t0 = time.perf_counter()
+        accepted += limiter.hit(LIMIT, key)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    results.put((latencies, accepted, time.perf_counter() - started))
+
+
+def run(uri: str, strategy: str, workers: int, requests: int, clients: int):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker, args=(uri, strategy, requests, clients, seed, results))
+        for seed in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    latencies = [value for lat, _, _ in collected for value in lat]
+    # الإنتاجية بدون زمن إقلاع العمليات: أبطأ عامل يحدد المدة
+    elapsed = max(seconds for _, _, seconds in collected)
+    return latencies, sum(accepted for _, accepted, _ in collected), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MRAG rate limiter storage benchmark")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--requests", type=int, default=2000, help="limiter hits per worker")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--strategy", default="sliding-window-counter", choices=sorted(STRATEGIES))
+    parser.add_argument("--storage", nargs="+", default=["memory://", "sqlite"])
+    args = parser.parse_args()
+
+    cap = args.clients * LIMIT.amount
+    print(f"{args.strategy}, limit {LIMIT}, {args.clients} clients (max accepted {cap})\n")
+    print(f"{'storage':<10} | {'workers':>7} | {'p50 (us)':>9} | {'p95 (us)':>9} | {'hits/s':>9} | {'accepted':>8}")
+    print("-" * 68)
+    for storage in args.storage:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as tmp:
+                # ملف جديد لكل تشغيل حتى لا تتراكم العدادات بين القياسات
+                uri = f"sqlite:///{tmp}/limits.db" if storage == "sqlite" else storage
+                latencies, accepted, elapsed = run(uri, args.strategy, workers, args.requests, args.clients)
+            print(
+                f"{storage.split(':')[0]:<10} | {workers:>7} | {percentile(latencies, 0.5):>9.1f} | "
+                f"{percentile(latencies, 0.95):>9.1f} | {len(latencies) / elapsed:>9.0f} | {accepted:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
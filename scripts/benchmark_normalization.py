@@ -0,0 +1,76 @@
+"""
+قياس سرعة تطبيع النص العربي (chars/sec): التنفيذ القديم (ست عمليات re.sub)
+مقابل التنفيذ أحادي التمرير في app/services/arabic_text.py.
+
+التشغيل (من جذر المشروع):
+    python scripts/benchmark_normalization.py
+    python scripts/benchmark_normalization.py --repeat 2000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.arabic_text import analyze, analyze_query, normalize_arabic  # noqa: E402
+
+FILES = ["company_policy.txt", "hr_policy.txt"]
+
+
+def legacy_normalize(text: str) -> str:
+    """نسخة مطابقة لـ MockSearchService._normalize_arabic قبل إعادة الكتابة."""
+    if not text:
+        return ""
+    text = re.sub(r'[ً-ٟ]', '', text)
+    text = re.sub(r'[أإآ]', 'ا', text)
+    text = re.sub(r'ة', 'ه', text)
+    text = re.sub(r'ى', 'ي', text)
+    text = re.sub(r'[^ء-ي0-9 ]+', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def chars_per_sec(fn, lines: list, repeat: int) -> float:
+    total_chars = sum(len(line) for line in lines) * repeat
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            fn(line)
+    return total_chars / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arabic normalization micro-benchmark")
+    parser.add_argument("--repeat", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'file':<20} | {'legacy (chars/s)':>17} | {'single-pass (chars/s)':>21} | {'speedup':>7}")
+    print("-" * 76)
+    for path in FILES:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = [line for line in f.read().splitlines() if line.strip()]
+
+        assert all(legacy_normalize(line) == normalize_arabic(line) for line in lines)
+
+        before = chars_per_sec(legacy_normalize, lines, args.repeat)
+        after = chars_per_sec(normalize_arabic, lines, args.repeat)
+        print(f"{path:<20} | {before:>17,.0f} | {after:>21,.0f} | {after / before:>6.1f}x")
+
+    # مسار الاستعلام: تطبيع + تحليل بدون تخزين مؤقت مقابل analyze_query المخزّن
+    query = "ما هي سياسات العمل؟"
+    n = args.repeat * 20
+    t0 = time.perf_counter()
+    for _ in range(n):
+        analyze(normalize_arabic(query))
+    uncached = (time.perf_counter() - t0) / n * 1e6
+    t0 = time.perf_counter()
+    for _ in range(n):
+        analyze_query(query)
+    cached = (time.perf_counter() - t0) / n * 1e6
+    print(f"\nrepeated query: uncached {uncached:.2f} µs/query, memoized {cached:.2f} µs/query")
+
+
+if __name__ == "__main__":
+    main()
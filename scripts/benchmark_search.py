@@ -0,0 +1,113 @@
+"""
+مقارنة أداء محركات البحث In-Memory على قواعد معرفة اصطناعية بأحجام مختلفة.
+
+التشغيل (من جذر المشروع):
+    python scripts/benchmark_search.py
+    python scripts/benchmark_search.py --sizes 1000 10000 --queries 200
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from statistics import mean
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.search_service import MockSearchService  # noqa: E402
+from app.services.index_search_service import InvertedIndexSearchService  # noqa: E402
+from app.services.matrix_search_service import SparseMatrixSearchService  # noqa: E402
+
+BACKENDS = {
+    "mock": MockSearchService,
+    "index": InvertedIndexSearchService,
+    "matrix": SparseMatrixSearchService,
+}
+
+SEED_FILES = ["company_policy.txt", "hr_policy.txt"]
+ARABIC_LETTERS = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+
+QUERIES = [
+    "ما هي سياسات العمل؟",
+    "كم عدد أيام الإجازة السنوية؟",
+    "هل العمل عن بعد مسموح؟",
+    "ما هي ساعات العمل الرسمية؟",
+    "هل يوجد تأمين صحي؟",
+]
+
+
+def build_vocabulary(size: int, rng: random.Random) -> list:
+    """كلمات ملفات السياسات + كلمات عربية اصطناعية حتى الحجم المطلوب."""
+    words = []
+    for path in SEED_FILES:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                words.extend(f.read().split())
+    while len(words) < size:
+        length = rng.randint(3, 8)
+        words.append("".join(rng.choice(ARABIC_LETTERS) for _ in range(length)))
+    return words
+
+
+def build_corpus(n_chunks: int, words_per_chunk: int = 60, seed: int = 42) -> list:
+    """توليد chunks بتوزيع Zipf تقريبي للكلمات (كلمات قليلة شائعة وذيل طويل)."""
+    rng = random.Random(seed)
+    vocab = build_vocabulary(20000, rng)
+    weights = [1.0 / (rank + 1) for rank in range(len(vocab))]
+    return [
+        " ".join(rng.choices(vocab, weights=weights, k=words_per_chunk))
+        for _ in range(n_chunks)
+    ]
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def bench_backend(name: str, corpus: list, n_queries: int, top_k: int) -> dict:
+    service = BACKENDS[name]()
+
+    t0 = time.perf_counter()
+    service.add_documents("bench", corpus)
+    ingest_s = time.perf_counter() - t0
+
+    latencies = []
+    for i in range(n_queries):
+        query = QUERIES[i % len(QUERIES)]
+        t0 = time.perf_counter()
+        service.search(query, "bench", top_k=top_k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    return {
+        "backend": name,
+        "ingest_s": ingest_s,
+        "avg_ms": mean(latencies),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MRAG search backends benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--words-per-chunk", type=int, default=60)
+    parser.add_argument("--top-k", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'chunks':>8} | {'backend':<8} | {'ingest (s)':>10} | {'avg (ms)':>9} | {'p50 (ms)':>9} | {'p95 (ms)':>9}")
+    print("-" * 70)
+    for size in args.sizes:
+        corpus = build_corpus(size, args.words_per_chunk)
+        for name in args.backends:
+            r = bench_backend(name, corpus, args.queries, args.top_k)
+            print(
+                f"{size:>8} | {r['backend']:<8} | {r['ingest_s']:>10.2f} | "
+                f"{r['avg_ms']:>9.3f} | {r['p50_ms']:>9.3f} | {r['p95_ms']:>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+قياس recall@k وزمن الاستجابة (p50/p95) لبحث IVF التقريبي مقارنةً بالبحث الكامل (exact).
+
+التشغيل (من جذر المشروع):
+    python scripts/benchmark_vector.py
+    python scripts/benchmark_vector.py --chunks 50000 --nprobe 1 4 16 --top-k 5
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmark_search import build_corpus, percentile  # noqa: E402
+from app.services.vector_search_service import HashingEmbedder, VectorSearchService  # noqa: E402
+
+
+def build_queries(corpus: list, n_queries: int, words: int = 6, seed: int = 7) -> list:
+    """استعلامات من مقاطع عشوائية داخل الـ chunks لضمان وجود جيران حقيقيين."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n_queries):
+        tokens = rng.choice(corpus).split()
+        start = rng.randint(0, max(0, len(tokens) - words))
+        queries.append(" ".join(tokens[start:start + words]))
+    return queries
+
+
+def run(service: VectorSearchService, queries: list, top_k: int, **search_kwargs):
+    latencies, results = [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        hits = service.search(query, "bench", top_k=top_k, **search_kwargs)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        results.append([h["text"] for h in hits])
+    return latencies, results
+
+
+def recall_at_k(approx: list, exact: list) -> float:
+    total = sum(len(e) for e in exact)
+    found = sum(len(set(a) & set(e)) for a, e in zip(approx, exact))
+    return found / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MRAG vector search benchmark (exact vs IVF)")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.chunks)
+    queries = build_queries(corpus, args.queries)
+
+    service = VectorSearchService(embedder=HashingEmbedder(dim=args.dim), mode="ivf", min_score=0.0)
+    t0 = time.perf_counter()
+    service.add_documents("bench", corpus)
+    print(f"Indexed {args.chunks} chunks in {time.perf_counter() - t0:.2f}s "
+          f"({len(service.stores['bench'].centroids)} IVF lists)\n")
+
+    exact_lat, exact_res = run(service, queries, args.top_k, mode="exact")
+
+    print(f"{'mode':<12} | {'recall@' + str(args.top_k):>9} | {'p50 (ms)':>9} | {'p95 (ms)':>9}")
+    print("-" * 50)
+    print(f"{'exact':<12} | {1.0:>9.3f} | {percentile(exact_lat, 0.5):>9.3f} | {percentile(exact_lat, 0.95):>9.3f}")
+    for nprobe in args.nprobe:
+        lat, res = run(service, queries, args.top_k, mode="ivf", nprobe=nprobe)
+        print(
+            f"{'ivf/' + str(nprobe):<12} | {recall_at_k(res, exact_res):>9.3f} | "
+            f"{percentile(lat, 0.5):>9.3f} | {percentile(lat, 0.95):>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 import json
+import sys
 import time
 import requests
 from statistics import mean
 
 # إعدادات
 API_URL = "http://127.0.0.1:8000/api/v1/assistant/chat"
+BATCH_API_URL = "http://127.0.0.1:8000/api/v1/assistant/chat/batch"
 API_KEY = "secret-key-123"
 DATASET_PATH = "evaluation/golden_dataset.json"
 REPORT_PATH = "evaluation/PERFORMANCE_REPORT.md"
@@ -53,7 +55,11 @@ def evaluate_case(case):
             "note": "HTTP Error"
         }
 
-    data = response.json()
+    return judge_case(case, response.json(), latency)
+
+
+def judge_case(case, data, latency):
+    """مقارنة رد واحد (ChatResponse) مع الحالة المتوقعة."""
     actual_status = data.get("status")
     answer = data.get("answer", "")
 
@@ -77,6 +83,23 @@ def evaluate_case(case):
     }
 
 
+def evaluate_batch(dataset):
+    """
+    تقييم كل الحالات بطلب واحد إلى /chat/batch (بدون انتظار بين الطلبات).
+    زمن كل حالة هو total_ms الخاص بها من الرد.
+    """
+    payload = {"requests": [{"kb_id": c["kb_id"], "query": c["question"]} for c in dataset]}
+    response = requests.post(BATCH_API_URL, json=payload, headers={"X-API-Key": API_KEY})
+    response.raise_for_status()
+
+    results = []
+    for case, data in zip(dataset, response.json()["results"]):
+        result = judge_case(case, data, data["timings"]["total_ms"])
+        print(f"   Testing: {case['id']}... {'✅' if result['passed'] else '❌'}")
+        results.append(result)
+    return results
+
+
 def generate_report(results, latencies):
     total = len(results)
     passed = sum(r["passed"] for r in results)
@@ -122,6 +145,12 @@ def run_evaluation():
 
     print(f"📋 Loaded {len(dataset)} test cases.")
 
+    # python scripts/evaluate_system.py --batch : كل الحالات في طلب واحد
+    if "--batch" in sys.argv:
+        results = evaluate_batch(dataset)
+        generate_report(results, [r["latency"] for r in results if r["latency"]])
+        return
+
     results = []
     latencies = []
 
@@ -1,3 +1,6 @@
+import json
+import time
+
 from fastapi.testclient import TestClient
 from app.main import app
 
@@ -6,6 +9,17 @@ client = TestClient(app)
 # مفتاح صالح (يجب أن يطابق أحد المفاتيح في app/services/security_service.py)
 VALID_HEADERS = {"X-API-Key": "secret-key-123"}
 
+def wait_for_job(upload_response, timeout: float = 10.0) -> dict:
+    """الرفع يعود بـ 202 والفهرسة تتم في الخلفية: ننتظر انتهاء المهمة."""
+    assert upload_response.status_code == 202
+    status_url = upload_response.json()["status_url"]
+    deadline = time.time() + timeout
+    job = client.get(status_url).json()
+    while job["status"] in ("queued", "running") and time.time() < deadline:
+        time.sleep(0.02)
+        job = client.get(status_url).json()
+    return job
+
 def test_health_check():
     """Ensure the health check endpoint returns 200."""
     response = client.get("/health")
@@ -13,6 +27,21 @@ def test_health_check():
     data = response.json()
     assert data["status"] == "ok"
     assert "environment" in data
+    assert {"light", "heavy"} <= set(data["executors"])
+    assert "search_memory" in data
+
+def test_metrics_endpoint_exposes_prometheus_text():
+    client.post(
+        "/api/v1/assistant/chat",
+        json={"kb_id": "metrics-kb", "query": "سؤال"},
+        headers=VALID_HEADERS,
+    )
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE mrag_total_requests counter" in response.text
+    assert 'mrag_total_ms_bucket{le="+Inf"}' in response.text
+    assert "mrag_retrieval_ms_count" in response.text
 
 def test_upload_document():
     """Test uploading a text file."""
@@ -21,9 +50,61 @@ def test_upload_document():
         "/api/v1/kb/test-kb/upload",
         files={"file": ("test.txt", file_content, "text/plain")}
     )
-    assert response.status_code == 201
+    assert response.status_code == 202
     data = response.json()
-    assert data["status"] == "success"
+    assert data["status"] == "accepted"
+
+    job = wait_for_job(response)
+    assert job["status"] == "completed"
+    assert job["chunks_indexed"] == 1
+    assert job["bytes_read"] == job["bytes_total"] == len(file_content)
+    assert job["duration_ms"] >= 0
+
+def test_unknown_job_returns_404():
+    response = client.get("/api/v1/kb/jobs/does-not-exist")
+    assert response.status_code == 404
+
+def test_bulk_upload_indexes_once():
+    import io
+    import zipfile
+    from app.core.services import search_service_instance
+
+    kb_id = "bulk-test-kb"
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("a.txt", "سياسة الإجازات السنوية ثلاثون يوما")
+        zf.writestr("b.txt", "ساعات العمل من الثامنة صباحا")
+        zf.writestr("notes.md", "# ignored")
+    version = search_service_instance.get_kb_version(kb_id)
+
+    response = client.post(
+        f"/api/v1/kb/{kb_id}/upload/bulk",
+        files=[
+            ("files", ("c.txt", "سياسة العمل عن بعد يومان".encode("utf-8"), "text/plain")),
+            ("files", ("docs.zip", archive.getvalue(), "application/zip")),
+        ],
+    )
+    job = wait_for_job(response)
+    assert job["status"] == "completed"
+    assert [(f["filename"], f["chunks"]) for f in job["files"]] == [
+        ("c.txt", 1), ("docs.zip/a.txt", 1), ("docs.zip/b.txt", 1), ("docs.zip/notes.md", 0)
+    ]
+    assert job["files"][-1]["error"] == "Only .txt files are supported."
+    assert job["chunks_indexed"] == 3
+    assert job["bytes_read"] == job["bytes_total"]
+    assert job["mb_per_s"] > 0 and job["chunks_per_s"] > 0
+    # فهرسة واحدة لكل المستندات: الإصدار يزيد مرة واحدة فقط
+    assert search_service_instance.get_kb_version(kb_id) == version + 1
+
+    results = client.get(f"/api/v1/kb/{kb_id}/search?query=ساعات العمل").json()["results"]
+    assert "الثامنة" in results[0]["text"]
+
+def test_bulk_upload_rejects_unsupported_files():
+    response = client.post(
+        "/api/v1/kb/bulk-test-kb/upload/bulk",
+        files=[("files", ("report.pdf", b"%PDF", "application/pdf"))],
+    )
+    assert response.status_code == 400
 
 def test_search_functionality():
     """Upload and verify search."""
@@ -31,10 +112,10 @@ def test_search_functionality():
     content = b"The secret code is 998877."
     
     # Upload
-    client.post(
+    wait_for_job(client.post(
         f"/api/v1/kb/{kb_id}/upload",
         files={"file": ("secret.txt", content, "text/plain")}
-    )
+    ))
     
     # Search (قد لا يتطلب مفتاحًا حسب تنفيذنا الحالي لنقطة البحث، لكن الدردشة تتطلب)
     response = client.get(f"/api/v1/kb/{kb_id}/search?query=secret")
@@ -48,10 +129,10 @@ def test_guardrail_rejection():
     kb_id = "guardrail-test"
     
     # 1. Upload irrelevant content
-    client.post(
+    wait_for_job(client.post(
         f"/api/v1/kb/{kb_id}/upload", 
         files={"file": ("doc.txt", b"Apples are red.", "text/plain")}
-    )
+    ))
     
     # 2. Ask unrelated question WITH AUTH HEADERS
     response = client.post(
@@ -75,10 +156,10 @@ def test_chat_success_flow():
     content = b"The policy for remote work allows 2 days per week."
     
     # Upload
-    client.post(
+    wait_for_job(client.post(
         f"/api/v1/kb/{kb_id}/upload",
         files={"file": ("policy.txt", content, "text/plain")}
-    )
+    ))
     
     # Chat WITH AUTH HEADERS
     response = client.post(
@@ -97,4 +178,272 @@ def test_chat_success_flow():
     assert "timings" in data
     assert data["timings"]["total_ms"] > 0
 
-    
\ No newline at end of file
+def test_chat_answer_cache_hit_and_invalidation():
+    """Repeated questions are served from the answer cache until the KB changes."""
+    kb_id = "answer-cache-test"
+    query = "ما هي سياسة العمل عن بعد؟"
+    wait_for_job(client.post(
+        f"/api/v1/kb/{kb_id}/upload",
+        files={"file": ("policy.txt", "سياسة العمل عن بعد تسمح بيومين في الأسبوع.".encode(), "text/plain")}
+    ))
+
+    def chat():
+        response = client.post(
+            "/api/v1/assistant/chat", json={"kb_id": kb_id, "query": query}, headers=VALID_HEADERS
+        )
+        assert response.status_code == 200
+        assert response.json()["status"] == "success"
+        return response.json()
+
+    assert chat()["timings"]["cached"] is False
+    second = chat()
+    assert second["timings"]["cached"] is True
+    assert second["context_used"]
+
+    # إدخال جديد في نفس الـ KB يُبطل الإجابة المخزنة
+    wait_for_job(client.post(
+        f"/api/v1/kb/{kb_id}/upload",
+        files={"file": ("more.txt", "سياسة الإجازات السنوية ثلاثون يوماً.".encode(), "text/plain")}
+    ))
+    assert chat()["timings"]["cached"] is False
+
+
+def test_chat_answer_cache_lookup_runs_off_the_event_loop(monkeypatch):
+    """get_kb_version may wait on the KB lock (storage mode), so the lookup runs on the light executor."""
+    import threading
+    from app.api.endpoints import assistant
+
+    threads = []
+    get_kb_version = assistant.search_service.get_kb_version
+
+    def recording_get_kb_version(kb_id):
+        threads.append(threading.current_thread().name)
+        return get_kb_version(kb_id)
+
+    monkeypatch.setattr(assistant.search_service, "get_kb_version", recording_get_kb_version)
+    client.post("/api/v1/assistant/chat", json={"kb_id": "kb-lookup", "query": "سؤال"}, headers=VALID_HEADERS)
+    client.post(
+        "/api/v1/assistant/chat/batch",
+        json={"requests": [{"kb_id": "kb-lookup", "query": "سؤال"}, {"kb_id": "kb-lookup", "query": "آخر"}]},
+        headers=VALID_HEADERS,
+    )
+    # الدفعة تقرأ إصدار الـ KB مرة واحدة
+    assert len(threads) == 2
+    assert all(name.startswith("mrag-light") for name in threads)
+
+
+def parse_sse(body: str) -> list:
+    """تحويل نص text/event-stream إلى [(event, data), ...]."""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+def test_chat_coalesces_identical_concurrent_requests(monkeypatch):
+    """Concurrent identical questions share one retrieval + LLM call but keep their own request ids."""
+    import asyncio
+    import httpx
+    from app.api.endpoints import assistant
+    from app.core.metrics import metrics
+
+    kb_id = "coalesce-test"
+    wait_for_job(client.post(
+        f"/api/v1/kb/{kb_id}/upload",
+        files={"file": ("policy.txt", "سياسة العمل عن بعد يومان في الأسبوع".encode("utf-8"), "text/plain")}
+    ))
+    calls = []
+
+    async def slow_generate(query, context):
+        calls.append(query)
+        await asyncio.sleep(0.1)
+        return "يومان في الأسبوع."
+
+    monkeypatch.setattr(assistant.llm_service, "generate_answer", slow_generate)
+    before = metrics.value("coalesced_requests")
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+            return await asyncio.gather(*(
+                ac.post(
+                    "/api/v1/assistant/chat",
+                    json={"kb_id": kb_id, "query": query},
+                    headers=VALID_HEADERS,
+                )
+                for query in ["ما هي سياسة العمل عن بعد؟", "ما هي  سياسة العمل عن بعد"] * 3
+            ))
+
+    responses = asyncio.run(burst())
+    assert [r.status_code for r in responses] == [200] * 6
+    assert {r.json()["answer"] for r in responses} == {"يومان في الأسبوع."}
+    assert len(calls) == 1
+    assert metrics.value("coalesced_requests") == before + 5
+    assert sum(r.json()["timings"]["coalesced"] for r in responses) == 5
+    assert len({r.headers["X-Request-ID"] for r in responses}) == 6
+
+def test_debug_traces_correlate_chat_stages_with_request_id():
+    kb_id = "trace-test"
+    wait_for_job(client.post(
+        f"/api/v1/kb/{kb_id}/upload",
+        files={"file": ("policy.txt", "ساعات العمل ثمان ساعات يوميا".encode("utf-8"), "text/plain")}
+    ))
+    response = client.post(
+        "/api/v1/assistant/chat",
+        json={"kb_id": kb_id, "query": "كم ساعات العمل اليومية؟"},
+        headers=VALID_HEADERS,
+    )
+    assert response.status_code == 200
+    request_id = response.headers["X-Request-ID"]
+
+    traces = client.get(
+        "/api/v1/debug/traces?limit=100&name=POST /api/v1/assistant/chat", headers=VALID_HEADERS
+    ).json()["traces"]
+    [chat_trace] = [t for t in traces if t["trace_id"] == request_id]
+    for stage in ("answer_cache.lookup", "retrieval", "search.analyze", "search.score", "guardrail", "llm"):
+        assert stage in chat_trace["stages_ms"]
+    assert client.get("/api/v1/debug/traces").status_code in (401, 403)
+
+def test_chat_stream_sends_context_tokens_and_timings():
+    kb_id = "stream-test"
+    query = "كم عدد أيام الإجازة السنوية؟"
+    wait_for_job(client.post(
+        f"/api/v1/kb/{kb_id}/upload",
+        files={"file": ("leave.txt", "عدد أيام الإجازة السنوية ثلاثون يوماً.".encode(), "text/plain")}
+    ))
+
+    response = client.post(
+        "/api/v1/assistant/chat/stream", json={"kb_id": kb_id, "query": query}, headers=VALID_HEADERS
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = parse_sse(response.text)
+    names = [name for name, _ in events]
+    assert names[0] == "context" and names[-1] == "done"
+    assert names.count("token") > 1
+    assert events[0][1]["context_used"]
+
+    answer = "".join(data["text"] for name, data in events if name == "token")
+    done = events[-1][1]
+    assert done["status"] == "success"
+    assert done["timings"]["first_token_ms"] <= done["timings"]["total_ms"]
+
+    # نفس الإجابة عبر /chat (من الـ Cache هذه المرة)
+    regular = client.post(
+        "/api/v1/assistant/chat", json={"kb_id": kb_id, "query": query}, headers=VALID_HEADERS
+    ).json()
+    assert regular["answer"] == answer
+    assert regular["timings"]["cached"] is True
+
+def test_chat_stream_rejects_low_confidence():
+    response = client.post(
+        "/api/v1/assistant/chat/stream",
+        json={"kb_id": "missing-kb", "query": "سؤال"},
+        headers=VALID_HEADERS
+    )
+    events = parse_sse(response.text)
+    assert [name for name, _ in events] == ["context", "done"]
+    assert events[1][1]["status"] == "rejected"
+
+def test_chat_batch_keeps_order_and_per_item_status():
+    kb_a, kb_b = "batch-kb-a", "batch-kb-b"
+    wait_for_job(client.post(
+        f"/api/v1/kb/{kb_a}/upload",
+        files={"file": ("a.txt", "ساعات العمل الرسمية ثماني ساعات يومياً.".encode(), "text/plain")}
+    ))
+    wait_for_job(client.post(
+        f"/api/v1/kb/{kb_b}/upload",
+        files={"file": ("b.txt", "التأمين الصحي يشمل الموظف والعائلة.".encode(), "text/plain")}
+    ))
+
+    requests_ = [
+        {"kb_id": kb_a, "query": "ما هي ساعات العمل الرسمية؟"},
+        {"kb_id": kb_b, "query": "هل يوجد تأمين صحي؟"},
+        {"kb_id": kb_a, "query": "ما عاصمة المريخ؟"},
+        {"kb_id": kb_a, "query": "ما هي ساعات العمل الرسمية؟"},
+    ]
+    response = client.post(
+        "/api/v1/assistant/chat/batch", json={"requests": requests_}, headers=VALID_HEADERS
+    )
+    assert response.status_code == 200
+    results = response.json()["results"]
+
+    assert [r["status"] for r in results] == ["success", "success", "rejected", "success"]
+    assert "ساعات" in results[0]["answer"] and "تأمين" in results[1]["answer"]
+    assert results[3]["answer"] == results[0]["answer"]
+    assert all(r["timings"]["total_ms"] >= 0 for r in results)
+
+    # نفس الأسئلة مرة ثانية تُخدم من Cache الإجابات
+    again = client.post(
+        "/api/v1/assistant/chat/batch", json={"requests": requests_[:2]}, headers=VALID_HEADERS
+    ).json()["results"]
+    assert [r["timings"]["cached"] for r in again] == [True, True]
+
+def test_chat_batch_rejects_oversized_batch():
+    from app.core.config import settings
+
+    items = [{"kb_id": "kb", "query": "سؤال"}] * (settings.BATCH_CHAT_MAX_ITEMS + 1)
+    response = client.post(
+        "/api/v1/assistant/chat/batch", json={"requests": items}, headers=VALID_HEADERS
+    )
+    assert response.status_code == 400
+
+def test_stream_trace_stays_open_until_last_chunk(monkeypatch):
+    """تتبع /chat/stream يُغلق بعد آخر جزء من الجسم، فيشمل كامل زمن التوليد."""
+    import asyncio
+    from app.api.endpoints import assistant
+
+    kb_id = "stream-trace-test"
+    wait_for_job(client.post(
+        f"/api/v1/kb/{kb_id}/upload",
+        files={"file": ("hours.txt", "ساعات العمل الرسمية ثماني ساعات يومياً.".encode(), "text/plain")}
+    ))
+
+    async def slow_stream(query, context):
+        for token in ("ثماني ", "ساعات ", "يومياً."):
+            await asyncio.sleep(0.05)
+            yield token
+
+    monkeypatch.setattr(assistant.llm_service, "stream_answer", slow_stream)
+    response = client.post(
+        "/api/v1/assistant/chat/stream",
+        json={"kb_id": kb_id, "query": "كم ساعات العمل الرسمية؟"},
+        headers=VALID_HEADERS,
+    )
+    assert response.status_code == 200
+    request_id = response.headers["X-Request-ID"]
+
+    traces = client.get(
+        "/api/v1/debug/traces?limit=100&name=POST /api/v1/assistant/chat/stream", headers=VALID_HEADERS
+    ).json()["traces"]
+    [stream_trace] = [t for t in traces if t["trace_id"] == request_id]
+    assert stream_trace["stages_ms"]["llm.stream"] >= 150
+    assert stream_trace["duration_ms"] >= stream_trace["stages_ms"]["llm.stream"]
+
+def test_chat_stream_stages_and_done_timings_inside_request_trace():
+    kb_id = "stream-done-trace-test"
+    wait_for_job(client.post(
+        f"/api/v1/kb/{kb_id}/upload",
+        files={"file": ("remote.txt", "العمل عن بعد مسموح يومين في الأسبوع.".encode(), "text/plain")}
+    ))
+    response = client.post(
+        "/api/v1/assistant/chat/stream",
+        json={"kb_id": kb_id, "query": "هل العمل عن بعد مسموح؟"},
+        headers=VALID_HEADERS,
+    )
+    done = parse_sse(response.text)[-1]
+    assert done[0] == "done" and done[1]["status"] == "success"
+    timings = done[1]["timings"]
+
+    traces = client.get(
+        "/api/v1/debug/traces?limit=100&name=POST /api/v1/assistant/chat/stream", headers=VALID_HEADERS
+    ).json()["traces"]
+    [stream_trace] = [t for t in traces if t["trace_id"] == response.headers["X-Request-ID"]]
+    for stage in ("retrieval", "guardrail", "llm.stream"):
+        assert stage in stream_trace["stages_ms"]
+    # التوليد وحدث done يقعان داخل التتبع المنتهي
+    [llm_span] = [s for s in stream_trace["spans"] if s["name"] == "llm.stream"]
+    assert llm_span["offset_ms"] + llm_span["duration_ms"] <= stream_trace["duration_ms"]
+    assert timings["total_ms"] <= stream_trace["duration_ms"]
+    assert timings["llm_ms"] >= llm_span["duration_ms"] - 1
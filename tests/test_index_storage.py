@@ -0,0 +1,88 @@
+import os
+
+from app.services.index_search_service import InvertedIndexSearchService
+
+CHUNKS = [
+    "عدد أيام الإجازة السنوية هو 30 يوماً لجميع الموظفين.",
+    "نظام العمل عن بعد مسموح به يومين في الأسبوع بعد موافقة المدير.",
+    "ساعات العمل الرسمية هي 8 ساعات يومياً من الأحد للخميس.",
+    "يوجد تأمين صحي شامل يغطي الموظف وعائلته.",
+    "تُصرف المكافآت السنوية للموظفين في نهاية العام.",
+]
+QUERIES = ["الإجازة السنوية", "العمل عن بعد", "تأمين صحي", "ساعات العمل", "المكافآت للموظفين"]
+
+
+def _assert_same_results(persistent, memory, kb_id="kb"):
+    for query in QUERIES:
+        got = persistent.search(query, kb_id, top_k=5)
+        want = memory.search(query, kb_id, top_k=5)
+        assert [r["text"] for r in got] == [r["text"] for r in want]
+        for g, w in zip(got, want):
+            assert abs(g["score"] - w["score"]) < 1e-3
+
+
+def test_persistent_index_survives_restart(tmp_path):
+    storage_dir = str(tmp_path / "indexes")
+    memory = InvertedIndexSearchService()
+
+    service = InvertedIndexSearchService(storage_dir=storage_dir)
+    for batch in (CHUNKS[:2], CHUNKS[2:4], CHUNKS[4:]):
+        service.add_documents("kb", batch)
+        memory.add_documents("kb", batch)
+    _assert_same_results(service, memory)
+
+    # "إعادة تشغيل": نسخة جديدة تفتح الملفات عبر mmap دون إعادة فهرسة
+    restarted = InvertedIndexSearchService(storage_dir=storage_dir)
+    assert "kb" in restarted.indexes
+    _assert_same_results(restarted, memory)
+
+    # ملفات الأجيال القديمة تُحذف بعد كل commit
+    kb_dir = service.storage.kb_path("kb")
+    assert not any(name.startswith("postings-1.") for name in os.listdir(kb_dir))
+
+
+def test_other_worker_sees_new_commits(tmp_path):
+    storage_dir = str(tmp_path / "indexes")
+    writer = InvertedIndexSearchService(storage_dir=storage_dir)
+    reader = InvertedIndexSearchService(storage_dir=storage_dir, reload_interval=0.0)
+
+    assert reader.search("تأمين صحي", "kb/اختبار") == []
+    writer.add_documents("kb/اختبار", CHUNKS)
+    assert "تأمين" in reader.search("تأمين صحي", "kb/اختبار")[0]["text"]
+
+
+def test_uncommitted_tail_is_discarded(tmp_path):
+    storage_dir = str(tmp_path / "indexes")
+    service = InvertedIndexSearchService(storage_dir=storage_dir)
+    memory = InvertedIndexSearchService()
+    service.add_documents("kb", CHUNKS[:3])
+    memory.add_documents("kb", CHUNKS[:3])
+
+    # محاكاة كتابة منقطعة بعد آخر commit
+    with open(os.path.join(service.storage.kb_path("kb"), "chunks.seg"), "ab") as f:
+        f.write("بيانات غير معتمدة".encode("utf-8"))
+
+    service.add_documents("kb", CHUNKS[3:])
+    memory.add_documents("kb", CHUNKS[3:])
+    _assert_same_results(InvertedIndexSearchService(storage_dir=storage_dir), memory)
+
+
+def test_file_job_commits_storage_index_once(tmp_path):
+    from app.services.ingestion_jobs import IngestionJobQueue
+    from app.services.ingestion_service import IngestionService
+
+    service = InvertedIndexSearchService(storage_dir=str(tmp_path / "indexes"))
+    ingestion = IngestionService()
+    ingestion.chunk_size, ingestion.chunk_overlap, ingestion.batch_size = 8, 0, 2
+    path = tmp_path / "upload.txt"
+    path.write_text("\n\n".join(CHUNKS * 4), encoding="utf-8")
+
+    jobs = IngestionJobQueue(ingestion, service, workers=1)
+    job = jobs.submit("kb", str(path), "upload.txt", path.stat().st_size)
+    jobs.shutdown(timeout=10.0)
+
+    # عدة دفعات من iter_file_chunks، لكن commit واحد (جيل واحد) للمهمة كلها
+    assert job.status == "completed", job.error
+    assert job.chunks_indexed > ingestion.batch_size
+    assert service.get_kb_version("kb") == 1
+    assert "تأمين" in service.search("تأمين صحي", "kb")[0]["text"]
@@ -1,5 +1,10 @@
+import asyncio
+import io
+
 import pytest
-from app.services.ingestion_service import IngestionService
+from fastapi import UploadFile
+
+from app.services.ingestion_service import FileTooLargeError, IngestionService
 
 def test_pii_redaction():
     service = IngestionService()
@@ -20,4 +25,126 @@ def test_chunking():
     # Check overlap logic roughly
     assert len(chunks[0].split()) == 500
 
-    
\ No newline at end of file
+    
+def _stream(service, data: bytes):
+    return list(service.iter_file_chunks(io.BytesIO(data)))
+
+def test_streaming_matches_batch_chunking():
+    service = IngestionService()
+    # كتل صغيرة جداً لتقسيم الحروف العربية متعددة البايتات والـ PII عبر حدود الكتل
+    service.block_size = 7
+    service.batch_size = 3
+    text = " ".join(
+        f"سياسة العمل رقم {i} contact{i}@example.com هاتف 555-123-{i % 10000:04d}\n"
+        for i in range(400)
+    )
+    batches = _stream(service, text.encode("utf-8"))
+
+    expected = service._create_chunks(service._clean_pii(text))
+    assert [chunk for batch in batches for chunk in batch] == expected
+    assert all(len(batch) <= 3 for batch in batches)
+    assert "[EMAIL_REDACTED]" in expected[0] and "[PHONE_REDACTED]" in expected[0]
+
+def test_spool_upload_enforces_max_bytes(tmp_path):
+    service = IngestionService()
+    service.block_size = 16
+
+    async def spool():
+        upload = UploadFile(file=io.BytesIO(b"word " * 100))
+        return await service.spool_upload(upload, max_bytes=64, directory=str(tmp_path))
+
+    with pytest.raises(FileTooLargeError):
+        asyncio.run(spool())
+    # الملف الجزئي يُحذف
+    assert list(tmp_path.iterdir()) == []
+
+def test_streaming_offloads_cleaning_to_executor():
+    from app.core.executors import heavy_executor
+
+    service = IngestionService()
+    service.block_size = 1024
+    text = "Contact me at test@example.com or 123-456-7890. " * 200
+    before = heavy_executor.stats()["completed"]
+
+    batches = service.iter_file_chunks(io.BytesIO(text.encode("utf-8")), executor=heavy_executor)
+    chunks = [chunk for batch in batches for chunk in batch]
+    assert chunks == service._create_chunks(service._clean_pii(text))
+    assert heavy_executor.stats()["completed"] > before
+    assert heavy_executor.stats()["in_flight"] == 0
+
+def test_bulk_documents_from_archives(tmp_path):
+    import tarfile
+    import zipfile
+    from app.core.executors import heavy_executor
+
+    service = IngestionService()
+    text = "سياسة الإجازات test@example.com " * 700
+    archive = tmp_path / "docs.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("a.txt", text)
+        zf.writestr("nested/b.txt", "نص قصير")
+        zf.writestr("image.png", b"\x89PNG")
+        zf.writestr("big.txt", "x" * 200)
+    tar = tmp_path / "docs.tar.gz"
+    with tarfile.open(tar, "w:gz") as tf:
+        tf.add(archive.parent / "docs.zip", arcname="skipped.zip")
+        member = tmp_path / "c.txt"
+        member.write_bytes(b"\xff\xfe invalid")
+        tf.add(member, arcname="c.txt")
+
+    documents = [
+        *service.iter_documents(str(archive), "docs.zip", max_bytes=100_000),
+        *service.iter_documents(str(tar), "docs.tar.gz", max_bytes=100),
+    ]
+    results = list(service.iter_document_chunks(documents, executor=heavy_executor))
+
+    by_name = {name: (size, chunks, error) for name, size, chunks, error in results}
+    assert [r[0] for r in results] == [d[0] for d in documents]
+    assert by_name["docs.zip/a.txt"][1] == service._create_chunks(service._clean_pii(text))
+    assert by_name["docs.zip/nested/b.txt"] == (len("نص قصير".encode("utf-8")), ["نص قصير"], None)
+    assert by_name["docs.zip/image.png"][2] == "Only .txt files are supported."
+    assert by_name["docs.tar.gz/skipped.zip"][2] == "Only .txt files are supported."
+    assert by_name["docs.tar.gz/c.txt"][2] == "File is not valid UTF-8 text."
+    assert by_name["docs.zip/big.txt"][2] is None
+
+
+def test_corrupt_archive_members_are_reported_per_file(tmp_path):
+    import tarfile
+    import zipfile
+    from app.services.ingestion_jobs import IngestionJob, IngestionJobQueue
+    from app.services.search_service import MockSearchService
+
+    service = IngestionService()
+    archive = tmp_path / "docs.zip"
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("bad.txt", "سياسة الإجازات " * 500)
+        zf.writestr("good.txt", "نص سليم")
+    # إفساد البيانات المضغوطة للعضو الأول (بعد ترويسته المحلية)
+    data = bytearray(archive.read_bytes())
+    with zipfile.ZipFile(archive) as zf:
+        info = zf.getinfo("bad.txt")
+    start = info.header_offset + 30 + len(info.filename.encode()) + len(info.extra)
+    data[start:start + 40] = b"\xff" * 40
+    archive.write_bytes(bytes(data))
+
+    documents = {name: (payload, error) for name, payload, error in service.iter_documents(str(archive), "docs.zip")}
+    assert documents["docs.zip/bad.txt"][0] is None
+    assert documents["docs.zip/bad.txt"][1].startswith("Corrupt archive member:")
+    assert documents["docs.zip/good.txt"] == ("نص سليم".encode("utf-8"), None)
+
+    # أرشيف tar.gz مقطوع: يفشل الأرشيف وحده وتكمل المهمة بباقي الملفات
+    tar = tmp_path / "docs.tar.gz"
+    with tarfile.open(tar, "w:gz") as tf:
+        member = tmp_path / "c.txt"
+        member.write_text("نص " * 5000, encoding="utf-8")
+        tf.add(member, arcname="c.txt")
+    tar.write_bytes(tar.read_bytes()[:-200])
+
+    jobs = IngestionJobQueue(service, MockSearchService())
+    job = IngestionJob("kb", None, None, 0, sources=[(str(tar), "docs.tar.gz"), (str(archive), "docs.zip")])
+    jobs._run_bulk(job)
+    errors = {f["filename"]: f["error"] for f in job.files}
+    assert errors["docs.tar.gz"].startswith("Unreadable archive:")
+    assert errors["docs.zip/bad.txt"].startswith("Corrupt archive member:")
+    assert errors["docs.zip/good.txt"] is None
+    assert job.chunks_indexed == 1
@@ -0,0 +1,86 @@
+import multiprocessing
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from limits import parse
+from limits.storage import MemoryStorage, storage_from_string
+from limits.strategies import SlidingWindowCounterRateLimiter
+from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
+
+from app.core.limiter import get_rate_limit_key
+from app.core.limiter_storage import SQLiteStorage
+
+LIMIT = parse("60/minute")
+
+
+def _hammer(uri: str, attempts: int, results) -> None:
+    limiter = SlidingWindowCounterRateLimiter(storage_from_string(uri))
+    results.put(sum(limiter.hit(LIMIT, "client-a") for _ in range(attempts)))
+
+
+def test_sqlite_storage_basic_counters(tmp_path):
+    storage = storage_from_string(f"sqlite:///{tmp_path}/limits.db")
+    assert isinstance(storage, SQLiteStorage)
+    assert storage.check()
+
+    assert storage.incr("k", 60) == 1
+    assert storage.incr("k", 60, amount=2) == 3
+    assert storage.get("k") == 3
+    assert storage.get_expiry("k") > 0
+    # العداد المنتهي يبدأ من جديد
+    assert storage.incr("short", -1) == 1
+    assert storage.get("short") == 0
+    assert storage.incr("short", 60) == 1
+    storage.clear("k")
+    assert storage.get("k") == 0
+    # العدادات على القرص: نسخة جديدة (عامل آخر أو بعد إعادة التشغيل) تراها
+    assert SQLiteStorage(f"sqlite:///{tmp_path}/limits.db").get("short") == 1
+
+
+def test_sliding_window_is_exact_across_processes(tmp_path):
+    uri = f"sqlite:///{tmp_path}/limits.db"
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    workers = [ctx.Process(target=_hammer, args=(uri, 40, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    accepted = sum(results.get(timeout=30) for _ in workers)
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    # 160 محاولة من 4 عمّال على حد 60/minute: المقبول هو الحد تماماً
+    assert accepted == 60
+    limiter = SlidingWindowCounterRateLimiter(storage_from_string(uri))
+    assert not limiter.hit(LIMIT, "client-a")
+    assert limiter.get_window_stats(LIMIT, "client-a").remaining == 0
+    # البديل المحلي (memory://) يطبّق نفس الواجهة والنتيجة داخل العملية
+    local = SlidingWindowCounterRateLimiter(MemoryStorage())
+    assert sum(local.hit(LIMIT, "client-a") for _ in range(160)) == 60
+
+
+def _worker_app(uri: str) -> TestClient:
+    limiter = Limiter(key_func=get_rate_limit_key, strategy="sliding-window-counter", storage_uri=uri)
+    app = FastAPI()
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+    @app.get("/chat")
+    @limiter.limit("3/minute")
+    def chat(request: Request):
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_limit_is_shared_between_workers(tmp_path):
+    # عاملان (كل منهما Limiter خاص) على نفس ملف SQLite
+    uri = f"sqlite:///{tmp_path}/limits.db"
+    workers = [_worker_app(uri), _worker_app(uri)]
+    headers = {"X-API-Key": "secret-key-123"}
+
+    codes = [workers[i % 2].get("/chat", headers=headers).status_code for i in range(5)]
+    assert codes == [200, 200, 200, 429, 429]
+    # مفتاح آخر له حده المستقل
+    assert workers[0].get("/chat", headers={"X-API-Key": "client-a-key"}).status_code == 200
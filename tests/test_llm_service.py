@@ -0,0 +1,143 @@
+import asyncio
+import json
+
+import httpx
+
+from app.core.metrics import metrics
+from app.services.llm_service import LLM_ERROR_ANSWER, HTTPLLMService
+
+CONTEXT = [{"text": "عدد أيام الإجازة السنوية 30 يوماً."}]
+
+
+def _reply(text: str, usage: bool = True) -> dict:
+    body = {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+    if usage:
+        body["usageMetadata"] = {"promptTokenCount": 12, "candidatesTokenCount": 5}
+    return body
+
+
+def _service(handler, **kwargs) -> HTTPLLMService:
+    kwargs.setdefault("backoff_base", 0.001)
+    return HTTPLLMService(
+        api_key="test-key", base_url="http://llm.test/v1beta", transport=httpx.MockTransport(handler), **kwargs
+    )
+
+
+def test_generate_answer_records_token_usage():
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request)
+        return httpx.Response(200, json=_reply("  الإجازة 30 يوماً.  "))
+
+    before_in = metrics.value("total_input_tokens")
+    before_out = metrics.value("total_output_tokens")
+    answer = asyncio.run(_service(handler).generate_answer("كم يوم إجازة؟", CONTEXT))
+
+    assert answer == "الإجازة 30 يوماً."
+    assert seen[0].url.path == "/v1beta/models/gemini-1.5-flash:generateContent"
+    assert seen[0].headers["x-goog-api-key"] == "test-key"
+    assert "30 يوماً" in json.loads(seen[0].content)["contents"][0]["parts"][0]["text"]
+    assert metrics.value("total_input_tokens") == before_in + 12
+    assert metrics.value("total_output_tokens") == before_out + 5
+
+
+def test_retries_transient_errors_then_gives_up():
+    calls = {"n": 0}
+
+    def flaky(request: httpx.Request) -> httpx.Response:
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise httpx.ConnectError("connection refused", request=request)
+        if calls["n"] == 2:
+            return httpx.Response(503)
+        return httpx.Response(200, json=_reply("ok"))
+
+    assert asyncio.run(_service(flaky, max_retries=3).generate_answer("q", CONTEXT)) == "ok"
+    assert calls["n"] == 3
+
+    always_down = _service(lambda request: httpx.Response(503), max_retries=2)
+    assert asyncio.run(always_down.generate_answer("q", CONTEXT)) == LLM_ERROR_ANSWER
+
+    # أخطاء غير مؤقتة لا يُعاد إرسالها
+    calls["n"] = 0
+
+    def bad_request(request: httpx.Request) -> httpx.Response:
+        calls["n"] += 1
+        return httpx.Response(400)
+
+    assert asyncio.run(_service(bad_request).generate_answer("q", CONTEXT)) == LLM_ERROR_ANSWER
+    assert calls["n"] == 1
+
+
+def test_semaphore_caps_in_flight_generations():
+    state = {"in_flight": 0, "peak": 0}
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        await asyncio.sleep(0.01)
+        state["in_flight"] -= 1
+        return httpx.Response(200, json=_reply("ok"))
+
+    service = _service(handler, max_concurrency=2)
+
+    async def run():
+        return await asyncio.gather(*(service.generate_answer(f"q{i}", CONTEXT) for i in range(8)))
+
+    assert asyncio.run(run()) == ["ok"] * 8
+    assert state["peak"] == 2
+
+
+def test_stream_answer_yields_provider_chunks():
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert request.url.path.endswith(":streamGenerateContent")
+        assert request.url.params["alt"] == "sse"
+        events = [_reply("الإجازة ", usage=False), _reply("30 يوماً.")]
+        body = "".join(f"data: {json.dumps(e, ensure_ascii=False)}\r\n\r\n" for e in events)
+        return httpx.Response(200, content=body.encode("utf-8"), headers={"Content-Type": "text/event-stream"})
+
+    async def collect():
+        return [token async for token in _service(handler).stream_answer("q", CONTEXT)]
+
+    assert asyncio.run(collect()) == ["الإجازة ", "30 يوماً."]
+
+
+def test_stream_consumer_does_not_hold_the_semaphore():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith(":generateContent"):
+            return httpx.Response(200, json=_reply("ok"))
+        events = [_reply("الإجازة ", usage=False), _reply("30 يوماً.")]
+        body = "".join(f"data: {json.dumps(e, ensure_ascii=False)}\r\n\r\n" for e in events)
+        return httpx.Response(200, content=body.encode("utf-8"), headers={"Content-Type": "text/event-stream"})
+
+    service = _service(handler, max_concurrency=1)
+
+    async def run():
+        stream = service.stream_answer("q", CONTEXT)
+        first = await stream.__anext__()
+        # المستهلك متوقف بعد أول جزء، والتوليد التالي لا ينتظر الـ Semaphore
+        answer = await asyncio.wait_for(service.generate_answer("q", CONTEXT), timeout=1.0)
+        rest = [token async for token in stream]
+        return first, answer, rest
+
+    assert asyncio.run(run()) == ("الإجازة ", "ok", ["30 يوماً."])
+
+
+def test_client_of_previous_loop_is_closed_on_that_loop():
+    service = _service(lambda request: httpx.Response(200, json=_reply("ok")))
+    first_loop, second_loop = asyncio.new_event_loop(), asyncio.new_event_loop()
+    try:
+        assert first_loop.run_until_complete(service.generate_answer("q", CONTEXT)) == "ok"
+        old_client = service._client
+        assert second_loop.run_until_complete(service.generate_answer("q", CONTEXT)) == "ok"
+        assert service._client is not old_client
+
+        # الإغلاق مُجدول على الحلقة القديمة ويتم عند تشغيلها التالي
+        first_loop.run_until_complete(asyncio.sleep(0.01))
+        assert old_client.is_closed
+        assert not service._client.is_closed
+        second_loop.run_until_complete(service.aclose())
+    finally:
+        first_loop.close()
+        second_loop.close()
@@ -0,0 +1,87 @@
+import multiprocessing
+import threading
+
+from app.core.metrics import MetricsRegistry
+
+HISTOGRAMS = {"total_ms": (10, 100)}
+
+
+def _registry(directory=None) -> MetricsRegistry:
+    return MetricsRegistry(["requests", "tokens"], HISTOGRAMS, directory=directory)
+
+
+def _worker(directory: str) -> None:
+    registry = _registry(directory)
+    registry.inc("requests", 3)
+    registry.observe("total_ms", 50)
+
+
+def test_counters_are_exact_across_threads():
+    registry = _registry()
+
+    def work():
+        for _ in range(10_000):
+            registry.inc("requests")
+            registry.inc("tokens", 2)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert registry.counters() == {"requests": 40_000, "tokens": 80_000}
+    # شرائح الـ threads المنتهية يعاد استخدامها بدلاً من إنشاء شرائح جديدة
+    threads = [threading.Thread(target=registry.inc, args=("requests",)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+        thread.join()
+    assert registry.value("requests") == 40_003
+    assert len(registry._shards) <= 5
+
+
+def test_histogram_prometheus_exposition():
+    registry = _registry()
+    for value in (5, 50, 50, 500):
+        registry.observe("total_ms", value)
+    registry.inc("requests", 4)
+
+    text = registry.render_prometheus()
+    assert "# TYPE mrag_requests counter\nmrag_requests_total 4\n" in text
+    assert "# TYPE mrag_total_ms histogram" in text
+    assert 'mrag_total_ms_bucket{le="10"} 1\n' in text
+    assert 'mrag_total_ms_bucket{le="100"} 3\n' in text
+    assert 'mrag_total_ms_bucket{le="+Inf"} 4\n' in text
+    assert "mrag_total_ms_sum 605\n" in text
+    assert "mrag_total_ms_count 4\n" in text
+
+
+def test_directory_mode_aggregates_worker_processes(tmp_path):
+    registry = _registry(str(tmp_path))
+    registry.inc("requests")
+
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_worker, args=(str(tmp_path),)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    assert registry.value("requests") == 7
+    assert 'mrag_total_ms_bucket{le="100"} 2\n' in registry.render_prometheus()
+    # بنية مختلفة (نسخة أخرى من الكود) لا تُجمع مع هذه
+    other = MetricsRegistry(["requests"], {}, directory=str(tmp_path))
+    assert other.value("requests") == 0
+
+
+def test_reused_pid_keeps_dead_worker_counters(tmp_path):
+    # عامل منتهٍ ثم عامل جديد بنفس الـ pid (نفس أسماء الملفات): لا تُصفّر العدادات
+    dead = _registry(str(tmp_path))
+    dead.inc("requests", 3)
+    dead.observe("total_ms", 50)
+
+    restarted = _registry(str(tmp_path))
+    restarted.inc("requests")
+    assert restarted.value("requests") == 4
+    assert 'mrag_total_ms_count 1\n' in restarted.render_prometheus()
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.profiler import ProfileBusyError, ProfileStore, ProfilingMiddleware, profile_store
+from app.main import app
+
+ADMIN_HEADERS = {"X-API-Key": "admin-key-xyz"}
+USER_HEADERS = {"X-API-Key": "secret-key-123"}
+
+
+@pytest.fixture
+def profiling_enabled(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profile_store, "directory", str(tmp_path))
+
+
+def test_header_profiles_admin_requests_only(tmp_path):
+    store = ProfileStore(str(tmp_path), max_stored=2)
+    client = TestClient(ProfilingMiddleware(app, store))
+
+    # بدون الترويسة، أو بمفتاح غير مشرف: لا Profiling
+    assert "X-Profile-ID" not in client.get("/health", headers=ADMIN_HEADERS).headers
+    assert "X-Profile-ID" not in client.get("/health", headers={**USER_HEADERS, "X-Profile": "1"}).headers
+    assert store.list() == []
+
+    ids = [
+        client.get("/health", headers={**ADMIN_HEADERS, "X-Profile": "1"}).headers["X-Profile-ID"]
+        for _ in range(3)
+    ]
+    # تُحفظ آخر max_stored نتيجة فقط (والملفات القديمة تُحذف)
+    assert [p["profile_id"] for p in store.list()] == ids[:0:-1]
+    assert store.get(ids[0]) is None
+    assert len(list(tmp_path.iterdir())) == 2
+    record = store.get(ids[-1])
+    assert record.status == "completed"
+    assert (record.kind, record.details["path"]) == ("request", "/health")
+
+
+def test_failed_request_profile_start_releases_the_slot(tmp_path):
+    # المجلد مسار ملف موجود: إنشاء السجل يفشل بـ OSError
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    store = ProfileStore(str(blocker))
+    assert store.start_request("GET", "/health") is None
+
+    store.directory = str(tmp_path / "profiles")
+    started = store.start_request("GET", "/health")
+    assert started is not None
+    store.finish_request(*started)
+    assert started[0].status == "completed"
+
+
+def test_sampling_session_writes_collapsed_stacks(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    record = store.start_sampling(0.2, interval_ms=5)
+    with pytest.raises(ProfileBusyError):
+        store.start_sampling(0.2)
+    store._sampler.join(5)
+
+    assert record.status == "completed"
+    assert record.details["samples"] > 0
+    lines = open(record.path, encoding="utf-8").read().splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert ";" in stack and int(count) > 0
+    # الـ thread الرئيسي (الذي ينتظر join) يظهر في العينات
+    assert any(line.startswith("MainThread;") for line in lines)
+
+
+def test_profile_endpoints_require_admin_and_flag(profiling_enabled):
+    client = TestClient(app)
+    assert client.get("/api/v1/debug/profiles", headers=USER_HEADERS).status_code == 403
+
+    response = client.post("/api/v1/debug/profiles?seconds=0.1&interval_ms=5", headers=ADMIN_HEADERS)
+    assert response.status_code == 202
+    profile_id = response.json()["profile_id"]
+    assert client.post(
+        f"/api/v1/debug/profiles?seconds={settings.PROFILE_MAX_SECONDS + 1}", headers=ADMIN_HEADERS
+    ).status_code == 400
+
+    deadline = time.time() + 5
+    while client.get(f"/api/v1/debug/profiles/{profile_id}", headers=ADMIN_HEADERS).json()["status"] == "running":
+        assert time.time() < deadline
+        time.sleep(0.02)
+    download = client.get(f"/api/v1/debug/profiles/{profile_id}/download", headers=ADMIN_HEADERS)
+    assert download.status_code == 200
+    assert download.text.strip()
+
+    # نتيجة طلب واحد (pstats) تُعرض كملخص نصي
+    store_client = TestClient(ProfilingMiddleware(app, profile_store))
+    request_id = store_client.get("/health", headers={**ADMIN_HEADERS, "X-Profile": "1"}).headers["X-Profile-ID"]
+    summary = client.get(f"/api/v1/debug/profiles/{request_id}/download?format=text", headers=ADMIN_HEADERS)
+    assert "function calls" in summary.text
+    # cProfile يقيس thread الـ Event Loop (Middleware وما يُنفذ عليه مباشرة)
+    assert "tracing.py" in summary.text
+
+
+def test_profile_endpoints_hidden_when_disabled():
+    assert not settings.PROFILING_ENABLED
+    assert TestClient(app).get("/api/v1/debug/profiles", headers=ADMIN_HEADERS).status_code == 404
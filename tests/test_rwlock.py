@@ -0,0 +1,64 @@
+import threading
+import time
+
+from app.core.rwlock import KeyedRWLock, RWLock
+
+
+def test_readers_share_and_writer_excludes():
+    lock = RWLock()
+    inside = {"readers": 0, "peak": 0}
+    guard = threading.Lock()
+
+    def reader():
+        with lock.read():
+            with guard:
+                inside["readers"] += 1
+                inside["peak"] = max(inside["peak"], inside["readers"])
+            time.sleep(0.05)
+            with guard:
+                inside["readers"] -= 1
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert inside["peak"] > 1
+
+    events = []
+    with lock.write():
+        reader_thread = threading.Thread(target=lambda: lock.read().__enter__() or events.append("read"))
+        reader_thread.start()
+        time.sleep(0.05)
+        assert events == []  # القارئ ينتظر الكاتب
+    reader_thread.join(1)
+    assert events == ["read"]
+
+
+def test_waiting_writer_blocks_new_readers():
+    lock = RWLock()
+    order = []
+    lock.acquire_read()
+
+    writer = threading.Thread(target=lambda: (lock.acquire_write(), order.append("write"), lock.release_write()))
+    writer.start()
+    time.sleep(0.05)
+    # قارئ جديد يصل بعد الكاتب المنتظر: لا يتجاوزه (لا تجويع للإدخال)
+    reader = threading.Thread(target=lambda: (lock.acquire_read(), order.append("read"), lock.release_read()))
+    reader.start()
+    time.sleep(0.05)
+    assert order == []
+
+    lock.release_read()
+    writer.join(1)
+    reader.join(1)
+    assert order == ["write", "read"]
+
+
+def test_keyed_locks_are_independent():
+    locks = KeyedRWLock()
+    assert locks.get("kb-a") is locks.get("kb-a")
+    with locks.write("kb-a"):
+        done = threading.Event()
+        threading.Thread(target=lambda: (locks.write("kb-b").__enter__(), done.set())).start()
+        assert done.wait(1)
@@ -0,0 +1,444 @@
+from app.services.search_service import MockSearchService
+from app.services.index_search_service import InvertedIndexSearchService
+
+POLICY_CHUNKS = [
+    "عدد أيام الإجازة السنوية هو 30 يوماً لجميع الموظفين.",
+    "نظام العمل عن بعد مسموح به يومين في الأسبوع بعد موافقة المدير.",
+    "ساعات العمل الرسمية هي 8 ساعات يومياً من الأحد للخميس.",
+    "يوجد تأمين صحي شامل يغطي الموظف وعائلته.",
+]
+
+
+def test_index_search_matches_mock_top_result():
+    """The inverted index should surface the same best chunk as the linear scan."""
+    mock = MockSearchService()
+    index = InvertedIndexSearchService()
+    mock.add_documents("kb", POLICY_CHUNKS)
+    index.add_documents("kb", POLICY_CHUNKS)
+
+    for query in ["كم عدد أيام الإجازة السنوية؟", "هل يوجد تأمين صحي؟", "ما هي ساعات العمل الرسمية؟"]:
+        expected = mock.search(query, "kb")[0]["text"]
+        results = index.search(query, "kb")
+        assert results[0]["text"] == expected
+        assert set(results[0]) == {"text", "score"}
+        assert results[0]["score"] > 0
+
+
+def test_index_search_incremental_and_isolated():
+    service = InvertedIndexSearchService()
+    service.add_documents("kb-a", POLICY_CHUNKS[:2])
+    assert service.search("تأمين صحي", "kb-a") == []
+
+    service.add_documents("kb-a", POLICY_CHUNKS[2:])
+    assert "تأمين" in service.search("تأمين صحي", "kb-a")[0]["text"]
+    assert service.search("تأمين صحي", "kb-b") == []
+
+
+def test_index_search_strips_prefixes_and_rejects_forbidden_topics():
+    service = InvertedIndexSearchService()
+    service.add_documents("kb", ["السياسات الجديدة للموظفين"])
+
+    assert len(service.search("سياسات", "kb")) == 1
+    assert service.search("من هو مكتشف الجاذبية؟", "kb") == []
+    assert service.search("ما هي", "kb") == []
+
+
+def test_bm25_prefers_rare_terms_and_short_documents():
+    service = InvertedIndexSearchService()
+    service.add_documents("kb", [
+        "العمل العمل العمل العمل المكتب",
+        "العمل الإجازة",
+        "العمل المكتب الاجتماعات الموظفين التقارير الإجازة",
+    ])
+
+    results = service.search("الإجازة العمل", "kb", top_k=2)
+    assert len(results) == 2
+    assert results[0]["text"] == "العمل الإجازة"
+    assert results[0]["score"] >= results[1]["score"] > 0
+
+
+def test_bm25_stats_update_on_ingest():
+    service = InvertedIndexSearchService()
+    service.add_documents("kb", ["تأمين صحي شامل"])
+    first = service.search("تأمين", "kb")[0]["score"]
+
+    service.add_documents("kb", ["تأمين السيارات", "تأمين المنزل"])
+    # الكلمة أصبحت أكثر شيوعاً، فتنخفض قيمة IDF والـ score
+    assert service.search("تأمين", "kb")[0]["score"] < first
+    assert len(service.search("تأمين", "kb", top_k=10)) == 3
+
+
+def test_batched_ingest_defers_bm25_stats_to_next_query():
+    docs = [f"{chunk} رقم {i}" for i in range(20) for chunk in POLICY_CHUNKS]
+    batched = InvertedIndexSearchService()
+    for start in range(0, len(docs), 8):
+        batched.add_documents("kb", docs[start:start + 8])
+    # لا إعادة حساب لكل دفعة: معاملات الطول تُحسب عند أول استعلام
+    assert batched.indexes["kb"]._doc_norms == []
+
+    single = InvertedIndexSearchService()
+    single.add_documents("kb", docs)
+    for query in ("تأمين صحي", "ساعات العمل الرسمية", "الإجازة السنوية"):
+        assert batched.search(query, "kb", 5) == single.search(query, "kb", 5)
+    assert len(batched.indexes["kb"]._doc_norms) == len(docs)
+
+
+def test_matrix_backend_matches_index_ranking():
+    from app.services.matrix_search_service import SparseMatrixSearchService
+
+    index = InvertedIndexSearchService()
+    matrix = SparseMatrixSearchService(batch_size=2)
+    index.add_documents("kb", POLICY_CHUNKS)
+    matrix.add_documents("kb", POLICY_CHUNKS[:3])
+    matrix.add_documents("kb", POLICY_CHUNKS[3:])
+
+    for query in ["ساعات العمل الرسمية", "تأمين صحي", "الإجازة السنوية للموظفين"]:
+        expected = index.search(query, "kb", top_k=2)
+        results = matrix.search(query, "kb", top_k=2)
+        assert [r["text"] for r in results] == [r["text"] for r in expected]
+        for got, want in zip(results, expected):
+            assert abs(got["score"] - want["score"]) < 1e-3
+
+    assert matrix.search("الجاذبية", "kb") == []
+    assert matrix.search("كلمة غير موجودة", "kb") == []
+
+
+def test_vector_search_exact_and_ivf():
+    from app.services.vector_search_service import HashingEmbedder, VectorSearchService
+
+    embedder = HashingEmbedder(dim=128)
+    first, second = embedder.embed(["تأمين صحي شامل"]), embedder.embed(["تأمين صحي شامل"])
+    assert first.dtype.name == "float32"
+    assert (first == second).all()
+
+    service = VectorSearchService(embedder=embedder, mode="ivf", ivf_min_size=4, nprobe=2)
+    service.add_documents("kb", POLICY_CHUNKS * 3)
+    assert service.stores["kb"].centroids is not None
+
+    exact = service.search("هل يوجد تأمين صحي؟", "kb", mode="exact")
+    assert "تأمين" in exact[0]["text"]
+    assert exact[0]["score"] > 0
+
+    full_probe = service.search("هل يوجد تأمين صحي؟", "kb", nprobe=len(service.stores["kb"].centroids))
+    assert [r["text"] for r in full_probe] == [r["text"] for r in exact]
+
+    assert service.search("من هو مكتشف الجاذبية؟", "kb") == []
+    assert service.search("ما هي", "kb") == []
+
+
+def test_hybrid_search_fuses_backends_and_reports_timings():
+    from app.services.hybrid_search_service import HybridSearchService
+    from app.services.vector_search_service import HashingEmbedder, VectorSearchService
+
+    service = HybridSearchService(
+        backends={
+            "keyword": InvertedIndexSearchService(),
+            "vector": VectorSearchService(embedder=HashingEmbedder(dim=128)),
+        }
+    )
+    service.add_documents("kb", POLICY_CHUNKS)
+
+    results, timings = service.search_with_timings("هل يوجد تأمين صحي؟", "kb", top_k=2)
+    assert "تأمين" in results[0]["text"]
+    assert len(results) <= 2
+    assert all(r["score"] > 0 for r in results)
+    assert set(timings) == {"keyword", "vector"}
+
+    # وثيقة تظهر في المحركين تتقدم على وثيقة تظهر في محرك واحد فقط
+    fused = service._fuse({
+        "keyword": [{"text": "a", "score": 3.0}, {"text": "b", "score": 1.0}],
+        "vector": [{"text": "b", "score": 0.9}],
+    })
+    assert fused[0]["text"] == "b"
+
+    assert service.search("من هو مكتشف الجاذبية؟", "kb") == []
+
+
+def test_single_pass_normalizer_matches_legacy_regex_chain():
+    import random
+    import re
+    from app.services.arabic_text import normalize_arabic
+
+    def legacy(text):
+        text = re.sub(r'[ً-ٟ]', '', text)
+        text = re.sub(r'[أإآ]', 'ا', text)
+        text = re.sub(r'ة', 'ه', text)
+        text = re.sub(r'ى', 'ي', text)
+        text = re.sub(r'[^ء-ي0-9 ]+', ' ', text)
+        return re.sub(r'\s+', ' ', text).strip()
+
+    rng = random.Random(0)
+    alphabet = "أإآاةهىيبتَُِّْ ًٌٍـ٠1 9\t\n.,؟!abcمرحباً" + "".join(map(chr, range(0x0600, 0x0700, 7)))
+    samples = POLICY_CHUNKS + ["".join(rng.choices(alphabet, k=40)) for _ in range(500)]
+    for text in samples:
+        assert normalize_arabic(text) == legacy(text)
+
+
+def test_analyze_query_is_memoized():
+    from app.services.arabic_text import analyze_query
+
+    analyze_query.cache_clear()
+    normalized, terms = analyze_query("ما هي سياسات العمل؟")
+    assert normalized == "ما هي سياسات العمل"
+    assert terms == {"سياسات", "عمل"}
+    analyze_query("ما هي سياسات العمل؟")
+    assert analyze_query.cache_info().hits == 1
+
+def test_kb_version_bumps_on_ingest():
+    for service in (MockSearchService(), InvertedIndexSearchService()):
+        assert service.get_kb_version("kb") == 0
+        service.add_documents("kb", ["سياسة العمل"])
+        service.add_documents("kb", ["سياسة الإجازات"])
+        assert service.get_kb_version("kb") == 2
+        assert service.get_kb_version("other") == 0
+
+def test_answer_cache_versions_lru_and_near_duplicates():
+    from app.services.answer_cache import AnswerCache
+
+    cache = AnswerCache(max_entries=2)
+    cache.put("kb", 1, "ما هي سياسة العمل؟", "answer", [])
+    # نفس الاستعلام بعد التطبيع (تشكيل، علامات ترقيم) يصيب الـ Cache
+    assert cache.get("kb", 1, "ما هي سياسَة  العمل") == ("answer", [])
+    # إصدار أحدث للـ KB أو KB أخرى = miss
+    assert cache.get("kb", 2, "ما هي سياسة العمل؟") is None
+    assert cache.get("other", 1, "ما هي سياسة العمل؟") is None
+    # الاستعلامات اللاتينية لا تتصادم
+    cache.put("kb", 1, "remote work", "a1", [])
+    assert cache.get("kb", 1, "vacation days") is None
+    # LRU: إضافة ثالثة تُخرج الأقدم استخداماً
+    cache.get("kb", 1, "ما هي سياسة العمل؟")
+    cache.put("kb", 1, "third", "a3", [])
+    assert cache.get("kb", 1, "remote work") is None
+    assert cache.get("kb", 1, "ما هي سياسة العمل؟") is not None
+
+    near = AnswerCache(near_duplicate=True)
+    near.put("kb", 1, "ما هي سياسة العمل؟", "answer", [])
+    assert near.get("kb", 1, "العمل سياسة") == ("answer", [])
+
+def test_answer_cache_ttl():
+    from app.services.answer_cache import AnswerCache
+
+    cache = AnswerCache(ttl_seconds=0)
+    cache.put("kb", 1, "سؤال", "answer", [])
+    assert cache.get("kb", 1, "سؤال") is None
+
+def test_cached_search_service_hits_until_ingest():
+    from app.services.cached_search_service import CachedSearchService
+
+    inner = InvertedIndexSearchService()
+    calls = []
+    original = inner.search_with_timings
+    inner.search_with_timings = lambda *args: calls.append(args) or original(*args)
+
+    service = CachedSearchService(inner, max_entries=8)
+    service.add_documents("kb", ["سياسة العمل عن بعد يومين"])
+    first = service.search("سياسة العمل", "kb")
+    # نفس الاستعلام بعد التطبيع يُخدم من الـ Cache
+    assert service.search("سياسَة  العمل؟", "kb") == first
+    assert len(calls) == 1
+    # top_k مختلف = مفتاح مختلف
+    service.search("سياسة العمل", "kb", top_k=1)
+    assert len(calls) == 2
+
+    # الإدخال يرفع الإصدار فيُعاد البحث ويظهر المستند الجديد
+    service.add_documents("kb", ["سياسة العمل الإضافي"])
+    assert len(service.search("سياسة العمل", "kb")) == 2
+    assert len(calls) == 3
+
+def test_search_batch_matches_single_searches():
+    from app.services.cached_search_service import CachedSearchService
+    from app.services.hybrid_search_service import HybridSearchService
+    from app.services.matrix_search_service import SparseMatrixSearchService
+    from app.services.vector_search_service import VectorSearchService
+
+    docs = [
+        "سياسة العمل عن بعد تسمح بيومين في الأسبوع",
+        "عدد أيام الإجازة السنوية ثلاثون يوماً",
+        "ساعات العمل الرسمية ثماني ساعات يومياً",
+        "التأمين الصحي يشمل الموظف والعائلة",
+    ]
+    queries = ["العمل عن بعد", "الإجازة السنوية", "العمل عن بعد", "فرنسا", "تأمين صحي", "كلمة غير موجودة"]
+    services = [
+        InvertedIndexSearchService(),
+        SparseMatrixSearchService(),
+        VectorSearchService(),
+        HybridSearchService({"keyword": InvertedIndexSearchService(), "vector": VectorSearchService()}),
+        CachedSearchService(InvertedIndexSearchService()),
+    ]
+    for service in services:
+        service.add_documents("kb", docs)
+        expected = [service.search(q, "kb", 2) for q in queries]
+        assert service.search_batch(queries, "kb", 2) == expected, type(service).__name__
+        assert service.search_batch(queries, "missing", 2) == [[] for _ in queries]
+
+
+def test_ingest_locks_one_kb_and_readers_see_whole_batches():
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.services.matrix_search_service import SparseMatrixSearchService
+    from app.services.vector_search_service import VectorSearchService
+
+    def bonuses(service):
+        return sum("مكافأة" in r["text"] for r in service.search("مكافأة", "kb-a", top_k=1000))
+
+    # min_score=-1: البحث المتجه يعيد كل المستندات فيُعد الظاهر منها فعلاً
+    services = [
+        MockSearchService(),
+        InvertedIndexSearchService(),
+        SparseMatrixSearchService(),
+        VectorSearchService(min_score=-1.0),
+    ]
+    for service in services:
+        name = type(service).__name__
+        service.add_documents("kb-a", POLICY_CHUNKS)
+        service.add_documents("kb-b", POLICY_CHUNKS)
+
+        # إدخال جارٍ في kb-a (قفل الكتابة محجوز) لا يوقف البحث في kb-b
+        with service._locks.write("kb-a"), ThreadPoolExecutor(1) as pool:
+            assert pool.submit(service.search, "تأمين صحي", "kb-b").result(timeout=5), name
+
+        # كل دفعة فيها كلمة "مكافأة" مرتين: البحث يرى الدفعة كاملة أو لا يراها
+        batch = [f"مكافأة نهاية الخدمة رقم {i}" for i in range(2)]
+        stop = threading.Event()
+        counts = []
+
+        def ingest():
+            for _ in range(50):
+                service.add_documents("kb-a", batch)
+            stop.set()
+
+        writer = threading.Thread(target=ingest)
+        writer.start()
+        while not stop.is_set():
+            counts.append(bonuses(service))
+        writer.join()
+        assert all(count % 2 == 0 for count in counts), name
+        assert bonuses(service) == 100, name
+
+
+def test_memory_budget_spills_cold_kbs_and_reloads_on_query(tmp_path):
+    import tracemalloc
+
+    # الحجم التقديري قريب من الذاكرة الفعلية
+    tracemalloc.start()
+    probe = InvertedIndexSearchService()
+    probe.add_documents("kb", [f"{chunk} نسخة {i}" for i in range(200) for chunk in POLICY_CHUNKS])
+    actual = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    estimate = probe.memory_stats()["resident_bytes"]
+    assert 0.5 < estimate / actual < 2, (estimate, actual)
+
+    def chunks(i):
+        return [f"{chunk} رقم {i}" for chunk in POLICY_CHUNKS * 2]
+
+    sizing = InvertedIndexSearchService()
+    sizing.add_documents("kb", chunks(0))
+    one_kb = sizing.memory_stats()["resident_bytes"]
+
+    # ميزانية تتسع لـ KBين ونصف
+    service = InvertedIndexSearchService(memory_budget_bytes=int(one_kb * 2.5), spill_dir=str(tmp_path))
+    expected = {}
+    for i in range(5):
+        service.add_documents(f"kb-{i}", chunks(i))
+        expected[f"kb-{i}"] = service.search("تأمين صحي", f"kb-{i}")
+        assert expected[f"kb-{i}"]
+
+    stats = service.memory_stats()
+    assert stats["resident_kbs"] == 2 and stats["spilled_kbs"] == 3
+    assert stats["resident_bytes"] <= stats["budget_bytes"]
+    assert set(service.indexes) == {"kb-3", "kb-4"}
+
+    # استعلام على KB مُخرجة يعيد تحميلها (بنفس النتائج) ويُخرج الأقدم استعلاماً بدلاً منها
+    service.search("تأمين صحي", "kb-4")
+    assert service.search("تأمين صحي", "kb-0") == expected["kb-0"]
+    assert set(service.indexes) == {"kb-4", "kb-0"}
+    # الإدخال في KB مُخرجة يدمج مع محتواها (الـ scores تتغير مع إحصائيات BM25)
+    service.add_documents("kb-1", ["مكافأة نهاية الخدمة"])
+    assert [r["text"] for r in service.search("تأمين صحي", "kb-1")] == [r["text"] for r in expected["kb-1"]]
+    assert service.search("مكافأة", "kb-1")
+
+    stats = service.memory_stats()
+    assert stats["reloads"] == 2 and stats["spills"] == 5
+    assert stats["reload_ms_max"] > 0
+
+
+def test_chunk_store_counts_interned_words_across_segments(monkeypatch):
+    from app.services import chunk_store
+    from app.services.chunk_store import ChunkStore
+
+    # segments صغيرة حتى تعبر الدفعات حدودها وتُدمج مع آخر segment غير مكتمل
+    monkeypatch.setattr(chunk_store, "SEGMENT_CHUNKS", 3)
+    raws = [f"{chunk} رقم {i}" for i in range(3) for chunk in POLICY_CHUNKS] + ["", "العمل العمل عمل"]
+    tokens = [MockSearchService()._normalize_arabic(raw).split() for raw in raws]
+
+    store = ChunkStore()
+    for start in range(0, len(raws), 5):
+        previous = store
+        store = store.extend(raws[start:start + 5], tokens[start:start + 5])
+        assert len(previous) == start  # اللقطة السابقة لم تتغير
+    assert len(store) == len(raws)
+    assert [store.text(i) for i in range(len(raws))] == raws
+    assert [store.tokens(i) for i in range(len(raws))] == tokens
+    # كل كلمة مميزة مخزنة مرة واحدة في معجم الـ KB
+    assert len(store.vocabulary) == len({word for words in tokens for word in words})
+
+    words = {"العمل", "يوم", "ساعات", "غير موجود"}
+    expected = {}
+    for i, chunk_tokens in enumerate(tokens):
+        score = sum(chunk_tokens.count(word) for word in words)
+        if score:
+            expected[i] = score
+    assert store.count_matches(words) == expected
+    # مطابقة كلمات كاملة: "عمل" لا تطابق "العمل" و "يوم" لا تطابق "يوماً"
+    assert expected[len(raws) - 1] == 2
+    assert store.count_matches({"عمل"}) == {len(raws) - 1: 1}
+    assert store.count_matches({"يوم"}) == {}
+
+    # MockSearchService: score تنازلياً، والتعادل بترتيب الإدخال
+    mock = MockSearchService()
+    for start in range(0, len(raws), 5):
+        mock.add_documents("kb", raws[start:start + 5])
+    ranked = sorted(expected.items(), key=lambda item: -item[1])[:4]
+    assert mock.search("العمل يوم ساعات", "kb", top_k=4) == [
+        {"text": raws[i], "score": score} for i, score in ranked
+    ]
+
+
+def test_chunk_store_falls_back_to_array_segments_past_str_token_ids(monkeypatch):
+    from array import array
+
+    from app.services import chunk_store
+    from app.services.chunk_store import ChunkStore
+
+    # حد صغير بدلاً من sys.maxunicode: الكلمات بعد أول 8 تحوّل الـ segment إلى array('I')
+    monkeypatch.setattr(chunk_store, "SEGMENT_CHUNKS", 3)
+    monkeypatch.setattr(chunk_store, "_MAX_STR_TOKEN_ID", 8)
+    raws = [f"{chunk} رقم {i}" for i in range(3) for chunk in POLICY_CHUNKS]
+    tokens = [MockSearchService()._normalize_arabic(raw).split() for raw in raws]
+
+    store = ChunkStore()
+    for start in range(0, len(raws), 2):
+        store = store.extend(raws[start:start + 2], tokens[start:start + 2])
+    assert len(store.vocabulary) > 8
+    assert isinstance(store.segments[0].tokens, array)
+    assert [store.tokens(i) for i in range(len(raws))] == tokens
+
+    words = {"العمل", "تامين", "رقم", "غير"}
+    expected = {}
+    for i, chunk_tokens in enumerate(tokens):
+        score = sum(chunk_tokens.count(word) for word in words)
+        if score:
+            expected[i] = score
+    assert store.count_matches(words) == expected
+
+    # segment بأرقام صغيرة فقط يبقى str، والكلمات الكبيرة لا تطابقه
+    small = ChunkStore().extend(["عدد أيام"], [["عدد", "ايام"]])
+    assert isinstance(small.segments[0].tokens, str)
+    assert small.count_matches({"ايام"}) == {0: 1}
+
+    # إضافة أرقام كبيرة إلى segment من نوع str تحوّله إلى array('I') بنفس المحتوى
+    mixed = small.extend(raws[:1], tokens[:1])
+    assert len(mixed.segments) == 1 and isinstance(mixed.segments[0].tokens, array)
+    assert [mixed.tokens(i) for i in range(2)] == [["عدد", "ايام"], tokens[0]]
+    assert mixed.count_matches({"ايام", "الموظفين"}) == {0: 1, 1: 2}
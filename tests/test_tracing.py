@@ -0,0 +1,51 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.executors import light_executor
+from app.core.tracing import clear_traces, slowest_traces, span, trace
+
+
+def test_span_without_trace_is_noop():
+    # بدون تتبع نشط: نفس الكائن الفارغ في كل مرة (بدون حجز أو قياس)
+    assert span("a") is span("b")
+    with span("outside"):
+        pass
+
+
+def test_nested_spans_and_thread_propagation():
+    clear_traces()
+    with trace("req-1", "POST /chat") as current:
+        with span("retrieval"):
+            # الـ light executor ينسخ السياق إلى الـ thread
+            light_executor.call(lambda: span("search.score").__enter__().__exit__())
+            with span("search.sort"):
+                pass
+        with span("llm"):
+            pass
+        # thread عادي بدون نسخ السياق لا يُسجل شيئاً
+        with ThreadPoolExecutor(1) as pool:
+            pool.submit(lambda: span("lost").__enter__().__exit__()).result()
+
+    names = {s[0]: s[3] for s in current.spans}
+    assert names == {"retrieval": 0, "search.score": 1, "search.sort": 1, "llm": 0}
+
+    [snapshot] = slowest_traces(1)
+    assert snapshot["trace_id"] == "req-1"
+    assert snapshot["duration_ms"] >= snapshot["stages_ms"]["retrieval"]
+    assert [s["name"] for s in snapshot["spans"]][0] == "retrieval"
+
+
+def test_slowest_traces_ordering_and_span_cap(monkeypatch):
+    from app.core.config import settings
+
+    clear_traces()
+    monkeypatch.setattr(settings, "TRACE_MAX_SPANS", 3)
+    for i, wait in enumerate((0.0, 0.02, 0.01)):
+        with trace(f"t{i}", "job") as current:
+            for _ in range(5):
+                with span("step"):
+                    pass
+            threading.Event().wait(wait)
+
+    assert [t["trace_id"] for t in slowest_traces(2)] == ["t1", "t2"]
+    assert len(current.spans) == 3 and current.dropped == 2